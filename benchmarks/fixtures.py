@@ -0,0 +1,126 @@
+"""
+Generates synthetic input files for the iEchelle benchmarks.
+
+A fixture is a solar-like oscillator observed with a given number of
+frequency bins between 1 and `fmax` uHz:
+
+- `star.fits`: periodogram in the format read by `periodogram_store`
+  (primary HDU, big-endian, frequency in Hz in the first column and power in
+  the second), made of exponential noise on top of l=0, 1, 2 Lorentzian
+  modes following the asymptotic relation, under a Gaussian envelope
+  centred on `numax`.
+- `modes_parameter_selected.pkb`: the modes, in the 14-column PKB format
+  read by `Interactive.read_pkb`.
+- `background.txt`: background parameters (two Harvey profiles and white
+  noise) as read by `functions.calculate_synthetic_spectrum`.
+
+Usage:
+    python benchmarks/fixtures.py OUTPUT_DIRECTORY --bins 1e6 --modes 30
+"""
+import argparse
+import os
+
+import numpy as np
+
+# Offsets of the l=0, 1, 2 modes in units of delta Nu (asymptotic relation)
+MODE_OFFSETS = {0: 0.2, 1: 0.7, 2: 0.08}
+
+
+def mode_table(n_modes, dnu=24.8, numax=800.0):
+    """
+    Returns the modes closest to numax, l=0, 1 and 2 of consecutive orders.
+
+    Args:
+        n_modes (int): Number of modes.
+        dnu (float, optional): Large frequency separation in uHz. Defaults to 24.8.
+        numax (float, optional): Frequency of maximum power in uHz. Defaults to 800.
+
+    Returns:
+        numpy.ndarray: One row per mode with columns n, l and nu (uHz), sorted
+            by frequency.
+    """
+    n_max = int(round(numax/dnu))
+    n_orders = n_modes//3 + 1
+    rows = []
+    for n in range(n_max - n_orders//2 - 1, n_max + n_orders//2 + 2):
+        for l, offset in MODE_OFFSETS.items():
+            rows.append((n, l, dnu*(n + offset)))
+    rows = np.array(sorted(rows, key=lambda row: abs(row[2] - numax))[:n_modes])
+    return rows[np.argsort(rows[:, 2])]
+
+
+def make_fixture(directory, n_bins, n_modes=30, dnu=24.8, numax=800.0, fmax=4000.0,
+                 seed=0, overwrite=False):
+    """
+    Writes the FITS, PKB and background files of a fixture.
+
+    Args:
+        directory (str): Output directory, created if needed.
+        n_bins (int): Number of frequency bins of the periodogram.
+        n_modes (int, optional): Number of modes. Defaults to 30.
+        dnu (float, optional): Large frequency separation in uHz. Defaults to 24.8.
+        numax (float, optional): Frequency of maximum power in uHz. Defaults to 800.
+        fmax (float, optional): Highest frequency in uHz. Defaults to 4000.
+        seed (int, optional): Seed of the noise. Defaults to 0.
+        overwrite (bool, optional): Rewrite the FITS file if it exists.
+            Defaults to False, which keeps it, so that the fixtures of several
+            numbers of modes share one periodogram. The PKB and background
+            files are always written.
+
+    Returns:
+        dict: Paths of the 'fits', 'pkb' and 'background' files.
+    """
+    from astropy.io import fits
+
+    os.makedirs(directory, exist_ok=True)
+    paths = dict(fits=os.path.join(directory, 'star.fits'),
+                 pkb=os.path.join(directory, 'modes_parameter_selected.pkb'),
+                 background=os.path.join(directory, 'background.txt'))
+    modes = mode_table(n_modes, dnu=dnu, numax=numax)
+
+    if overwrite or not os.path.isfile(paths['fits']):
+        freq = np.linspace(1.0, fmax, int(n_bins))
+        width = 0.1
+        height = 50.0*np.exp(-(modes[:, 2] - numax)**2/(2*(0.25*numax)**2))
+        profile = np.ones(freq.size)
+        for nu, h in zip(modes[:, 2], height):
+            # Only evaluate each Lorentzian within 50 widths of its centre
+            lo, hi = np.searchsorted(freq, [nu - 50*width, nu + 50*width])
+            profile[lo:hi] += h/(1 + ((freq[lo:hi] - nu)/width)**2)
+        rng = np.random.default_rng(seed)
+        power = rng.exponential(1.0, freq.size)*profile
+        table = np.column_stack([freq*1e-6, power]).astype('>f8')
+        fits.PrimaryHDU(table).writeto(paths['fits'], overwrite=True)
+
+    pkb = np.zeros((len(modes), 14))
+    pkb[:, 0] = modes[:, 0]     # n
+    pkb[:, 1] = modes[:, 1]     # l
+    pkb[:, 2] = modes[:, 2]     # nu
+    pkb[:, 3] = 0.1             # e_nu
+    pkb[:, 4] = 50.0            # h
+    pkb[:, 6] = 0.1             # w
+    np.savetxt(paths['pkb'], pkb)
+
+    np.savetxt(paths['background'],
+               np.array([[1e3, 0], [500., 0], [4., 0], [100., 0], [1500., 0], [4., 0], [1., 0]]))
+    return paths
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description='Write synthetic iEchelle input files.')
+    parser.add_argument('output', help='Output directory')
+    parser.add_argument('--bins', type=float, default=1e6, help='Number of frequency bins')
+    parser.add_argument('--modes', type=int, default=30, help='Number of modes in the PKB file')
+    parser.add_argument('--dnu', type=float, default=24.8, help='Delta Nu in uHz')
+    parser.add_argument('--numax', type=float, default=800.0, help='numax in uHz')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the noise')
+    args = parser.parse_args(argv)
+    paths = make_fixture(args.output, int(args.bins), n_modes=args.modes, dnu=args.dnu,
+                         numax=args.numax, seed=args.seed, overwrite=True)
+    for name, path in paths.items():
+        print(name, path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""
+Headless benchmarks of the iEchelle hot paths.
+
+The GUI classes (`Environment`, `Catalog`, `Interactive`) are built without a
+Bokeh server, as in a script: `TaskRunner` then runs every task
+synchronously, so callbacks can be timed directly. Each benchmark reads a
+synthetic periodogram written by `fixtures.py`, for every requested number
+of frequency bins and, for the benchmarks that depend on it, every number
+of modes:
+
+- `read_fits`: reading the FITS file (`periodogram_store`, cache emptied).
+- `trim_frequency`: trimming the periodogram to the frequency window.
+- `apollinaire_echelle`: reshaping the trimmed periodogram into an echelle diagram.
+- `_clean_echelle`: the echelle arrays used by the plot, as after a delta Nu change.
+- `make_grid`: the thresholded grid points of the echelle diagram.
+- `load_pkb_to_second_tab`: reading a PKB file and matching it to the grid.
+- `apply_modes`: colouring the grid and periodogram with the modes of a table,
+  starting from unlabelled sources.
+- `selection_grid_to_table_fig`: copying selected grid points to Table 1.
+
+Every benchmark reports the best and median wall time over `--repeat` runs
+and the peak memory allocated during one extra run (`tracemalloc`), which
+NumPy and pandas buffers are counted in. Delta Nu changes between runs so
+that the echelle caches are not hit.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 1e4 1e5 1e6 --modes 10 100 --output new.json
+    python benchmarks/run_benchmarks.py --sizes 1e4 1e5 1e6 --compare old.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(ROOT, 'iechelle', 'gui'))
+
+from fixtures import make_fixture
+
+# Delta Nu of the fixtures and step between the runs of a benchmark
+DNU = 24.8
+DNU_STEP = 0.013
+
+
+class Session(object):
+    """
+    GUI state of one headless session showing a fixture.
+    """
+
+    def __init__(self, paths, fmin, fmax, cutoff):
+        """
+        Builds the session and draws the fixture periodogram.
+
+        Args:
+            paths (dict): Fixture files, as returned by `make_fixture`.
+            fmin (float): Lower limit of the frequency window, in uHz.
+            fmax (float): Upper limit of the frequency window, in uHz.
+            cutoff (float): Power threshold of the echelle grid.
+        """
+        from catalog import Catalog
+        from env import Environment
+        from mode_selection import Interactive
+
+        self.paths = paths
+        self.env = Environment()
+        self.env.prefetch_sources = 0
+        self.catalog = Catalog(self.env)
+        self.interactive = Interactive(self.env)
+        self.env.frequency_minimum_text.value = str(fmin)
+        self.env.frequency_maximum_text.value = str(fmax)
+        self.env.echelle_noise_cuttoff_text.value = str(cutoff)
+        folder = os.path.dirname(paths['fits'])
+        self.catalog.set_sources(['bench'], [paths['fits']], [folder])
+        self.runs = 0
+
+    def next_dnu(self):
+        """Moves delta Nu to a value not seen yet, as dragging the slider does."""
+        self.runs += 1
+        self.env.dnu_val = DNU + DNU_STEP*(self.runs % 50)
+
+    @property
+    def grid_size(self):
+        """int: Number of points of the echelle grid."""
+        return len(self.env.tb_grid_source.data['xx'])
+
+
+def session_benchmarks(session):
+    """
+    Returns the benchmarks that only depend on the periodogram size.
+
+    Args:
+        session (Session): Session showing the fixture.
+
+    Returns:
+        list: `(name, setup, work)` tuples; `setup()` runs untimed before
+            every `work()`.
+    """
+    from periodogram_store import periodogram_store
+
+    inter = session.interactive
+    env = session.env
+    path = session.paths['fits']
+    freq = np.asarray(inter.periodogram.frequency.value)
+    power = np.asarray(inter.periodogram.power.value)
+
+    return [
+        ('read_fits', lambda: periodogram_store.invalidate(path),
+         lambda: periodogram_store.get(path)),
+        ('trim_frequency', None, inter.trim_frequency),
+        ('apollinaire_echelle', session.next_dnu,
+         lambda: inter.apollinaire_echelle(freq, power, env.dnu_val)),
+        ('_clean_echelle', session.next_dnu,
+         lambda: inter._clean_echelle(deltanu=env.dnu_val)),
+        ('make_grid', session.next_dnu, inter.make_grid),
+    ]
+
+
+def mode_benchmarks(session, n_modes):
+    """
+    Returns the benchmarks that depend on the number of modes.
+
+    Args:
+        session (Session): Session showing the fixture.
+        n_modes (int): Number of modes of the PKB file and of the selection.
+
+    Returns:
+        list: `(name, setup, work)` tuples; `setup()` runs untimed before
+            every `work()`.
+    """
+    import functions
+
+    inter = session.interactive
+    env = session.env
+    pkb = session.paths['pkb']
+    table = inter.load_pkb_to_second_tab(pkb)
+    power = np.asarray(env.tb_grid_source.data['power_values'])
+    selected = [int(i) for i in np.argsort(power)[-n_modes:]]
+
+    def select():
+        inter.table_first.clear()
+        env.tb_grid_source.selected.indices = selected
+
+    def unlabel():
+        # apply_modes only patches the rows whose label changes: start unlabelled
+        for source in (env.tb_grid_source, env.tb_other_periodogram):
+            source.data['Mode'] = functions.mode_column(len(source.data['Mode']))
+
+    return [
+        ('load_pkb_to_second_tab', None, lambda: inter.load_pkb_to_second_tab(pkb)),
+        ('apply_modes', unlabel, lambda: inter.apply_modes(table)),
+        ('selection_grid_to_table_fig', select,
+         lambda: inter.selection_grid_to_table_fig('indices', [], selected)),
+    ]
+
+
+def measure(setup, work, repeat):
+    """
+    Times a benchmark and measures its peak memory.
+
+    Args:
+        setup (callable): Runs untimed before every call of `work`, or None.
+        work (callable): Code being measured.
+        repeat (int): Number of timed runs.
+
+    Returns:
+        dict: 'best_s' and 'median_s' wall times in seconds, and 'peak_mb',
+            the peak memory allocated during one more run, in MiB.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        work()
+        times.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        work()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return dict(best_s=min(times), median_s=statistics.median(times), peak_mb=peak/2**20)
+
+
+def run(sizes, modes, repeat, fixtures, fmin, fmax, cutoff, only=None):
+    """
+    Runs every benchmark for every periodogram size and number of modes.
+
+    Args:
+        sizes (list): Numbers of frequency bins.
+        modes (list): Numbers of modes.
+        repeat (int): Number of timed runs of each benchmark.
+        fixtures (str): Directory holding the fixture files.
+        fmin (float): Lower limit of the frequency window, in uHz.
+        fmax (float): Upper limit of the frequency window, in uHz.
+        cutoff (float): Power threshold of the echelle grid.
+        only (list, optional): Names of the benchmarks to run. Defaults to
+            None, which runs them all.
+
+    Returns:
+        list: One dict per measurement.
+    """
+    results = []
+    for n_bins in sizes:
+        for n_modes in modes:
+            paths = make_fixture(os.path.join(fixtures, 'bins{}'.format(n_bins)),
+                                 n_bins, n_modes=n_modes, dnu=DNU)
+            with contextlib.redirect_stdout(io.StringIO()):
+                session = Session(paths, fmin, fmax, cutoff)
+                benchmarks = mode_benchmarks(session, n_modes)
+                if n_modes == modes[0]:
+                    benchmarks = session_benchmarks(session) + benchmarks
+            for name, setup, work in benchmarks:
+                if only and name not in only:
+                    continue
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = measure(setup, work, repeat)
+                result.update(benchmark=name, bins=n_bins,
+                              modes=n_modes if name in MODE_BENCHMARKS else None,
+                              grid=session.grid_size)
+                results.append(result)
+                print('{benchmark:<28} bins {bins:>9} modes {modes!s:>5} grid {grid:>8}  '
+                      'best {best_s:9.4f} s  median {median_s:9.4f} s  peak {peak_mb:8.1f} MiB'
+                      .format(**result), flush=True)
+    return results
+
+
+MODE_BENCHMARKS = ('load_pkb_to_second_tab', 'apply_modes', 'selection_grid_to_table_fig')
+
+
+def metadata():
+    """Returns the commit, versions and date the results were measured with."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    import bokeh
+    import pandas
+    return dict(commit=commit, date=datetime.datetime.now().isoformat(timespec='seconds'),
+                python=platform.python_version(), numpy=np.__version__,
+                pandas=pandas.__version__, bokeh=bokeh.__version__,
+                machine=platform.machine(), processor=platform.processor())
+
+
+def compare(results, file_name):
+    """
+    Prints the ratio of the new timings to those of a previous run.
+
+    Args:
+        results (list): Results of this run.
+        file_name (str): JSON file written by a previous run with `--output`.
+    """
+    with open(file_name) as file:
+        previous = json.load(file)
+    old = {(r['benchmark'], r['bins'], r['modes']): r for r in previous['results']}
+    print('\nCompared with', file_name, previous['meta'].get('commit', ''))
+    for result in results:
+        reference = old.get((result['benchmark'], result['bins'], result['modes']))
+        if reference is None:
+            continue
+        print('{:<28} bins {:>9} modes {!s:>5}  median x{:6.2f}  peak x{:6.2f}'.format(
+            result['benchmark'], result['bins'], result['modes'],
+            result['median_s']/max(reference['median_s'], 1e-12),
+            result['peak_mb']/max(reference['peak_mb'], 1e-12)))
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description='Benchmark the iEchelle hot paths without a Bokeh server.')
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1e4, 1e5, 1e6, 1e7],
+                        help='Numbers of frequency bins of the periodograms')
+    parser.add_argument('--modes', type=int, nargs='+', default=[10, 100],
+                        help='Numbers of modes in the PKB files and selections')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs of each benchmark')
+    parser.add_argument('--fmin', type=float, default=200.0, help='Lower frequency limit in uHz')
+    parser.add_argument('--fmax', type=float, default=1400.0, help='Upper frequency limit in uHz')
+    parser.add_argument('--cutoff', type=float, default=0.0, help='Power threshold of the grid')
+    parser.add_argument('--only', nargs='+', help='Names of the benchmarks to run')
+    parser.add_argument('--fixtures', help='Directory of the fixture files, kept between runs '
+                        '(default: a temporary directory)')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of a previous run to compare with')
+    args = parser.parse_args(argv)
+
+    warnings.filterwarnings('ignore')
+    sizes = [int(size) for size in args.sizes]
+    with contextlib.ExitStack() as stack:
+        fixtures = args.fixtures or stack.enter_context(tempfile.TemporaryDirectory(prefix='iechelle-bench-'))
+        results = run(sizes, args.modes, args.repeat, fixtures, args.fmin, args.fmax,
+                      args.cutoff, only=args.only)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(dict(meta=metadata(), results=results), file, indent=1)
+        print('Results written to', args.output)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Headless, multi-process batch renderer of echelle diagrams.
+
+Produces the echelle diagram of every periodogram of a directory or of a
+catalog without starting the Bokeh GUI, using the same NumPy engine
+(`echelle.py`) and FITS reader (`periodogram_store.py`) as the interactive
+application. Every file is read once, so the workers do not cache it. Stars are processed in parallel on a process pool, one star per
+task, so the run time scales with the number of cores.
+
+For every star the following files are written to the output directory:
+
+- `<id>_echelle.npz`: the echelle image ('image'), its axes ('x_freq',
+  'y_freq'), the grid points above the power threshold ('xx', 'yy',
+  'freq_values', 'power_values') and the parameters used ('dnu',
+  'minimum_frequency', 'maximum_frequency', 'cutoff').
+- `<id>_echelle.png` (with `--png`): a rendering of the echelle image.
+
+Usage:
+    python iechelle/gui/batch_echelle.py DIRECTORY --dnu 24.8 -o out/
+    python iechelle/gui/batch_echelle.py catalog.csv -o out/ --png -j 16
+
+A catalog is a CSV file with a 'path_fits' column and optional
+'id_mycatalog' (output name) and 'dnu' (per-star delta Nu) columns. The
+stars of a directory are named after the path of their FITS file relative
+to it, with '_' between the folders and the file name. Output names must be
+unique.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+import echelle
+from periodogram_store import PeriodogramStore
+
+# FITS periodograms are stored in Hz, the GUI works in uHz
+HZ_TO_UHZ = 1e6
+
+
+def read_catalog(source, dnu=None, require_dnu=True):
+    """
+    Builds the list of stars to process.
+
+    Args:
+        source (str or Path): A directory, searched recursively for '*.fits'
+            files, or a CSV catalog with a 'path_fits' column. The stars of a
+            directory are named after the path of their FITS file relative
+            to it, e.g. 'a_star' for 'a/star.fits', since the data folder
+            of every star may hold a FITS file of the same name.
+        dnu (float, optional): Delta Nu used for stars without a 'dnu' value
+            in the catalog. Defaults to None.
+        require_dnu (bool, optional): If False, stars without a delta Nu are
+            kept with 'dnu' set to None. Defaults to True.
+
+    Returns:
+        list: One dict per star with keys 'id_mycatalog', 'path_fits' and 'dnu'.
+
+    Raises:
+        ValueError: If a star has no delta Nu and `require_dnu` is True, or
+            if two stars have the same 'id_mycatalog', which names their
+            output files.
+    """
+    source = Path(source)
+    if source.is_dir():
+        stars = [dict(id_mycatalog='_'.join(path.relative_to(source).with_suffix('').parts),
+                      path_fits=str(path), dnu=dnu)
+                 for path in sorted(source.rglob('*.fits'))]
+    else:
+        import pandas as pd
+        catalog = pd.read_csv(source)
+        stars = []
+        for _, entry in catalog.iterrows():
+            path = Path(str(entry['path_fits']))
+            if not path.is_absolute():
+                path = source.parent / path
+            star_dnu = entry['dnu'] if 'dnu' in catalog and not pd.isnull(entry['dnu']) else dnu
+            star_id = entry['id_mycatalog'] if 'id_mycatalog' in catalog else path.stem
+            stars.append(dict(id_mycatalog=str(star_id), path_fits=str(path), dnu=star_dnu))
+
+    seen = set()
+    duplicates = sorted({star['id_mycatalog'] for star in stars
+                         if star['id_mycatalog'] in seen or seen.add(star['id_mycatalog'])})
+    if duplicates:
+        raise ValueError('Duplicate id_mycatalog in {}: {}'.format(source, ', '.join(duplicates)))
+
+    for star in stars:
+        if star['dnu'] is None:
+            if not require_dnu:
+                continue
+            raise ValueError('No delta Nu for {}: use --dnu or a dnu column'.format(star['id_mycatalog']))
+        star['dnu'] = float(star['dnu'])
+    return stars
+
+
+def echelle_products(freq, power, dnu, minimum_frequency, maximum_frequency, cutoff):
+    """
+    Computes the echelle image and grid points of one periodogram.
+
+    The periodogram is restricted to the open interval between the integer
+    parts of the frequency limits, as in `Interactive._clean_echelle`.
+
+    Args:
+        freq (numpy.ndarray): Frequencies in uHz.
+        power (numpy.ndarray): Power values.
+        dnu (float): The large frequency separation in uHz.
+        minimum_frequency (float): Lower frequency limit in uHz.
+        maximum_frequency (float): Upper frequency limit in uHz.
+        cutoff (float): Power threshold of the grid points.
+
+    Returns:
+        dict: Arrays 'image', 'x_freq', 'y_freq', 'xx', 'yy', 'freq_values'
+            and 'power_values'.
+    """
+    ind = (freq < int(maximum_frequency)) & (freq > int(minimum_frequency))
+    freq = np.ascontiguousarray(freq[ind])
+    power = np.ascontiguousarray(power[ind])
+    if freq.size < 3:
+        raise ValueError('Fewer than 3 frequency bins between {} and {}'.format(
+            minimum_frequency, maximum_frequency))
+
+    image, x_freq, y_freq = echelle.echelle_image(freq, power, dnu)
+    indices = np.flatnonzero(image.reshape(-1) >= cutoff)
+    xx, yy = echelle.echelle_coordinates(x_freq, y_freq, indices)
+    return dict(image=image,
+                x_freq=x_freq,
+                y_freq=y_freq,
+                xx=xx,
+                yy=yy,
+                freq_values=freq[indices],
+                power_values=power[indices])
+
+
+def save_png(filename, products, dnu, title=''):
+    """
+    Renders an echelle image to a PNG file.
+
+    Matplotlib is imported here, with the non-interactive Agg backend, so
+    that it is only loaded when PNG output is requested.
+
+    Args:
+        filename (str or Path): Output file.
+        products (dict): Result of `echelle_products`.
+        dnu (float): Delta Nu, shown in the axis label.
+        title (str, optional): Figure title. Defaults to ''.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+
+    image = products['image']
+    x_freq = products['x_freq']
+    y_freq = products['y_freq']
+    fig, ax = plt.subplots(figsize=(6, 8))
+    # Clip the brightest peaks, as the stretch slider of the GUI does
+    vmin, vmax = np.percentile(image, [5, 99.5])
+    ax.imshow(image, origin='lower', aspect='auto', cmap='Greys', vmin=vmin, vmax=vmax,
+              extent=(x_freq[0], x_freq[-1], y_freq[0], y_freq[-1]))
+    ax.set_xlabel('Frequency / {:.3f} uHz Mod. 1'.format(dnu))
+    ax.set_ylabel('Frequency [uHz]')
+    ax.set_title(title)
+    fig.savefig(filename, dpi=100, bbox_inches='tight')
+    plt.close(fig)
+
+
+def render_star(star, output, minimum_frequency, maximum_frequency, cutoff, png):
+    """
+    Computes and writes the echelle products of one star.
+
+    Runs in a worker process.
+
+    Args:
+        star (dict): Entry of `read_catalog`.
+        output (str): Output directory.
+        minimum_frequency (float): Lower frequency limit in uHz.
+        maximum_frequency (float): Upper frequency limit in uHz.
+        cutoff (float): Power threshold of the grid points.
+        png (bool): Also write a PNG rendering.
+
+    Returns:
+        tuple: `(id_mycatalog, npz path, number of grid points)`.
+    """
+    # Read without the periodogram cache: each file is read once per run, and a
+    # cache of up to 1 GiB per worker process would only hold memory
+    ff, pp = PeriodogramStore._read(star['path_fits'])
+    products = echelle_products(ff*HZ_TO_UHZ, pp, star['dnu'],
+                                minimum_frequency, maximum_frequency, cutoff)
+
+    stem = Path(output) / '{}_echelle'.format(star['id_mycatalog'])
+    np.savez(str(stem) + '.npz',
+             dnu=star['dnu'],
+             minimum_frequency=minimum_frequency,
+             maximum_frequency=maximum_frequency,
+             cutoff=cutoff,
+             **products)
+    if png:
+        save_png(str(stem) + '.png', products, star['dnu'], title=star['id_mycatalog'])
+    return star['id_mycatalog'], str(stem) + '.npz', products['xx'].size
+
+
+def run(stars, output, minimum_frequency=1, maximum_frequency=8000, cutoff=0.0,
+        png=False, workers=None):
+    """
+    Renders the echelle diagrams of many stars on a process pool.
+
+    Args:
+        stars (list): Entries of `read_catalog`.
+        output (str or Path): Output directory, created if needed.
+        minimum_frequency (float, optional): Lower frequency limit in uHz.
+            Defaults to 1.
+        maximum_frequency (float, optional): Upper frequency limit in uHz.
+            Defaults to 8000.
+        cutoff (float, optional): Power threshold of the grid points.
+            Defaults to 0.
+        png (bool, optional): Also write PNG renderings. Defaults to False.
+        workers (int, optional): Number of worker processes. Defaults to None,
+            which uses every core.
+
+    Returns:
+        dict: id_mycatalog to the error message of every star that failed.
+    """
+    os.makedirs(output, exist_ok=True)
+    failed = {}
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(render_star, star, str(output), minimum_frequency,
+                                   maximum_frequency, cutoff, png): star
+                   for star in stars}
+        for done, future in enumerate(as_completed(futures), start=1):
+            star = futures[future]
+            try:
+                star_id, filename, n_points = future.result()
+                print('[{}/{}] {} -> {} ({} grid points)'.format(
+                    done, len(stars), star_id, filename, n_points))
+            except Exception as error:
+                failed[star['id_mycatalog']] = str(error)
+                print('[{}/{}] {} failed: {}'.format(done, len(stars), star['id_mycatalog'], error))
+    print('Processed {} stars in {:.1f} s, {} failed'.format(len(stars), time.time() - start, len(failed)))
+    return failed
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description='Render echelle diagrams of many periodograms.')
+    parser.add_argument('source', help='Directory of FITS periodograms or CSV catalog with a path_fits column')
+    parser.add_argument('-o', '--output', default='echelle_output', help='Output directory')
+    parser.add_argument('--dnu', type=float, default=None,
+                        help='Delta Nu in uHz for stars without a dnu catalog column')
+    parser.add_argument('--fmin', type=float, default=1, help='Minimum frequency in uHz')
+    parser.add_argument('--fmax', type=float, default=8000, help='Maximum frequency in uHz')
+    parser.add_argument('--cutoff', type=float, default=0.0, help='Power threshold of the grid points')
+    parser.add_argument('--png', action='store_true', help='Also write PNG images')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='Number of worker processes (default: all cores)')
+    args = parser.parse_args(argv)
+
+    stars = read_catalog(args.source, dnu=args.dnu)
+    failed = run(stars, args.output,
+                 minimum_frequency=args.fmin,
+                 maximum_frequency=args.fmax,
+                 cutoff=args.cutoff,
+                 png=args.png,
+                 workers=args.workers)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,30 +14,30 @@ from bokeh.models import CustomJS, TextInput, Paragraph,PreText,Div
 from bokeh.models import Button, Select, RadioGroup  # for saving data
 from bokeh.plotting import figure
 import pandas as pd
-from tkinter import Tk
-from tkinter.filedialog import askdirectory, askopenfile
 import ast
-from astropy.coordinates import SkyCoord
 from astropy import units as unit
 import os
 
 from pathlib import Path
 from bokeh.layouts import row,column
+from bokeh.plotting import curdoc
+from batch_echelle import read_catalog
+from file_browser import FileBrowser
 
-class Catalog(Environment):
+class Catalog(object):
     """
     Manages catalog data, source navigation, and file/directory selection.
 
     This class initializes UI elements related to catalog operations,
-    handles callbacks for opening file and directory dialogs (using Tkinter),
+    handles callbacks for choosing files and directories (with the in-page
+    `FileBrowser`),
     updates Bokeh ColumnDataSources with information about selected files
     or catalog entries, and manages navigation (next/previous source).
 
-    It interacts heavily with the shared `Environment` object (`self.env`)
-    to access and modify UI elements and data sources.
+    It interacts heavily with the `Environment` instance of its session
+    (`self.env`) to access and modify UI elements and data sources.
     """
-    env=Environment
-    def __init__(self):
+    def __init__(self, env=None):
         """
         Initializes the Catalog UI elements and sets up callbacks.
 
@@ -45,7 +45,12 @@ class Catalog(Environment):
         text inputs for catalog queries (though some seem commented out),
         and initializes Bokeh ColumnDataSources for source information.
         It also configures callbacks for these UI elements.
+
+        Args:
+            env (Environment, optional): State of the session, shared with
+                `Interactive`. Defaults to None, which creates a new one.
         """
+        self.env = Environment() if env is None else env
         #self.catalog_all=mycatalog.pointer(catalog='mycatalog')
         #self.env.extra_flag_file=mycatalog.filename(name='extra_flag_file')
 
@@ -125,6 +130,11 @@ class Catalog(Environment):
         # self.text_format()
         # self.initiate_userinput()
 
+        self.env.file_browser = FileBrowser(curdoc(), root=self.env.file_browser_root,
+                                            restrict=self.env.file_browser_restrict,
+                                            page_size=self.env.file_browser_page_size,
+                                            button_type=self.env.button_type)
+
         self.env.selected_filename_text = PreText()
         self.env.selected_filename_fits_text = PreText()
         self.env.selected_filename_pkb_text = PreText()
@@ -136,99 +146,132 @@ class Catalog(Environment):
         self.env.open_file_button = Button(label="Select Fits File")
         self.env.open_file_button.on_click(lambda x: self.select_file())
         
-        self.env.open_catalog_button = Button(label="Select Fits File")
+        self.env.open_catalog_button = Button(label="Select Catalog")
         self.env.open_catalog_button.on_click(lambda x: self.select_catalog())
 
 
-    def select_catalog(): # No `self` in definition
+    def select_catalog(self):
         """
-        Opens a file dialog to select a catalog file (presumably FITS).
+        Opens the file browser to select a catalog of sources.
 
-        When a file is selected, its path is displayed. It attempts to update
-        `self.env.tb_source` (which implies an instance `self` should be available)
-        with information from the selected file.
+        The catalog is a CSV file with a 'path_fits' column and an optional
+        'id_mycatalog' column, as read by `batch_echelle.read_catalog`. If a
+        FITS file is chosen instead, every '*.fits' file of its directory
+        becomes a source. The data folder of each
+        source is the directory of its FITS file. The first source is selected.
+        """
+        self.env.file_browser.open(self.open_catalog, pattern='*.csv *.fits',
+                                   title='Select Catalog')
 
-        Uses Tkinter for the file dialog.
-        Potential scoping issue: This method is defined without `self` as its
-        first argument, yet it attempts to access `self.env`. This may
-        lead to a NameError at runtime unless `self` is available through
-        other means in its actual execution context.
+    def open_catalog(self, file_name):
         """
-        root = Tk()
-        root.attributes('-topmost', True)
-        root.withdraw()
-        file = askopenfile()  # blocking
-        if file:
-            file_name = file.name
-            fits_path=os.path.abspath(file_name)
-            self.env.selected_filename_text.text = fits_path
-            
-            id_mycatalog_all=list([Path(file_name).stem])
-            id_all = np.arange(0,len(self.id_mycatalog_all))
-            path_fits=list([fits_path])
-            id=0
-            id_mycatalog=list([Path(file_name).stem])
-            data_folder=list([])
-            new_data=ColumnDataSource(data=dict(id_all=list(id_all),
-                                        id_mycatalog_all=list(id_mycatalog_all),
-                                        path_fits=path_fits,
-                                        id=list([id]),
-                                        id_mycatalog=list(self.id_mycatalog),
-                                        data_folder=list([str(Path(file_name).parent)]),
-                                        ))
-            
-            self.env.tb_source.data = dict(new_data.data)
+        Loads the sources of a catalog chosen with `select_catalog`.
+
+        Args:
+            file_name (str): Path of the CSV catalog or of a FITS file.
+        """
+        source = Path(file_name)
+        if source.suffix.lower() == '.fits':
+            source = source.parent
+        try:
+            stars = read_catalog(source, require_dnu=False)
+        except ValueError as exception:
+            print(exception)
+            self.env.message_banner.text = str(exception)
+            return
+        if not stars:
+            print('No source in', source)
+            return
+        self.set_sources(id_mycatalog_all=[star['id_mycatalog'] for star in stars],
+                         path_fits=[os.path.abspath(star['path_fits']) for star in stars],
+                         data_folder=[str(Path(star['path_fits']).parent) for star in stars])
 
     def select_folder(self):
         """
-        Opens a directory selection dialog using Tkinter.
+        Opens the file browser to select a directory.
 
         The path of the selected directory is then displayed in
         `self.env.selected_filename_text`.
         """
-        root = Tk()
-        root.attributes('-topmost', True)
-        # root.withdraw()
-        dirname = askdirectory()  # blocking
-        
-        root.lift()
-        if dirname:
+        def chosen(dirname):
             self.env.selected_filename_text.text = dirname
 
+        self.env.file_browser.open(chosen, mode='directory', title='Select Directory')
+
     def select_file(self):
         """
-        Opens a file selection dialog using Tkinter, intended for FITS files.
+        Opens the file browser to select a FITS file.
+
+        Once a file is chosen, `open_fits_file` shows it and makes it the
+        current source.
+        """
+        self.env.file_browser.open(self.open_fits_file, pattern='*.fits', title='Select Fits File')
+
+    def open_fits_file(self, file_name):
+        """
+        Makes a FITS file chosen with `select_file` the current source.
 
         Updates `self.env.selected_filename_text` and
         `self.env.selected_filename_fits_text` with the selected file's path.
         It also updates `self.env.tb_source` with information derived from
         this single file, treating it as the current source.
+
+        Args:
+            file_name (str): Path of the FITS file.
+        """
+        fits_path=os.path.abspath(file_name)
+        self.env.selected_filename_fits_text.text = fits_path
+        self.set_sources(id_mycatalog_all=[Path(file_name).stem],
+                         path_fits=[fits_path],
+                         data_folder=[str(Path(file_name).parent)])
+
+    def set_sources(self, id_mycatalog_all, path_fits, data_folder, id=0):
         """
-        root = Tk()
-        root.attributes('-topmost', True)
-        root.withdraw()
-        file = askopenfile()  # blocking
-        if file:
-            file_name = file.name
-            fits_path=os.path.abspath(file_name)
-            self.env.selected_filename_text.text = fits_path
-            self.env.selected_filename_fits_text.text = fits_path
-
-            id_mycatalog_all=list([Path(file_name).stem])
-            id_all = np.arange(0,len(self.id_mycatalog_all))
-            path_fits=list([fits_path])
-            id=0
-            id_mycatalog=list([Path(file_name).stem])
-            data_folder=list([])
-            new_data=ColumnDataSource(data=dict(id_all=list(id_all),
-                                        id_mycatalog_all=list(id_mycatalog_all),
-                                        path_fits=path_fits,
-                                        id=list([id]),
-                                        id_mycatalog=list(self.id_mycatalog),
-                                        data_folder=list([str(Path(file_name).parent)]),
-                                        ))
-            
-            self.env.tb_source.data = dict(new_data.data)
+        Replaces the list of sources and selects one of them.
+
+        Replacing `self.env.tb_source.data` triggers
+        `Interactive.update_whole_plot`, which draws the selected source.
+
+        Args:
+            id_mycatalog_all (list): Name of every source.
+            path_fits (list): FITS periodogram of every source.
+            data_folder (list): Folder of the PKB and table files of every source.
+            id (int, optional): Row of the source to select. Defaults to 0.
+        """
+        self.id_mycatalog_all = list(id_mycatalog_all)
+        self.id_all = np.arange(0,len(self.id_mycatalog_all))
+        self.id = id
+        self.id_mycatalog = self.id_mycatalog_all[id]
+        self.env.selected_filename_text.text = str(path_fits[id])
+        new_data=ColumnDataSource(data=dict(id_all=list(self.id_all),
+                                    id_mycatalog_all=list(self.id_mycatalog_all),
+                                    path_fits=list(path_fits),
+                                    id=list([id]),
+                                    id_mycatalog=list([self.id_mycatalog]),
+                                    data_folder=list(data_folder),
+                                    ))
+
+        self.env.tb_source.data = dict(new_data.data)
+
+    def select_source(self, id):
+        """
+        Selects another source of the current list.
+
+        Args:
+            id (int): Row of the source in `self.env.tb_source`.
+
+        Returns:
+            bool: False if there is no source `id`, in which case nothing changes.
+        """
+        data = self.env.tb_source.data
+        if not 0 <= id < len(data['id_mycatalog_all']):
+            print('No source', id)
+            return False
+        self.set_sources(id_mycatalog_all=data['id_mycatalog_all'],
+                         path_fits=data['path_fits'],
+                         data_folder=data['data_folder'],
+                         id=id)
+        return True
 
         
     def update_all(self,attrname, old, new):
@@ -258,7 +301,8 @@ class Catalog(Environment):
         # self.update_format()
         self.env.text_id_mycatalog_query.value=str(self.id_mycatalog)
         self.env.text_id_query.value=str(self.env.tb_source.data["id"][0])
-        self.env.tb_catalog_all.selected.indices=[id]
+        if self.env.tb_catalog_all is not None:
+            self.env.tb_catalog_all.selected.indices=[id]
 #        self.update_tb_nearby_star()
 
 #        self.env.catalog_find_from_isocrhone()
@@ -350,41 +394,28 @@ class Catalog(Environment):
         """
         Advances the selection to the next source in the catalog.
 
-        Increments the current source ID, updates `self.env.tb_source`
-        to reflect the new selection, and calls `update_all` to refresh
-        dependent UI elements. It also attempts to load sector information
-        for the new source (some `mycatalog` related code is present but may
-        depend on external, undefined `mycatalog` object).
+        Selects the next row of `self.env.tb_source` (`select_source`), which
+        draws the new source, and calls `update_all` to refresh dependent UI
+        elements. Sources prepared by `Interactive.prefetch_neighbours` are
+        drawn without reading their files again.
         """
-        # print(self.env.tb_source.data["id"])
-        self.env.tb_source.data["id"][0]=int(self.env.tb_source.data["id"][0])+1
-        id=self.env.tb_source.data["id"][0]
+        id=int(self.env.tb_source.data["id"][0])+1
         print('All_data', self.env.tb_source.data["id_mycatalog_all"])
-        self.env.tb_source.data["id_mycatalog"][0]=self.env.tb_source.data["id_mycatalog_all"][id]
-        
-        self.id_mycatalog=self.env.tb_source.data["id_mycatalog"][0]
-        print(self.env.tb_source.data["id_mycatalog"][0],self.id_mycatalog)
-
-        mydata=mycatalog.pointer(id_mycatalog=self.id_mycatalog)
-        sector_list=ast.literal_eval(mydata.Sector.values[0])
-        sector_list=list([str(i) for i in sector_list])
-        self.env.sector=sector_list[0]
-        self.update_all(0,0,0)
+        if self.select_source(id):
+            print(self.env.tb_source.data["id_mycatalog"][0],self.id_mycatalog)
+            self.update_all(0,0,0)
 
     def previous(self):
         """
         Moves the selection to the previous source in the catalog.
 
-        Decrements the current source ID, updates `self.env.tb_source`
-        to reflect the new selection, and calls `update_all` to refresh
+        Selects the previous row of `self.env.tb_source` (`select_source`),
+        which draws the new source, and calls `update_all` to refresh
         dependent UI elements.
         """
-        # print(self.env.tb_source.data["id"])
-        self.env.tb_source.data["id"][0]=int(self.env.tb_source.data["id"][0])-1
-        id=self.env.tb_source.data["id"][0]
-        self.env.tb_source.data["id_mycatalog"][0]=self.env.tb_source.data["id_mycatalog_all"][id]
-        self.id_mycatalog=self.env.tb_source.data["id_mycatalog"][0]
-        self.update_all(0,0,0)
+        id=int(self.env.tb_source.data["id"][0])-1
+        if self.select_source(id):
+            self.update_all(0,0,0)
 
     # def initiate_userinput(self):
     #     self.env.text_flag_duplicate = TextInput(value=str(self.env.v_flag_duplicate), title="Flag duplicate",height=50)
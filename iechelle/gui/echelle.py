@@ -0,0 +1,933 @@
+"""
+Provides the NumPy engine used to build echelle diagrams.
+
+The functions in this module work on plain, contiguous NumPy arrays and do
+not depend on Bokeh, so they can be shared by the interactive GUI
+(`mode_selection.Interactive`) and by headless tools. An echelle diagram is a
+reshape of the power spectrum into slices of width delta Nu; the coordinates
+of every point of the diagram are derived with index arithmetic instead of a
+`np.meshgrid`, which avoids materialising the full grid as Python objects.
+
+`EchelleEngine` builds on these functions to recompute an echelle diagram
+incrementally when only delta Nu changes.
+
+`histogram_quantiles` estimates the colour-stretch limits of the diagram
+from a histogram of the power values. Changing delta Nu only reshapes the
+power, so the engine computes the limits once per periodogram.
+
+`smooth_power` smooths the power with a boxcar (cumulative sums) or a
+Gaussian (direct or FFT convolution) before it is reshaped; the engine
+applies it once per periodogram and width.
+
+`slice_argmax` picks the highest point of every echelle slice among a set
+of points, and `snr_peaks` finds the local maxima above a signal-to-noise
+ratio in every slice at once; both reduce with `np.maximum.reduceat`
+instead of grouping DataFrames.
+
+`dnu_scan` evaluates many trial delta Nu values at once: it folds the
+spectrum on each of them into a collapsed echelle spectrum (mean power per
+phase bin) and scores how sharply the power gathers into ridges.
+
+`quantize_log` maps power values to the palette indices a Bokeh
+`LogColorMapper` would pick, so that the echelle image can be sent to the
+browser as uint8 indices instead of float64 power (see
+`EchelleEngine.quantized_image`).
+"""
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def echelle_shape(freq, dnu):
+    """
+    Computes the number of slices and the number of bins per slice.
+
+    Args:
+        freq (numpy.ndarray): Evenly spaced frequency values.
+        dnu (float): The large frequency separation used to cut slices, in
+            the same unit as `freq`.
+
+    Returns:
+        tuple: A tuple containing:
+            - n_slice (int): Number of slices (rows) of the echelle diagram.
+            - len_slice (int): Number of frequency bins in each slice.
+    """
+    res = freq[2]-freq[1]
+    n_slice = int(np.floor_divide(freq[-1]-freq[0], dnu))
+    len_slice = int(np.floor_divide(dnu, res))
+
+    if (n_slice*len_slice > freq.size):
+        len_slice -= 1
+    return n_slice, len_slice
+
+
+def echelle_image(freq, power, dnu):
+    """
+    Reshapes a power spectrum into an echelle diagram.
+
+    The returned image and axes are views of the input arrays, so no data is
+    copied when the inputs are contiguous.
+
+    Args:
+        freq (numpy.ndarray): Evenly spaced frequency values.
+        power (numpy.ndarray): Power values, same size as `freq`.
+        dnu (float): The large frequency separation used to cut slices.
+
+    Returns:
+        tuple: A tuple containing:
+            - ed (numpy.ndarray): 2D echelle power array of shape
+              (n_slice, len_slice).
+            - x_freq (numpy.ndarray): Frequencies of the first slice (x-axis).
+            - y_freq (numpy.ndarray): First frequency of every slice (y-axis).
+    """
+    n_slice, len_slice = echelle_shape(freq, dnu)
+    size = n_slice*len_slice
+
+    ed = np.reshape(power[:size], (n_slice, len_slice))
+    freq_ed = np.reshape(freq[:size], (n_slice, len_slice))
+    x_freq = freq_ed[0, :]
+    y_freq = freq_ed[:, 0]
+    return ed, x_freq, y_freq
+
+
+def echelle_coordinates(x_freq, y_freq, indices=None):
+    """
+    Returns the echelle coordinates of flattened echelle indices.
+
+    The flattened index `i` of an echelle diagram with `len(x_freq)` bins per
+    slice lies in slice `i // len(x_freq)` at column `i % len(x_freq)`.
+
+    Args:
+        x_freq (numpy.ndarray): x-axis of the echelle diagram.
+        y_freq (numpy.ndarray): y-axis of the echelle diagram.
+        indices (numpy.ndarray, optional): Flattened indices to convert.
+            Defaults to None, which converts every point of the diagram.
+
+    Returns:
+        tuple: A tuple containing:
+            - xx (numpy.ndarray): x-coordinate of every requested point.
+            - yy (numpy.ndarray): y-coordinate of every requested point.
+    """
+    len_slice = x_freq.size
+    if indices is None:
+        return np.tile(x_freq, y_freq.size), np.repeat(y_freq, len_slice)
+    return x_freq[indices % len_slice], y_freq[indices // len_slice]
+
+
+def histogram_quantiles(values, percentiles, bins=4096):
+    """
+    Estimates percentiles of an array from a histogram of its values.
+
+    A histogram with fixed-width bins is one O(n) pass, unlike the partial
+    sort of `np.nanpercentile`. The bins of the positive values are spaced
+    logarithmically, so the relative error of the estimate is at most one
+    bin width, about `log(max/min)/bins`, whatever the dynamic range of the
+    power spectrum. Within a bin the values are assumed uniformly spread.
+    Zero and negative values, which have no logarithm, are sorted apart;
+    they are few in a power spectrum. Arrays of fewer than `4*bins` values
+    are sorted, which is exact and as fast.
+
+    Args:
+        values (array-like): Values; NaNs and infinities are ignored.
+        percentiles (sequence): Percentiles between 0 and 100.
+        bins (int, optional): Number of histogram bins. Defaults to 4096.
+
+    Returns:
+        numpy.ndarray: The estimated percentiles, or None if no value is finite.
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return None
+    if values.size < 4*bins:
+        return np.percentile(values, percentiles)
+    # Rank of every percentile, as in the linear interpolation of np.percentile
+    ranks = np.asarray(percentiles, dtype=np.float64)/100*(values.size - 1)
+    positive = values > 0
+    low = np.sort(values[~positive])
+    values = np.log(values[positive])
+    estimate = np.empty(ranks.size)
+    in_low = ranks < low.size
+    if in_low.any():
+        estimate[in_low] = np.interp(ranks[in_low], np.arange(low.size), low)
+    if in_low.all():
+        return estimate
+    ranks = ranks[~in_low] - low.size
+    vmin = values.min()
+    vmax = values.max()
+    if vmin == vmax:
+        estimate[~in_low] = np.exp(vmin)
+        return estimate
+    counts, edges = np.histogram(values, bins=bins, range=(vmin, vmax))
+    cumulative = np.cumsum(counts)
+    index = np.minimum(np.searchsorted(cumulative, ranks, side='right'), bins - 1)
+    before = np.where(index > 0, cumulative[index - 1], 0)
+    fraction = np.clip((ranks - before + 0.5)/np.maximum(counts[index], 1), 0, 1)
+    estimate[~in_low] = np.exp(edges[index] + fraction*(edges[index + 1] - edges[index]))
+    return estimate
+
+
+def _edge_weights(n, left, right, kernel_cumsum):
+    """
+    Returns the kernel weight inside the data at every position of a convolution.
+
+    Near the edges part of the kernel falls outside the data; dividing by
+    these weights makes every output a weighted mean of the available bins.
+
+    Args:
+        n (int): Number of data points.
+        left (int): Kernel bins before the centre.
+        right (int): Kernel bins after the centre.
+        kernel_cumsum (numpy.ndarray): Cumulative sum of the kernel, with a
+            leading 0.
+
+    Returns:
+        numpy.ndarray: Weights, of size n.
+    """
+    position = np.arange(n)
+    before = np.minimum(position, left)
+    after = np.minimum(n - 1 - position, right)
+    return kernel_cumsum[left + after + 1] - kernel_cumsum[left - before]
+
+
+def boxcar_smooth(power, window):
+    """
+    Centred moving average of the power, from cumulative sums.
+
+    Matches `pandas.Series.rolling(window, center=True, min_periods=1).mean()`:
+    near the edges, the mean is taken over the available bins.
+
+    Args:
+        power (array-like): Power values.
+        window (int): Number of bins averaged.
+
+    Returns:
+        numpy.ndarray: Smoothed power, or `power` itself if `window` <= 1.
+    """
+    power = np.asarray(power, dtype=np.float64)
+    window = int(window)
+    if window <= 1 or power.size == 0:
+        return power
+    n = power.size
+    cumsum = np.concatenate(([0.0], np.cumsum(power)))
+    start = np.clip(np.arange(n) - window//2, 0, n)
+    stop = np.clip(np.arange(n) - window//2 + window, 0, n)
+    return (cumsum[stop] - cumsum[start])/(stop - start)
+
+
+def gaussian_smooth(power, sigma, truncate=4.0):
+    """
+    Convolves the power with a normalized Gaussian kernel.
+
+    Short kernels are applied with `np.convolve`, longer ones through real
+    FFTs. Near the edges, the kernel is renormalized over the available bins.
+
+    Args:
+        power (array-like): Power values.
+        sigma (float): Standard deviation of the kernel, in bins.
+        truncate (float, optional): Half-width of the kernel in units of
+            `sigma`. Defaults to 4.
+
+    Returns:
+        numpy.ndarray: Smoothed power, or `power` itself if `sigma` <= 0.
+    """
+    power = np.asarray(power, dtype=np.float64)
+    if sigma <= 0 or power.size == 0:
+        return power
+    half = max(1, int(np.ceil(truncate*sigma)))
+    kernel = np.exp(-0.5*(np.arange(-half, half + 1)/sigma)**2)
+    n = power.size
+    if kernel.size <= 64:
+        smoothed = np.convolve(power, kernel, mode='full')[half:half + n]
+    else:
+        size = n + kernel.size - 1
+        nfft = 1 << (size - 1).bit_length()
+        spectrum = np.fft.rfft(power, nfft)*np.fft.rfft(kernel, nfft)
+        smoothed = np.fft.irfft(spectrum, nfft)[half:half + n]
+    cumsum = np.concatenate(([0.0], np.cumsum(kernel)))
+    return smoothed/_edge_weights(n, half, half, cumsum)
+
+
+SMOOTHING_KINDS = ('boxcar', 'gaussian')
+
+
+def smooth_power(power, width, kind='boxcar'):
+    """
+    Smooths the power with a boxcar or a Gaussian kernel.
+
+    Args:
+        power (array-like): Evenly spaced power values.
+        width (float): Boxcar window (rounded to a whole number of bins) or
+            Gaussian standard deviation, in bins. No smoothing if the boxcar
+            window is below 2 bins or the standard deviation is not positive.
+        kind (str, optional): One of `SMOOTHING_KINDS`. Defaults to 'boxcar'.
+
+    Returns:
+        numpy.ndarray: Smoothed power, same size as `power`.
+
+    Raises:
+        ValueError: If `kind` is not a known smoothing.
+    """
+    if kind == 'boxcar':
+        return boxcar_smooth(power, int(round(width)))
+    if kind == 'gaussian':
+        return gaussian_smooth(power, width)
+    raise ValueError('Unknown smoothing {!r}, expected one of {}'.format(kind, SMOOTHING_KINDS))
+
+
+def slice_argmax(groups, values):
+    """
+    Returns the position of the largest value of every group.
+
+    Equivalent to `pandas.Series(values).groupby(groups).idxmax()`: the
+    values are sorted by group (stable), each group is reduced with
+    `np.fmax.reduceat` (NaN ignored) and the first position holding the
+    maximum is kept.
+
+    Args:
+        groups (array-like): Group of every value, e.g. the 'yy' (slice)
+            coordinate of echelle grid points.
+        values (array-like): Values compared within a group, e.g. their power.
+
+    Returns:
+        numpy.ndarray: Positions into `values`, one per group with a finite
+            value, ordered by group.
+    """
+    groups = np.asarray(groups)
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return np.array([], dtype=np.int64)
+    order = np.argsort(groups, kind='stable')
+    groups = groups[order]
+    values = values[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    maxima = np.fmax.reduceat(values, starts)
+    hits = np.flatnonzero(values == np.repeat(maxima, np.diff(np.r_[starts, values.size])))
+    hit_groups = np.searchsorted(starts, hits, side='right')
+    first = hits[np.r_[True, hit_groups[1:] != hit_groups[:-1]]]
+    return order[first]
+
+
+def snr_peaks(freq, power, dnu, snr=10.0, separation=0.0, noise_power=None):
+    """
+    Finds the local maxima above a signal-to-noise ratio in every echelle slice.
+
+    The noise of every slice of width `dnu` is the median of its power
+    divided by ln 2, the mean of chi-squared (2 degrees of freedom) noise; a
+    local maximum is a bin higher than its left neighbour and not lower than
+    its right one. NaN bins are left out of the noise and are never peaks,
+    and they do not hide a peak next to them. All slices are handled in one pass over the reshaped
+    power. Peaks closer than `separation` to a higher peak are dropped, with
+    one `np.maximum.reduceat` over the windows of all peaks.
+
+    Args:
+        freq (numpy.ndarray): Evenly spaced frequency values.
+        power (numpy.ndarray): Power values, possibly smoothed.
+        dnu (float): The large frequency separation, width of the slices.
+        snr (float, optional): Smallest ratio of power to noise. Defaults to 10.
+        separation (float, optional): Smallest distance to a higher peak, in
+            the unit of `freq`. Defaults to 0, which keeps every maximum.
+        noise_power (numpy.ndarray, optional): Power the noise is estimated
+            from, e.g. the unsmoothed power. Defaults to None, `power`.
+
+    Returns:
+        tuple: A tuple containing:
+            - indices (numpy.ndarray): Positions of the peaks in `freq`, in
+              increasing frequency order.
+            - ratio (numpy.ndarray): Signal-to-noise ratio of every peak.
+    """
+    n_slice, len_slice = echelle_shape(freq, dnu)
+    size = n_slice*len_slice
+    if size < 3:
+        return np.array([], dtype=np.int64), np.array([])
+    power = np.asarray(power, dtype=np.float64)[:size]
+    noise_power = power if noise_power is None else np.asarray(noise_power, dtype=np.float64)[:size]
+    with warnings.catch_warnings():
+        # An all-NaN slice has a NaN noise, and no peak
+        warnings.simplefilter('ignore', RuntimeWarning)
+        noise = np.nanmedian(noise_power.reshape(n_slice, len_slice), axis=1)/np.log(2)
+    noise = np.repeat(noise, len_slice)
+    ratio = np.divide(power, noise, out=np.zeros(size), where=noise > 0)
+
+    level = np.where(np.isnan(power), -np.inf, power)
+    inner = level[1:-1]
+    indices = np.flatnonzero((inner > level[:-2]) & (inner >= level[2:]) & (ratio[1:-1] >= snr)) + 1
+    if separation > 0 and indices.size > 1:
+        peak_freq = freq[indices]
+        peak_power = power[indices]
+        lo = np.searchsorted(peak_freq, peak_freq - separation, side='left')
+        hi = np.searchsorted(peak_freq, peak_freq + separation, side='right')
+        # Interleaved (lo, hi) bounds: every even reduction is the maximum of a
+        # window; the sentinel keeps hi == indices.size a valid bound
+        bounds = np.column_stack([lo, hi]).ravel()
+        window_max = np.maximum.reduceat(np.append(peak_power, -np.inf), bounds)[::2]
+        indices = indices[peak_power >= window_max]
+    return indices, ratio[indices]
+
+
+def dnu_scan(freq, power, dnus, n_phase=100, oversample=4, max_elements=2**22):
+    """
+    Computes the collapsed echelle spectrum of every trial delta Nu.
+
+    The collapsed echelle spectrum of a trial delta Nu is the mean power in
+    each of `n_phase` bins of `((freq - freq[0]) % dnu)/dnu`, i.e. the echelle
+    diagram summed over its slices. The spectrum is first averaged into bins
+    of `min(dnus)/(n_phase*oversample)`, finer than any phase bin, then all
+    trials are binned with one `np.bincount` per chunk of trials, holding at
+    most `max_elements` (trial, frequency) pairs.
+
+    The ridge-sharpness score of a trial is the coefficient of variation
+    (standard deviation over mean) of its collapsed spectrum: it is highest
+    when the modes of successive orders line up in a few phase bins.
+
+    Args:
+        freq (array-like): Evenly spaced frequency values.
+        power (array-like): Power values, same size as `freq`.
+        dnus (array-like): Trial delta Nu values, in the unit of `freq`.
+        n_phase (int, optional): Number of phase bins. Defaults to 100.
+        oversample (int, optional): Spectrum bins per phase bin of the
+            smallest trial after rebinning. Defaults to 4.
+        max_elements (int, optional): Size of the chunks of the batched
+            binning. Defaults to 2**22.
+
+    Returns:
+        tuple: A tuple containing:
+            - collapsed (numpy.ndarray): Shape (len(dnus), n_phase).
+            - score (numpy.ndarray): Ridge-sharpness score of every trial.
+    """
+    freq = np.asarray(freq, dtype=np.float64)
+    power = np.asarray(power, dtype=np.float64)
+    dnus = np.asarray(dnus, dtype=np.float64)
+    collapsed = np.zeros((dnus.size, n_phase))
+    if freq.size < 2 or dnus.size == 0:
+        return collapsed, np.zeros(dnus.size)
+
+    offset = freq - freq[0]
+    factor = int((dnus.min()/(n_phase*oversample)) // (freq[1] - freq[0]))
+    if factor > 1:
+        size = offset.size//factor*factor
+        offset = offset[:size].reshape(-1, factor).mean(axis=1)
+        power = power[:size].reshape(-1, factor).mean(axis=1)
+
+    chunk = max(1, max_elements//offset.size)
+    for start in range(0, dnus.size, chunk):
+        trials = dnus[start:start + chunk]
+        index = np.mod(offset*(n_phase/trials)[:, None], n_phase).astype(np.int64)
+        np.minimum(index, n_phase - 1, out=index)
+        index += (np.arange(trials.size)*n_phase)[:, None]
+        index = index.ravel()
+        length = trials.size*n_phase
+        sums = np.bincount(index, weights=np.broadcast_to(power, (trials.size, power.size)).ravel(),
+                           minlength=length)
+        counts = np.bincount(index, minlength=length)
+        collapsed[start:start + trials.size] = (sums/np.maximum(counts, 1)).reshape(trials.size, n_phase)
+
+    mean = collapsed.mean(axis=1)
+    score = collapsed.std(axis=1)/np.where(mean > 0, mean, 1)
+    return collapsed, score
+
+
+def log_power(power):
+    """
+    Returns the natural logarithm of power values as float32.
+
+    Args:
+        power (array-like): Power values.
+
+    Returns:
+        numpy.ndarray: `log(power)`; values that are not positive and finite
+            are set to -inf, so that they take the first colour of the palette.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log = np.log(np.asarray(power, dtype=np.float32))
+    log[~np.isfinite(log)] = -np.inf
+    return log
+
+
+def quantize_log(log_values, lo, hi, n_colors):
+    """
+    Maps logarithmic power values to palette indices.
+
+    Follows `LogColorMapper`: the index of a value `v` is
+    `floor(n_colors*(log(v) - log(lo))/(log(hi) - log(lo)))`, clipped to the
+    palette, so values below `lo` take the first colour and values above
+    `hi` the last.
+
+    Args:
+        log_values (numpy.ndarray): Output of `log_power`.
+        lo (float): Power mapped to the first colour.
+        hi (float): Power mapped to the last colour.
+        n_colors (int): Number of colours of the palette, at most 256.
+
+    Returns:
+        numpy.ndarray: uint8 palette indices, same shape as `log_values`.
+    """
+    if not 0 < n_colors <= 256:
+        raise ValueError('n_colors must be between 1 and 256, got {}'.format(n_colors))
+    log_lo = np.log(lo) if lo > 0 else -np.inf
+    log_hi = np.log(hi) if hi > 0 else -np.inf
+    if not np.isfinite(log_lo) or not log_hi > log_lo:
+        # Degenerate stretch: split at hi
+        return np.where(log_values >= log_hi, n_colors - 1, 0).astype(np.uint8)
+    index = (log_values - np.float32(log_lo))*np.float32(n_colors/(log_hi - log_lo))
+    np.clip(index, 0, n_colors - 1, out=index)
+    return index.astype(np.uint8)
+
+
+class EchelleEngine(object):
+    """
+    Incremental echelle builder for a fixed, trimmed periodogram.
+
+    The engine keeps the trimmed frequency and power arrays of the current
+    periodogram and caches everything that does not depend on delta Nu: the
+    flattened indices of the points above each power threshold are computed
+    once per trim, so changing delta Nu only costs a reshape (a view), a
+    binary search and the index arithmetic of the grid points. Grids of a
+    small band of neighbouring delta Nu values can be precomputed on a
+    background thread with `prefetch`.
+
+    The points above a threshold are found with `power_order`, an argsort of
+    the power computed once per periodogram and smoothing (on first use, or
+    in the background after `prefetch`): it does not depend on delta Nu,
+    which only decides how many leading bins form the diagram. A threshold
+    is then a binary search plus a slice.
+
+    The colour-stretch limits (`stretch_limits`) only depend on the power
+    values and are computed once per periodogram as well. So are the uint8
+    palette indices of the power (`quantized_image`), for the last stretch
+    and palette size: changing delta Nu only reshapes them.
+
+    The power can be smoothed (`set_smoothing`) before any of these steps.
+    The smoothed power of every width is cached until the next `set_data`,
+    so that it is computed once per trim and shared by every delta Nu,
+    stretch and threshold; `power` holds the smoothed values and `raw_power`
+    the trimmed ones.
+
+    Results computed for an older periodogram or smoothing are discarded:
+    every call to `set_data` or change of smoothing bumps `generation` and
+    clears the caches.
+    """
+
+    def __init__(self, max_grids=16):
+        """
+        Initializes an empty engine.
+
+        Args:
+            max_grids (int, optional): Maximum number of (delta Nu, threshold)
+                grids kept in memory. Defaults to 16.
+        """
+        self.freq = np.array([])
+        self.power = np.array([])
+        self.raw_power = np.array([])
+        # (kind, width in frequency units) of the smoothing; width 0 disables it
+        self.smoothing = ('boxcar', 0.0)
+        self._smoothed = {}
+        self.generation = 0
+        self.max_grids = max_grids
+        self._above = {}
+        self._order = None
+        self._limits = {}
+        self._log_power = None
+        self._quantized = (None, None)
+        self._grids = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def empty(self):
+        """bool: True if the engine holds no periodogram data."""
+        return self.freq.size == 0
+
+    def set_data(self, freq, power, smoothed=None):
+        """
+        Replaces the trimmed periodogram and invalidates every cached result.
+
+        Args:
+            freq (array-like): Trimmed, evenly spaced frequency values.
+            power (array-like): Power values, same size as `freq`.
+            smoothed (dict, optional): `power` already smoothed, keyed on
+                `(kind, width)` as `smoothing`, e.g. on the worker thread that
+                trimmed it, so that large spectra are not smoothed here.
+                Defaults to None, which smooths `power` if needed.
+        """
+        freq = np.ascontiguousarray(freq, dtype=np.float64)
+        raw_power = np.ascontiguousarray(power, dtype=np.float64)
+        self._smoothed = {key: value for key, value in (smoothed or {}).items()
+                          if value.shape == raw_power.shape}
+        power = self._smoothed_power(freq, raw_power)
+        with self._lock:
+            self.freq = freq
+            self.raw_power = raw_power
+            self.power = power
+            self._invalidate()
+
+    def set_smoothing(self, width, kind='boxcar'):
+        """
+        Sets the smoothing applied to the power before it is reshaped.
+
+        The smoothed power is cached per width until the next `set_data`, so
+        returning to a width seen before does not smooth again.
+
+        Args:
+            width (float): Boxcar window or Gaussian standard deviation, in
+                the unit of the frequencies; 0 disables the smoothing.
+            kind (str, optional): One of `SMOOTHING_KINDS`. Defaults to 'boxcar'.
+
+        Returns:
+            bool: True if the smoothing changed, which invalidates the cached
+                results.
+
+        Raises:
+            ValueError: If `kind` is not a known smoothing or `width` is negative.
+        """
+        if kind not in SMOOTHING_KINDS:
+            raise ValueError('Unknown smoothing {!r}, expected one of {}'.format(kind, SMOOTHING_KINDS))
+        if width < 0:
+            raise ValueError('The smoothing width must not be negative')
+        smoothing = (kind, float(width))
+        if smoothing == self.smoothing:
+            return False
+        self.smoothing = smoothing
+        power = self._smoothed_power(self.freq, self.raw_power)
+        with self._lock:
+            self.power = power
+            self._invalidate()
+        return True
+
+    def _smoothed_power(self, freq, raw_power):
+        """
+        Returns the raw power smoothed with `self.smoothing`, from the cache if possible.
+
+        Args:
+            freq (numpy.ndarray): Trimmed frequency values, giving the bin width.
+            raw_power (numpy.ndarray): Trimmed power values.
+
+        Returns:
+            numpy.ndarray: Smoothed power, or `raw_power` without smoothing.
+        """
+        kind, width = self.smoothing
+        if width <= 0 or freq.size < 2:
+            return raw_power
+        key = (kind, width)
+        power = self._smoothed.get(key)
+        if power is None:
+            power = smooth_power(raw_power, width/(freq[1] - freq[0]), kind)
+            self._smoothed[key] = power
+        return power
+
+    def _invalidate(self):
+        """Drops the results derived from the power. Called with the lock held."""
+        self.generation += 1
+        self._above.clear()
+        self._order = None
+        self._limits.clear()
+        self._log_power = None
+        self._quantized = (None, None)
+        self._grids.clear()
+
+    def stretch_limits(self, percentiles=(0.1, 99.9)):
+        """
+        Returns the colour-stretch limits of the echelle diagram.
+
+        The limits are percentiles of the trimmed power, estimated with
+        `histogram_quantiles` and cached until `set_data` is called again.
+
+        Args:
+            percentiles (tuple, optional): Lower and upper percentiles.
+                Defaults to (0.1, 99.9).
+
+        Returns:
+            tuple: `(lo, hi)`, or None if the engine holds no finite power.
+        """
+        key = tuple(percentiles)
+        with self._lock:
+            if key in self._limits:
+                return self._limits[key]
+            power = self.power
+            generation = self.generation
+
+        limits = histogram_quantiles(power, percentiles)
+        if limits is not None:
+            limits = tuple(float(limit) for limit in limits)
+        with self._lock:
+            if generation == self.generation:
+                self._limits[key] = limits
+        return limits
+
+    def quantized(self, lo, hi, n_colors):
+        """
+        Returns the palette indices of the whole trimmed power.
+
+        The logarithm of the power is computed once per periodogram and the
+        indices of the last `(lo, hi, n_colors)` are cached, so moving the
+        stretch slider costs one pass over float32 logarithms.
+
+        Args:
+            lo (float): Power mapped to the first colour.
+            hi (float): Power mapped to the last colour.
+            n_colors (int): Number of colours of the palette, at most 256.
+
+        Returns:
+            numpy.ndarray: uint8 indices, same size as `power`. Shared with
+                the cache, must not be modified.
+        """
+        key = (float(lo), float(hi), int(n_colors))
+        with self._lock:
+            if self._quantized[0] == key:
+                return self._quantized[1]
+            power = self.power
+            log = self._log_power
+            generation = self.generation
+
+        if log is None:
+            log = log_power(power)
+        indices = quantize_log(log, lo, hi, n_colors)
+        with self._lock:
+            if generation == self.generation:
+                self._log_power = log
+                self._quantized = (key, indices)
+        return indices
+
+    def quantized_image(self, dnu, lo, hi, n_colors):
+        """
+        Returns the echelle image as uint8 palette indices.
+
+        Args:
+            dnu (float): The large frequency separation.
+            lo (float): Power mapped to the first colour.
+            hi (float): Power mapped to the last colour.
+            n_colors (int): Number of colours of the palette, at most 256.
+
+        Returns:
+            numpy.ndarray: Indices of shape (n_slice, len_slice), as the
+                image of `image(dnu)`; a view of the cached indices.
+        """
+        n_slice, len_slice = echelle_shape(self.freq, dnu)
+        indices = self.quantized(lo, hi, n_colors)
+        return indices[:n_slice*len_slice].reshape(n_slice, len_slice)
+
+    def image(self, dnu):
+        """
+        Returns the echelle image and axes for a delta Nu value.
+
+        Args:
+            dnu (float): The large frequency separation.
+
+        Returns:
+            tuple: `(ed, x_freq, y_freq)` as returned by `echelle_image`.
+        """
+        return echelle_image(self.freq, self.power, dnu)
+
+    def peaks(self, dnu, snr=10.0, separation=0.0):
+        """
+        Finds the local maxima above a signal-to-noise ratio in every slice.
+
+        The peaks are searched in the (smoothed) power with `snr_peaks`; the
+        noise is estimated from the unsmoothed power.
+
+        Args:
+            dnu (float): The large frequency separation.
+            snr (float, optional): Smallest ratio of power to noise. Defaults to 10.
+            separation (float, optional): Smallest distance to a higher peak.
+                Defaults to 0.
+
+        Returns:
+            tuple: `(indices, ratio)` as returned by `snr_peaks`; the indices
+                are positions in `freq`.
+        """
+        with self._lock:
+            freq, power, raw_power = self.freq, self.power, self.raw_power
+        return snr_peaks(freq, power, dnu, snr=snr, separation=separation, noise_power=raw_power)
+
+    def power_order(self):
+        """
+        Returns the power index used to apply thresholds.
+
+        Computed once per periodogram and smoothing, with NaN power left out.
+
+        Returns:
+            tuple: `(order, sorted_power)`, where `order` holds the positions
+                of the finite power values in increasing power order and
+                `sorted_power` their values. Shared with the cache, must not
+                be modified.
+        """
+        with self._lock:
+            if self._order is not None:
+                return self._order
+            power = self.power
+            generation = self.generation
+
+        order = np.argsort(power, kind='stable')
+        sorted_power = power[order]
+        finite = np.searchsorted(sorted_power, np.inf, side='right')
+        result = (order[:finite], sorted_power[:finite])
+        with self._lock:
+            if generation == self.generation:
+                self._order = result
+        return result
+
+    def count_above(self, cutoff):
+        """
+        Returns the number of trimmed bins with power >= cutoff.
+
+        Args:
+            cutoff (float): Power threshold.
+
+        Returns:
+            int: Number of bins, from a binary search in `power_order`.
+        """
+        order, sorted_power = self.power_order()
+        return int(order.size - np.searchsorted(sorted_power, cutoff, side='left'))
+
+    def _indices_above(self, power, cutoff, generation):
+        """
+        Returns the sorted flattened indices of the points with power >= cutoff.
+
+        The result only depends on the trimmed periodogram and the threshold,
+        so it is computed once and shared by every delta Nu. Once
+        `power_order` was built, the points are a slice of it found with a
+        binary search, sorted back into frequency order when that is cheaper
+        than comparing every bin with the threshold; otherwise the bins are
+        compared.
+
+        Args:
+            power (numpy.ndarray): Trimmed power values of `generation`.
+            cutoff (float): Power threshold.
+            generation (int): Generation the power values belong to.
+
+        Returns:
+            numpy.ndarray: Sorted indices into the trimmed arrays.
+        """
+        with self._lock:
+            indices = self._above.get(cutoff) if generation == self.generation else None
+        if indices is None:
+            with self._lock:
+                index = self._order if generation == self.generation else None
+            if index is not None:
+                order, sorted_power = index
+                start = np.searchsorted(sorted_power, cutoff, side='left')
+                count = order.size - start
+            if index is not None and count*np.log2(max(count, 2)) < power.size:
+                indices = np.sort(order[start:])
+            else:
+                indices = np.flatnonzero(power >= cutoff)
+            with self._lock:
+                if generation == self.generation:
+                    if len(self._above) >= self.max_grids:
+                        self._above.clear()
+                    self._above[cutoff] = indices
+        return indices
+
+    def _compute_grid(self, dnu, cutoff):
+        """
+        Computes the grid points of the echelle diagram above a threshold.
+
+        Args:
+            dnu (float): The large frequency separation.
+            cutoff (float): Power threshold.
+
+        Returns:
+            dict: Arrays 'xx', 'yy', 'freq_values' and 'power_values' of the
+                grid points, in increasing frequency order.
+        """
+        with self._lock:
+            freq, power, generation = self.freq, self.power, self.generation
+        n_slice, len_slice = echelle_shape(freq, dnu)
+        size = n_slice*len_slice
+        x_freq = freq[:len_slice]
+        y_freq = freq[:size:len_slice]
+
+        above = self._indices_above(power, cutoff, generation)
+        indices = above[:np.searchsorted(above, size)]
+        xx, yy = echelle_coordinates(x_freq, y_freq, indices)
+        return dict(xx=xx,
+                    yy=yy,
+                    freq_values=freq[indices],
+                    power_values=power[indices])
+
+    @staticmethod
+    def _key(dnu, cutoff):
+        """Returns the cache key of a (delta Nu, threshold) pair."""
+        return (round(float(dnu), 6), float(cutoff))
+
+    def grid(self, dnu, cutoff):
+        """
+        Returns the grid points above a threshold for a delta Nu value.
+
+        Args:
+            dnu (float): The large frequency separation.
+            cutoff (float): Power threshold.
+
+        Returns:
+            dict: Arrays 'xx', 'yy', 'freq_values' and 'power_values'. The
+                arrays are shared with the cache and must not be modified.
+        """
+        key = self._key(dnu, cutoff)
+        with self._lock:
+            grid = self._grids.get(key)
+            if grid is not None:
+                self._grids.move_to_end(key)
+                return grid
+            generation = self.generation
+
+        grid = self._compute_grid(dnu, cutoff)
+        self._store(key, grid, generation)
+        return grid
+
+    def _store(self, key, grid, generation):
+        """Caches a grid unless the periodogram changed while computing it."""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._grids[key] = grid
+            self._grids.move_to_end(key)
+            while len(self._grids) > self.max_grids:
+                self._grids.popitem(last=False)
+
+    def prefetch(self, dnus, cutoff):
+        """
+        Precomputes the grids of several delta Nu values in the background.
+
+        Args:
+            dnus (iterable): Delta Nu values to precompute.
+            cutoff (float): Power threshold.
+        """
+        if self.empty:
+            return
+        dnus = list(dnus)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        generation = self.generation
+
+        def work():
+            for dnu in dnus:
+                if generation != self.generation:
+                    return
+                if dnu <= 0:
+                    continue
+                key = self._key(dnu, cutoff)
+                with self._lock:
+                    if key in self._grids:
+                        continue
+                self._store(key, self._compute_grid(dnu, cutoff), generation)
+            # Ready for threshold changes once the grids are done
+            if generation == self.generation:
+                self.power_order()
+
+        self._executor.submit(work)
+
+    def shutdown(self):
+        """
+        Stops the background thread of `prefetch`, e.g. when the session ends.
+
+        Queued work is cancelled and running work stops at the next delta Nu
+        without storing its grid.
+        """
+        with self._lock:
+            self._invalidate()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
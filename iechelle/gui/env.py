@@ -8,6 +8,14 @@ by various components of the iEchelle application to share data, Bokeh
 ColumnDataSources, figure handles, UI element states, and global parameters.
 This avoids the need to pass around numerous objects or rely on global
 variables in a less structured way.
+
+One `Environment` instance is created per Bokeh session (document) by
+`main.py` and passed to `Catalog` and `Interactive`, so that several analysts
+can use the same server process without overwriting each other's plots and
+parameters. The class attributes are only defaults and server-wide
+configuration; read-only caches such as `periodogram_store` and the
+synthetic spectrum cache of `functions` are module-level and shared by all
+sessions.
 """
 
 
@@ -27,6 +35,9 @@ class Environment(object):
     - UI element states (e.g., selected values, text inputs).
     - Parameters for astrophysical calculations (e.g., dnu, frequency ranges).
     - Configuration settings (e.g., default color palettes, plot dimensions).
+
+    Attributes set on an instance (`self.env.x = ...`) belong to one session
+    and shadow the class defaults; never assign to `Environment.x` directly.
     """
     # ---------------------------Light Curve Param----------------------------- #
     # These parameters seem related to light curve processing and display,
@@ -179,8 +190,6 @@ class Environment(object):
     </div>
     """
 
-    from bokeh.models.widgets import Div
-    div_spinner = Div(text="", width=120, height=120) # Instantiation of the spinner Div
 
 
 #  Analysis Window - Elements for a comparative analysis view
@@ -247,6 +256,32 @@ class Environment(object):
     maximum_frequency = None  # Max frequency for echelle/periodogram display
     maxdnu = None             # Max dnu value for the dnu_slider
     dnu_val = None            # Current dnu value being used
+    echelle_incremental = True  # Reuse the trimmed periodogram when only dnu changes (echelle.EchelleEngine)
+    echelle_prefetch_band = [-1, -0.1, -0.01, 0.01, 0.1, 1]  # dnu offsets whose grids are precomputed in the background
+    echelle_quantized = False  # Send the echelle image as uint8 palette indices mapped on the server instead of float64 power
+    echelle_threshold_slider = None  # Slider applying the grid threshold live (EchelleEngine.power_order)
+    echelle_smooth_width = 0.0  # Smoothing width of the echelle power, in frequency_unit; 0 disables it (echelle.smooth_power)
+    echelle_smooth_kind = 'boxcar'  # 'boxcar' (width = window) or 'gaussian' (width = standard deviation)
+    echelle_smooth_text = None  # Text input for the smoothing width
+    echelle_smooth_menu = None  # Select for the smoothing kind
+    auto_peaks_button = None    # Button filling Table 1 with the peaks above auto_peaks_snr in every slice
+    auto_peaks_snr_text = None  # Text input for the signal-to-noise ratio of the automatic peaks
+    auto_peaks_snr = 10.0       # Default signal-to-noise ratio of the automatic peaks
+    auto_peaks_separation = 0.3 # Automatic peaks closer than this (frequency_unit) to a higher one are dropped
+
+    # Delta Nu scan: collapsed echelle spectra of a range of trial dnu (echelle.dnu_scan)
+    dnu_scan_min_text = None    # Text input for the smallest trial dnu
+    dnu_scan_max_text = None    # Text input for the largest trial dnu
+    dnu_scan_step_text = None   # Text input for the step between trial dnu
+    dnu_scan_button = None      # Button starting the scan
+    dnu_scan_text = None        # Div reporting the best trial dnu
+    fig_dnu_scan = None         # Heatmap of the collapsed spectra, dnu against phase; a click sets dnu_slider
+    fig_dnu_scan_score = None   # Ridge-sharpness score against dnu
+    tb_dnu_scan = None          # CDS of the heatmap image
+    tb_dnu_scan_score = None    # CDS of the score of every trial dnu
+    dnu_scan_phase_bins = 100   # Phase bins of the collapsed echelle spectra
+    dnu_scan_max_trials = 5000  # Largest number of trial dnu of a scan
+    dnu_scan_max_elements = 2**22  # (trial, frequency) pairs binned at once; bounds the memory of a scan
 
     # Text inputs for frequency and dnu parameters
     minimum_frequency_text = None
@@ -297,17 +332,25 @@ class Environment(object):
     # These are primary elements for the echelle diagram and mode selection tab
     tb_other_periodogram = None # CDS for the main periodogram in the mode selection tab
     fig_other_periodogram = None# Figure for the main periodogram
+    tb_periodogram_display = None # CDS drawn by fig_other_periodogram: decimated rows of tb_other_periodogram
+    periodogram_lod = True      # Decimate the main periodogram to the visible window (lod.PeriodogramLOD)
+    periodogram_lod_points = 4000 # Approximate number of periodogram points sent to the browser
+    echelle_lod = True          # Send a pooled overview of large echelle images and refine the visible region (lod.EchelleLOD)
+    echelle_lod_pixels = 250000 # Pixel budget of the echelle overview and of the visible tile
+    echelle_lod_pooling = 'max' # Pooling of the overview: 'max' keeps narrow modes visible, 'mean' averages
     tb_grid_source = None       # CDS for the echelle diagram grid points
     table_se_first = None     # CDS for the first mode selection table (e.g. temporary picks)
     table_se_second = None    # CDS for the second mode selection table (e.g. final list)
     test_button = None          # Generic test button
     freq_round = 10             # Decimal places for rounding frequency values
     tb_echelle_diagram = None   # Figure object for the echelle diagram
+    tb_echelle_tile = None      # Visible tile of a large echelle image (lod.EchelleLOD)
     # Units for frequency and power, using astropy.units
     frequency_unit_string = 'uHz'
     frequency_unit = u.Unit(frequency_unit_string)
     power_unit_string = 'u.electron/u.s' # Example power unit
     power_unit = u.Unit(power_unit_string)
+    power_dtype = 'float64'     # dtype of the power columns sent to the browser ('float32' halves the payload)
 
  #  Buttons and controls for mode selection tab
     clear_se_table1_button = None # Button to clear the first selection table
@@ -324,6 +367,8 @@ class Environment(object):
     inverted_slider = None        # Slider for echelle diagram y-axis inversion or stretch
     select_color_palette = None   # Dropdown to select echelle diagram color palette
     grid_circle_size = None       # Input for size of circles on echelle diagram
+    pkb_match_tolerance_text = None # Input for the largest PKB-to-grid frequency difference accepted when loading a PKB file
+    pkb_match_tolerance = 1.0     # Default of pkb_match_tolerance_text, in frequency_unit
     clear_se_table2_button = None # Button to clear the second selection table
     # Checkboxes for various plot options
     check_color_map_lock = None   # Lock/unlock echelle color map scaling
@@ -377,11 +422,22 @@ class Environment(object):
     check_show_inverted_lines = None    # Checkbox to toggle visibility of these lines
     Message = None                      # For displaying status messages to the user (general purpose)
     message_banner = None               # A more prominent banner for messages
+    task_workers = 2                    # Number of worker threads running heavy callbacks (tasks.TaskRunner)
+    prefetch_sources = 2                # Number of catalog sources on each side of the current one prepared in the background
+    prefetch_max_bytes = 256*2**20      # Memory budget of the prepared sources (prefetch.Prefetcher)
+    metrics_window = 500                # Number of recent measurements kept per callback, stage or source (metrics.Metrics)
+    show_metrics_panel = False          # Add the 'Metrics' tab with latency percentiles (also `--args --metrics`)
+    metrics_file = 'iechelle_metrics_{session}.json'  # JSON file written by the 'Save JSON' button of the metrics tab
+    file_browser = None                 # In-page file and directory picker of the session (file_browser.FileBrowser)
+    file_browser_root = None            # Directory the file browser opens in first; None for the working directory of the server
+    file_browser_restrict = False       # Only allow files and directories below file_browser_root
+    file_browser_page_size = 200        # Entries per page of the file browser
     # Text displays for filenames of loaded data
     selected_filename_background_text = None # Displays name of loaded background parameter file
     selected_filename_pkb_text = None        # Displays name of loaded peak-bagging file
     selected_filename_fits_text = None       # Displays name of loaded FITS periodogram file
     calculate_synthetic_psd_button = None    # Button to trigger synthetic Power Spectral Density calculation
+    synthetic_cache_size = 8                 # Maximum number of synthetic spectra kept by functions.cached_synthetic_spectrum
     # For plotting generic data or results
     tb_plot = None      # CDS for a generic plot
     table_plot = None   # DataTable for a generic plot
@@ -421,3 +477,15 @@ class Environment(object):
     # wmts_map_scatter = None         # scatter for the tile server map
     # flags_control_col = None        # flags control column (visibility and flag updates)
     # show_titles = False             # Whether show titles on plots or not
+
+    def __init__(self):
+        """
+        Creates the state of one session.
+
+        Bokeh models can only belong to one document, so the models defined
+        here are created per instance instead of as class attributes.
+        """
+        from bokeh.models.widgets import Div
+        from metrics import Metrics
+        self.div_spinner = Div(text="", width=120, height=120) # Instantiation of the spinner Div
+        self.metrics = Metrics(window=self.metrics_window)  # Callback latencies and bytes pushed in this session
@@ -0,0 +1,441 @@
+"""
+Bokeh file and directory picker for the server host.
+
+The Tkinter dialogs used before opened on the machine running the Bokeh
+server and blocked its event loop, for every session, until they were
+closed; on a headless server they could not open at all. `FileBrowser` is
+drawn in the page instead:
+
+- `DirectoryListing` lists directories on the server with `os.scandir`.
+  Listings are cached per directory and modification time, sorted once
+  (directories first), filtered with shell patterns such as '*.fits' and
+  cut into pages, so that directories with tens of thousands of FITS files
+  only send one page to the browser. Only the entries of the requested page
+  are `stat`ed. One listing cache (`directory_listing`) is shared by all
+  sessions of a server process.
+- `FileBrowser` shows the pages of a directory in a DataTable and calls back
+  with the chosen file, directory or file name to save to. Listings run on
+  the worker thread of a `tasks.TaskRunner`, so the document stays
+  responsive while a large or slow (network) directory is read.
+
+Only paths below `file_browser_root` can be chosen when
+`file_browser_restrict` is set in `env.py`.
+"""
+import datetime
+import fnmatch
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from bokeh.layouts import column, row
+from bokeh.models import (Button, ColumnDataSource, DataTable, Div, NumberFormatter,
+                          TableColumn, TextInput)
+
+from tasks import TaskRunner
+
+
+def compile_patterns(pattern):
+    """
+    Compiles shell patterns into one case-insensitive regular expression.
+
+    Args:
+        pattern (str): Space-separated patterns, e.g. '*.fits *.csv'. An empty
+            string matches every name.
+
+    Returns:
+        re.Pattern: Expression matching a name if any pattern matches it.
+    """
+    patterns = pattern.split() or ['*']
+    return re.compile('|'.join(fnmatch.translate(p) for p in patterns), re.IGNORECASE)
+
+
+class DirectoryListing(object):
+    """
+    Cache of sorted and filtered directory listings, served by pages.
+    """
+
+    def __init__(self, max_directories=32, max_filters=64):
+        """
+        Initializes an empty cache.
+
+        Args:
+            max_directories (int, optional): Number of directory listings kept.
+                Defaults to 32.
+            max_filters (int, optional): Number of filtered listings kept.
+                Defaults to 64.
+        """
+        self.max_directories = max_directories
+        self.max_filters = max_filters
+        self._lock = threading.Lock()
+        self._listings = OrderedDict()
+        self._filtered = OrderedDict()
+
+    @staticmethod
+    def _remember(cache, key, value, limit):
+        """Stores a value in an LRU dict, dropping the oldest entries beyond `limit`."""
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def entries(self, path):
+        """
+        Returns the subdirectories and files of a directory.
+
+        The listing is cached until the modification time of the directory
+        changes, i.e. until an entry is added, removed or renamed.
+
+        Args:
+            path (str or Path): Directory to list.
+
+        Returns:
+            tuple: `(directories, files)`, two sorted tuples of names. Hidden
+                entries (starting with '.') are left out.
+
+        Raises:
+            OSError: If the directory cannot be read.
+        """
+        path = str(path)
+        key = (path, os.stat(path).st_mtime_ns)
+        with self._lock:
+            listing = self._listings.get(key)
+            if listing is not None:
+                self._listings.move_to_end(key)
+                return listing
+
+        directories = []
+        files = []
+        with os.scandir(path) as scan:
+            for entry in scan:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                (directories if is_dir else files).append(entry.name)
+        listing = (tuple(sorted(directories, key=str.lower)), tuple(sorted(files, key=str.lower)))
+        with self._lock:
+            self._remember(self._listings, key, listing, self.max_directories)
+        return listing
+
+    def matching(self, path, pattern='*'):
+        """
+        Returns the entries of a directory whose files match `pattern`.
+
+        Args:
+            path (str or Path): Directory to list.
+            pattern (str, optional): Space-separated shell patterns applied to
+                the files; directories are always listed. Defaults to '*'.
+
+        Returns:
+            tuple: `(names, is_dir)`: the subdirectories followed by the
+                matching files, and whether each of them is a directory.
+        """
+        directories, files = self.entries(path)
+        key = (directories, files, pattern)
+        with self._lock:
+            result = self._filtered.get(key)
+            if result is not None:
+                self._filtered.move_to_end(key)
+                return result
+
+        if pattern.split() and pattern.split() != ['*']:
+            match = compile_patterns(pattern).match
+            files = tuple(name for name in files if match(name))
+        result = (directories + files, (True,)*len(directories) + (False,)*len(files))
+        with self._lock:
+            self._remember(self._filtered, key, result, self.max_filters)
+        return result
+
+    def page(self, path, pattern='*', page=0, page_size=200):
+        """
+        Returns one page of the entries of a directory.
+
+        Args:
+            path (str or Path): Directory to list.
+            pattern (str, optional): Shell patterns of the files. Defaults to '*'.
+            page (int, optional): Page number, clipped to the last page.
+                Defaults to 0.
+            page_size (int, optional): Entries per page. Defaults to 200.
+
+        Returns:
+            dict: 'path', 'page', 'pages', 'total' and, for the entries of the
+                page, 'name', 'is_dir', 'size' (bytes, -1 for directories)
+                and 'modified' (ISO date and time).
+        """
+        names, is_dir = self.matching(path, pattern)
+        pages = max(1, -(-len(names)//page_size))
+        page = min(max(int(page), 0), pages - 1)
+        start = page*page_size
+        page_names = names[start:start + page_size]
+        sizes = []
+        modified = []
+        for name, directory in zip(page_names, is_dir[start:start + page_size]):
+            try:
+                stat = os.stat(os.path.join(path, name))
+            except OSError:
+                sizes.append(-1)
+                modified.append('')
+                continue
+            sizes.append(-1 if directory else stat.st_size)
+            modified.append(datetime.datetime.fromtimestamp(stat.st_mtime).isoformat(sep=' ', timespec='seconds'))
+        return dict(path=str(path), page=page, pages=pages, total=len(names),
+                    name=list(page_names), is_dir=list(is_dir[start:start + page_size]),
+                    size=sizes, modified=modified)
+
+    def invalidate(self, path=None):
+        """
+        Drops cached listings.
+
+        Args:
+            path (str or Path, optional): Directory whose listings are dropped.
+                Defaults to None, which empties the cache.
+        """
+        with self._lock:
+            if path is None:
+                self._listings.clear()
+            else:
+                for key in [key for key in self._listings if key[0] == str(path)]:
+                    del self._listings[key]
+            self._filtered.clear()
+
+
+# Listings shared by every session of the server process
+directory_listing = DirectoryListing()
+
+
+class FileBrowser(object):
+    """
+    In-page picker of files and directories of the server host.
+
+    The panel (`layout`) is hidden until `open` is called, and hidden again
+    once a path is chosen or the picker is cancelled.
+    """
+
+    MODES = ('file', 'directory', 'save')
+
+    def __init__(self, doc, root=None, restrict=False, page_size=200, listing=None,
+                 button_type='default'):
+        """
+        Builds the widgets of the picker.
+
+        Args:
+            doc (bokeh.document.Document): Document of the session, normally
+                `curdoc()`; listings run in the background when it is served.
+            root (str, optional): Directory the picker opens in first.
+                Defaults to None, the current working directory.
+            restrict (bool, optional): Refuse paths outside `root`. Defaults
+                to False.
+            page_size (int, optional): Entries per page. Defaults to 200.
+            listing (DirectoryListing, optional): Listing cache. Defaults to
+                None, the shared `directory_listing`.
+            button_type (str, optional): Bokeh button type. Defaults to 'default'.
+        """
+        self.root = Path(root or os.getcwd()).resolve()
+        self.restrict = restrict
+        self.page_size = page_size
+        self.listing = directory_listing if listing is None else listing
+        self.directory = self.root
+        self.page = 0
+        self.pages = 1
+        self.mode = 'file'
+        self.extension = ''
+        self.callback = None
+        self.tasks = TaskRunner(doc, report=self._report, max_workers=1)
+
+        self.title = Div(text='', width=700)
+        self.path_text = TextInput(value=str(self.directory), title='Directory', width=500)
+        self.path_text.on_change('value', self._path_entered)
+        self.pattern_text = TextInput(value='*', title='Files', width=150)
+        self.pattern_text.on_change('value', lambda attr, old, new: self.list())
+        self.up_button = Button(label='Up', button_type=button_type, width=60)
+        self.up_button.on_click(self._up)
+
+        self.source = ColumnDataSource(data=dict(name=[], kind=[], size=[], modified=[]))
+        self.source.selected.on_change('indices', self._row_selected)
+        columns = [TableColumn(field='name', title='Name', width=380),
+                   TableColumn(field='kind', title='Type', width=60),
+                   TableColumn(field='size', title='Size', width=100,
+                               formatter=NumberFormatter(format='0,0')),
+                   TableColumn(field='modified', title='Modified', width=160)]
+        self.table = DataTable(source=self.source, columns=columns, width=700, height=300,
+                               index_position=None)
+
+        self.previous_button = Button(label='<', button_type=button_type, width=40)
+        self.previous_button.on_click(lambda: self.list(page=self.page - 1))
+        self.next_button = Button(label='>', button_type=button_type, width=40)
+        self.next_button.on_click(lambda: self.list(page=self.page + 1))
+        self.page_text = Div(text='', width=300)
+
+        self.name_text = TextInput(value='', title='Name', width=500)
+        self.ok_button = Button(label='Open', button_type=button_type, width=90)
+        self.ok_button.on_click(self._ok)
+        self.cancel_button = Button(label='Cancel', button_type=button_type, width=90)
+        self.cancel_button.on_click(self.close)
+        self.status = Div(text='', width=700)
+
+        self.layout = column(self.title,
+                             row(self.up_button, self.path_text, self.pattern_text),
+                             self.table,
+                             row(self.previous_button, self.page_text, self.next_button),
+                             row(self.name_text, self.ok_button, self.cancel_button),
+                             self.status,
+                             visible=False)
+
+    def open(self, callback, mode='file', pattern='*', title='Select File', directory=None,
+             extension=''):
+        """
+        Shows the picker; `callback(path)` is called with the chosen path.
+
+        Args:
+            callback (callable): Called with the absolute path (str) of the
+                chosen file or directory, or of the file to save to.
+            mode (str, optional): 'file' (an existing file), 'directory' or
+                'save' (a new or existing file name). Defaults to 'file'.
+            pattern (str, optional): Shell patterns of the files listed, e.g.
+                '*.fits'. Defaults to '*'.
+            title (str, optional): Title of the panel. Defaults to 'Select File'.
+            directory (str, optional): Directory listed first, if it exists.
+                Defaults to None, the last directory listed.
+            extension (str, optional): Added to saved file names without an
+                extension, e.g. '.pkb'. Defaults to ''.
+
+        Raises:
+            ValueError: If `mode` is not one of `MODES`.
+        """
+        if mode not in self.MODES:
+            raise ValueError('Unknown mode {!r}, expected one of {}'.format(mode, self.MODES))
+        self.callback = callback
+        self.mode = mode
+        self.extension = extension
+        self.title.text = '<b>{}</b>'.format(title)
+        self.ok_button.label = {'file': 'Open', 'directory': 'Choose', 'save': 'Save'}[mode]
+        self.name_text.value = ''
+        self.name_text.visible = mode != 'directory'
+        self.layout.visible = True
+        self.pattern_text.value = pattern
+        if directory is not None and Path(directory).is_dir() and self._allowed(Path(directory)):
+            self.directory = Path(directory).resolve()
+        self.list(page=0)
+
+    def close(self):
+        """Hides the picker without choosing a path."""
+        self.callback = None
+        self.layout.visible = False
+
+    def shutdown(self):
+        """Stops the listing thread, e.g. when the session is destroyed."""
+        self.tasks.shutdown()
+
+    def list(self, directory=None, page=0):
+        """
+        Lists a page of a directory in the background and shows it.
+
+        Args:
+            directory (Path, optional): Directory to list. Defaults to None,
+                the current directory.
+            page (int, optional): Page number. Defaults to 0.
+        """
+        directory = self.directory if directory is None else directory
+        pattern = self.pattern_text.value
+        page_size = self.page_size
+        listing = self.listing
+
+        def work(task):
+            try:
+                return listing.page(directory, pattern=pattern, page=page, page_size=page_size)
+            except OSError as exception:
+                return dict(error='Cannot list {}: {}'.format(directory, exception))
+
+        self.status.text = 'Listing {}'.format(directory)
+        self.tasks.submit('list', work, done=self._show, label='Listing')
+
+    def _show(self, result):
+        """Shows a page returned by `DirectoryListing.page`, or its error."""
+        if 'error' in result:
+            self._report(result['error'])
+            return
+        self.directory = Path(result['path'])
+        self.page = result['page']
+        self.pages = result['pages']
+        if self.path_text.value != result['path']:
+            self.path_text.value = result['path']
+        self.source.selected.indices = []
+        self.source.data = dict(name=result['name'],
+                                kind=['dir' if d else 'file' for d in result['is_dir']],
+                                size=result['size'],
+                                modified=result['modified'])
+        self.page_text.text = 'Page {} of {} ({} entries)'.format(self.page + 1, self.pages,
+                                                                 result['total'])
+        self.status.text = ''
+
+    def _report(self, text):
+        """Shows a message in the status line of the picker."""
+        self.status.text = text
+
+    def _allowed(self, path):
+        """Tells whether `path` may be listed or chosen."""
+        if not self.restrict:
+            return True
+        path = path.resolve()
+        return path == self.root or self.root in path.parents
+
+    def _enter(self, directory):
+        """Lists another directory if it is allowed and exists."""
+        if not self._allowed(directory):
+            self._report('{} is outside {}'.format(directory, self.root))
+        elif not directory.is_dir():
+            self._report('{} is not a directory'.format(directory))
+        else:
+            self.list(directory.resolve())
+
+    def _path_entered(self, attr, old, new):
+        """Lists the directory typed in the path input."""
+        if Path(new) != self.directory:
+            self._enter(Path(new).expanduser())
+
+    def _up(self):
+        """Lists the parent directory."""
+        self._enter(self.directory.parent)
+
+    def _row_selected(self, attr, old, new):
+        """Enters a clicked directory, or copies the name of a clicked file."""
+        if not new:
+            return
+        index = new[0]
+        name = self.source.data['name'][index]
+        if self.source.data['kind'][index] == 'dir':
+            self._enter(self.directory/name)
+        elif self.mode != 'directory':
+            self.name_text.value = name
+
+    def _ok(self):
+        """Calls back with the chosen path and hides the picker."""
+        if self.mode == 'directory':
+            path = self.directory
+        else:
+            name = self.name_text.value.strip()
+            if not name:
+                self._report('Choose or type a file name')
+                return
+            path = self.directory/Path(name).expanduser()
+            if self.mode == 'save' and self.extension and not path.suffix:
+                path = path.with_suffix(self.extension)
+            if self.mode == 'file' and not path.is_file():
+                self._report('{} is not a file'.format(path))
+                return
+            if self.mode == 'save' and not path.parent.is_dir():
+                self._report('{} is not a directory'.format(path.parent))
+                return
+        if not self._allowed(path):
+            self._report('{} is outside {}'.format(path, self.root))
+            return
+        callback = self.callback
+        self.close()
+        if self.mode == 'save':
+            self.listing.invalidate(path.parent)
+        if callback is not None:
+            callback(str(path.resolve()))
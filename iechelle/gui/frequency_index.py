@@ -0,0 +1,201 @@
+"""
+Defines the FrequencyIndex class, which maps frequencies to rows of the plot sources.
+
+Mode assignment and cross-plot selection repeatedly need to find the rows of
+the periodogram and of the echelle grid holding a handful of frequencies.
+Instead of rounding whole columns and running a pandas membership query, the
+index assigns every frequency bin of the trimmed periodogram an integer bin
+id (its row in `tb_other_periodogram`) once per trim. The echelle grid carries
+the bin id of each of its points in a 'bin' column, from which a dense
+bin-to-grid-row map is built once per grid. A lookup then costs a binary
+search per requested frequency and an array access per bin.
+"""
+import numpy as np
+
+
+class FrequencyIndex(object):
+    """
+    Bin-id index of the trimmed periodogram and of the echelle grid.
+
+    Frequencies are matched the way the selection tables always compared
+    them: two frequencies are the same bin when they are equal once rounded
+    to `decimals` places.
+    """
+
+    def __init__(self, decimals=10):
+        """
+        Initializes an empty index.
+
+        Args:
+            decimals (int, optional): Number of decimal places used to decide
+                whether a frequency matches a bin. Defaults to 10.
+        """
+        self.decimals = decimals
+        self.freq = np.array([])
+        self._grid_bins = None
+        self._grid_rows = np.array([], dtype=np.int64)
+
+    def __len__(self):
+        return self.freq.size
+
+    def set_periodogram(self, freq):
+        """
+        Indexes the frequencies of the trimmed periodogram.
+
+        Must be called every time `tb_other_periodogram` is replaced. Bin id
+        `i` is row `i` of the periodogram.
+
+        Args:
+            freq (array-like): Increasing frequency values of the periodogram.
+        """
+        self.freq = np.ascontiguousarray(freq, dtype=np.float64)
+        self._grid_bins = None
+        self._grid_rows = np.full(self.freq.size, -1, dtype=np.int64)
+
+    def lookup(self, frequencies):
+        """
+        Returns the bin id of every frequency, or -1 where there is no match.
+
+        Args:
+            frequencies (array-like): Frequencies to look up, in the unit of the
+                indexed periodogram.
+
+        Returns:
+            numpy.ndarray: Bin ids, one per input frequency, in input order.
+        """
+        frequencies = np.asarray(frequencies, dtype=np.float64).reshape(-1)
+        if frequencies.size == 0 or self.freq.size == 0:
+            return np.full(frequencies.size, -1, dtype=np.int64)
+
+        if self.freq.size == 1:
+            nearest = np.zeros(frequencies.size, dtype=np.int64)
+        else:
+            right = np.clip(np.searchsorted(self.freq, frequencies), 1, self.freq.size - 1)
+            left = right - 1
+            nearest = np.where(np.abs(self.freq[left] - frequencies) <= np.abs(self.freq[right] - frequencies),
+                               left, right)
+        match = np.round(self.freq[nearest], self.decimals) == np.round(frequencies, self.decimals)
+        return np.where(match, nearest, -1)
+
+    def bins(self, frequencies):
+        """
+        Returns the bin ids of frequencies present in the periodogram.
+
+        Args:
+            frequencies (array-like): Frequencies to look up.
+
+        Returns:
+            numpy.ndarray: Sorted, unique bin ids of the frequencies that match
+                a bin. Frequencies without a match are ignored.
+        """
+        ids = self.lookup(frequencies)
+        return np.unique(ids[ids >= 0])
+
+    def periodogram_rows(self, frequencies):
+        """
+        Returns the periodogram rows holding the given frequencies.
+
+        Args:
+            frequencies (array-like): Frequencies to look up.
+
+        Returns:
+            numpy.ndarray: Sorted row indices into `tb_other_periodogram`.
+        """
+        return self.bins(frequencies)
+
+    def grid_lookup(self, grid_bins, bins):
+        """
+        Returns the echelle grid row of every bin, or -1 where it is not in the grid.
+
+        The bin-to-row map is rebuilt only when `grid_bins` is a different
+        array from the previous call, i.e. when the grid source was replaced.
+
+        Args:
+            grid_bins (numpy.ndarray): The 'bin' column of `tb_grid_source`.
+            bins (array-like): Bin ids to look up.
+
+        Returns:
+            numpy.ndarray: Row indices into `tb_grid_source`, one per input bin,
+                in input order.
+        """
+        if grid_bins is not self._grid_bins:
+            grid_bins_array = np.asarray(grid_bins, dtype=np.int64)
+            self._grid_rows = np.full(self.freq.size, -1, dtype=np.int64)
+            valid = (grid_bins_array >= 0) & (grid_bins_array < self.freq.size)
+            self._grid_rows[grid_bins_array[valid]] = np.flatnonzero(valid)
+            self._grid_bins = grid_bins
+
+        bins = np.asarray(bins, dtype=np.int64).reshape(-1)
+        inside = (bins >= 0) & (bins < self._grid_rows.size)
+        rows = np.full(bins.size, -1, dtype=np.int64)
+        rows[inside] = self._grid_rows[bins[inside]]
+        return rows
+
+    def grid_rows(self, grid_bins, bins):
+        """
+        Returns the echelle grid rows holding the given bins.
+
+        Args:
+            grid_bins (numpy.ndarray): The 'bin' column of `tb_grid_source`.
+            bins (array-like): Bin ids to look up.
+
+        Returns:
+            numpy.ndarray: Sorted row indices into `tb_grid_source`. Bins that
+                are not part of the grid are ignored.
+        """
+        rows = self.grid_lookup(grid_bins, bins)
+        return np.sort(rows[rows >= 0])
+
+    def grid_rows_of(self, grid_bins, frequencies):
+        """
+        Returns the echelle grid rows holding the given frequencies.
+
+        Args:
+            grid_bins (numpy.ndarray): The 'bin' column of `tb_grid_source`.
+            frequencies (array-like): Frequencies to look up.
+
+        Returns:
+            numpy.ndarray: Sorted row indices into `tb_grid_source`.
+        """
+        return self.grid_rows(grid_bins, self.bins(frequencies))
+
+
+def match_nearest(values, targets):
+    """
+    Finds the nearest element of `values` for every target in one vectorized call.
+
+    `values` is sorted once (unless it already is) and every target is placed
+    with a binary search, so matching k targets against n values costs
+    O((n + k) log n) instead of the O(n k) of scanning `values` per target.
+    Ties are resolved towards the lower value.
+
+    Args:
+        values (array-like): Values to match against, e.g. the frequencies of
+            the echelle grid.
+        targets (array-like): Values to match, e.g. PKB mode frequencies.
+
+    Returns:
+        tuple: A tuple containing:
+            - rows (numpy.ndarray): Position in `values` of the nearest element
+              of every target, or -1 when `values` is empty.
+            - distance (numpy.ndarray): Absolute distance to that element
+              (inf when `values` is empty).
+    """
+    values = np.asarray(values, dtype=np.float64).reshape(-1)
+    targets = np.asarray(targets, dtype=np.float64).reshape(-1)
+    if values.size == 0:
+        return (np.full(targets.size, -1, dtype=np.int64),
+                np.full(targets.size, np.inf))
+
+    if values.size > 1 and np.any(np.diff(values) < 0):
+        order = np.argsort(values, kind='stable')
+    else:
+        order = np.arange(values.size)
+    ordered = values[order]
+
+    right = np.clip(np.searchsorted(ordered, targets), 0, ordered.size - 1)
+    left = np.clip(right - 1, 0, ordered.size - 1)
+    nearest = np.where(np.abs(ordered[left] - targets) <= np.abs(ordered[right] - targets),
+                       left, right)
+    rows = order[nearest]
+    return rows, np.abs(values[rows] - targets)
@@ -4,13 +4,19 @@ Provides utility functions for the iEchelle application, primarily for astrophys
 
 This module currently contains functions for generating synthetic power spectra
 based on observed data and model parameters, utilizing libraries such as
-Apollinaire, NumPy, and Pandas.
+Apollinaire, NumPy, and Pandas, together with a small memoization layer that
+avoids recomputing a synthetic spectrum whose inputs have not changed.
 """
-import apollinaire as apn
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
 from astropy import units as u
 from env import Environment as env
+from periodogram_store import periodogram_store
 
 def calculate_synthetic_spectrum(fits_file=None, bkg_file=None, pkb_file=None, n_harvey=2):
     """
@@ -54,28 +60,23 @@ def calculate_synthetic_spectrum(fits_file=None, bkg_file=None, pkb_file=None, n
     Notes:
         - Relies on `env.frequency_unit` and `env.power_unit` (from `env.py`)
           for unit conversions.
+        - The observed periodogram is read through `periodogram_store`, so the
+          FITS file is not read again if it is already cached.
         - Uses `apollinaire.synthetic.create_synthetic_psd` for the core
           calculation.
     """
+    # apollinaire takes seconds to import, so it is only loaded when a spectrum is computed
+    import apollinaire as apn
+
     param_back = np.loadtxt (bkg_file)[:,0]
     pkb = np.loadtxt (pkb_file)
-    from astropy.io import fits
-    import pandas
-    with fits.open(
-        fits_file
-        ) as data:
-        df = pandas.DataFrame(data[0].data)
-
-        ff = df[0].values
-        pp = df[1].values
-        ff = ff.byteswap().newbyteorder()
-        pp = pp.byteswap().newbyteorder()
-
-        f = (ff*u.Hz).to(env.frequency_unit)
-        p = pp*env.power_unit
-        
-        ff = f.value
-        pp = p.value
+    ff, pp = periodogram_store.get(fits_file)
+
+    f = (ff*u.Hz).to(env.frequency_unit)
+    p = pp*env.power_unit
+
+    ff = f.value
+    pp = p.value
     freq = ff
     noise_free, entropy = apn.synthetic.create_synthetic_psd (freq, pkb, param_back=param_back,
                                                          noise_free=True,n_harvey=n_harvey)
@@ -91,4 +92,142 @@ def calculate_synthetic_spectrum(fits_file=None, bkg_file=None, pkb_file=None, n
     return data_frame
 
 
-    
+_synthetic_cache = OrderedDict()
+_synthetic_cache_lock = threading.Lock()
+_digest_cache = {}
+
+
+def file_digest(filename):
+    """
+    Returns the SHA-1 digest of a file's content.
+
+    Digests are memoized on the file's absolute path, modification time and
+    size, so a file is only hashed again after it changed on disk.
+
+    Args:
+        filename (str or Path): Path of the file to hash.
+
+    Returns:
+        str: Hexadecimal SHA-1 digest of the file content.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    path = os.path.abspath(str(filename))
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _digest_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    _digest_cache[path] = (signature, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def cached_synthetic_spectrum(fits_file=None, bkg_file=None, pkb_file=None, n_harvey=2):
+    """
+    Memoized version of `calculate_synthetic_spectrum`.
+
+    Results are keyed on the content digests of the FITS, background and PKB
+    files together with `n_harvey`, so the synthetic model is only computed
+    again when one of its inputs actually changed. The cache is bounded by
+    `env.synthetic_cache_size` entries and evicts the least recently used
+    spectrum first.
+
+    Args:
+        fits_file (str, optional): Path to the observed periodogram FITS file.
+        bkg_file (str, optional): Path to the background parameter file.
+        pkb_file (str, optional): Path to the peak-bagging parameter file.
+        n_harvey (int, optional): Number of Harvey-like background components.
+            Defaults to 2.
+
+    Returns:
+        pandas.DataFrame: A shallow copy of the cached DataFrame returned by
+            `calculate_synthetic_spectrum`. Columns can be added to it without
+            affecting the cache, but its values must not be modified in place.
+    """
+    key = (file_digest(fits_file), file_digest(bkg_file),
+           file_digest(pkb_file), int(n_harvey))
+    with _synthetic_cache_lock:
+        data_frame = _synthetic_cache.get(key)
+        if data_frame is not None:
+            _synthetic_cache.move_to_end(key)
+            return data_frame.copy(deep=False)
+
+    data_frame = calculate_synthetic_spectrum(fits_file=fits_file,
+                                              bkg_file=bkg_file,
+                                              pkb_file=pkb_file,
+                                              n_harvey=n_harvey)
+    with _synthetic_cache_lock:
+        _synthetic_cache[key] = data_frame
+        _synthetic_cache.move_to_end(key)
+        while len(_synthetic_cache) > max(int(env.synthetic_cache_size), 1):
+            _synthetic_cache.popitem(last=False)
+    return data_frame.copy(deep=False)
+
+
+def float_column(values, power=False):
+    """
+    Converts values into a typed NumPy column for a ColumnDataSource.
+
+    Bokeh sends NumPy arrays of numbers to the browser as binary buffers,
+    whereas Python lists are encoded number by number as JSON. Every large
+    plot source should therefore be filled with the arrays returned here.
+
+    Args:
+        values (array-like): Numeric values of the column.
+        power (bool, optional): True for a power column, which is stored with
+            the dtype named by `env.power_dtype` (e.g. 'float32' to halve the
+            payload). Defaults to False, which stores float64.
+
+    Returns:
+        numpy.ndarray: A contiguous one-dimensional array.
+    """
+    dtype = np.dtype(env.power_dtype) if power else np.float64
+    return np.ascontiguousarray(values, dtype=dtype).reshape(-1)
+
+
+def mode_column(size, mode='999'):
+    """
+    Returns a 'Mode' column where every point carries the same mode label.
+
+    Args:
+        size (int): Number of points.
+        mode (str, optional): Mode label. Defaults to '999' (no mode).
+
+    Returns:
+        numpy.ndarray: An object array of mode labels.
+    """
+    return np.full(int(size), str(mode), dtype=object)
+
+
+def frame_columns(data_frame, power_columns=('power', 'power_values')):
+    """
+    Converts a DataFrame into ColumnDataSource data made of NumPy arrays.
+
+    This replaces `data_frame.to_dict('list')`, which turns every value into
+    a Python object and defeats Bokeh's binary transport.
+
+    Args:
+        data_frame (pandas.DataFrame): Frame read from a plot source, e.g. with
+            `ColumnDataSource.to_df()`.
+        power_columns (tuple, optional): Names of the columns holding power
+            values, stored with `env.power_dtype`.
+
+    Returns:
+        dict: Column name to NumPy array.
+    """
+    data = {}
+    for name in data_frame.columns:
+        values = data_frame[name].to_numpy()
+        if values.dtype.kind == 'f':
+            data[name] = float_column(values, power=name in power_columns)
+        elif values.dtype.kind in 'iu':
+            data[name] = np.ascontiguousarray(values, dtype=np.int64)
+        else:
+            data[name] = values.astype(object)
+    return data
@@ -0,0 +1,415 @@
+"""
+Provides level-of-detail (LOD) decimation for the main periodogram figure.
+
+A periodogram can hold millions of bins, far more than the few thousand
+pixel columns of the figure. `m4_indices` implements the M4 aggregation: the
+visible frequency window is split into one bucket per pixel column and only
+the first, last, minimum and maximum point of every bucket are kept, which
+draws exactly the same line and envelope as the full data at that zoom level.
+
+`PeriodogramLOD` keeps the full-resolution periodogram in a server-side
+`ColumnDataSource` and feeds the figure from a small display source holding
+the decimated rows of the current x-range. Each displayed row carries its
+'bin' (its row in the full source), so selections made in the browser are
+translated back to full-resolution rows, and selections made on the server
+are shown in the browser.
+
+The echelle image has the same problem in two dimensions. `image_pyramid`
+pools it (max or mean over blocks) into successively halved levels;
+`EchelleLOD` sends the coarsest level that fits a pixel budget as an overview
+of the whole image, then a tile of a finer level covering only the visible
+x/y range, drawn on top of the overview.
+"""
+import numpy as np
+
+
+def m4_indices(x, y, start=None, stop=None, n_buckets=1000):
+    """
+    Returns the rows kept by M4 decimation of a window of a sorted series.
+
+    Args:
+        x (numpy.ndarray): Increasing x values (frequencies).
+        y (numpy.ndarray): y values (power), same size as `x`.
+        start (float, optional): Lower edge of the window. Defaults to None,
+            which starts at the first point.
+        stop (float, optional): Upper edge of the window. Defaults to None,
+            which stops at the last point.
+        n_buckets (int, optional): Number of buckets, normally the number of
+            pixel columns of the figure. Defaults to 1000.
+
+    Returns:
+        numpy.ndarray: Sorted row indices. The point just outside each edge of
+            the window is included so that lines leave the window correctly.
+            Windows with no more than `4*n_buckets` points are returned whole.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if x.size == 0:
+        return np.array([], dtype=np.int64)
+    start = x[0] if start is None else start
+    stop = x[-1] if stop is None else stop
+    if stop < start:
+        start, stop = stop, start
+
+    i0 = max(int(np.searchsorted(x, start, side='left')) - 1, 0)
+    i1 = min(int(np.searchsorted(x, stop, side='right')) + 1, x.size)
+    if i1 - i0 <= 4*n_buckets:
+        return np.arange(i0, i1, dtype=np.int64)
+
+    xw = x[i0:i1]
+    yw = y[i0:i1]
+    width = (xw[-1] - xw[0]) / n_buckets
+    if width <= 0:
+        return np.arange(i0, i1, dtype=np.int64)
+    edges = xw[0] + width*np.arange(1, n_buckets)
+    starts = np.unique(np.concatenate(([0], np.searchsorted(xw, edges, side='left'))))
+    starts = starts[starts < xw.size]
+    counts = np.diff(np.append(starts, xw.size))
+    bucket = np.repeat(np.arange(starts.size), counts)
+
+    keep = [starts, starts + counts - 1]
+    for extreme in (np.minimum.reduceat(yw, starts), np.maximum.reduceat(yw, starts)):
+        rows = np.flatnonzero(yw == extreme[bucket])
+        _, first = np.unique(bucket[rows], return_index=True)
+        keep.append(rows[first])
+    return i0 + np.unique(np.concatenate(keep))
+
+
+class PeriodogramLOD(object):
+    """
+    Feeds a figure with a decimated view of a full-resolution periodogram source.
+
+    The full source (`full`) is not drawn; it keeps every bin server-side and
+    its row numbers and `selected.indices` keep their usual meaning for the
+    rest of the application. The display source (`display`) holds the rows
+    returned by `m4_indices` for the current window, the rows carrying a mode
+    label and the selected rows, together with a 'bin' column mapping them
+    back to `full`.
+    """
+
+    def __init__(self, full, display, n_points=4000, enabled=True, empty_mode='999'):
+        """
+        Connects a full-resolution source to its display source.
+
+        Args:
+            full (ColumnDataSource): Source with 'frequency', 'power' and 'Mode'.
+            display (ColumnDataSource): Source drawn by the figure glyphs.
+            n_points (int, optional): Approximate number of points sent for the
+                visible window. Defaults to 4000.
+            enabled (bool, optional): If False, every row is displayed.
+                Defaults to True.
+            empty_mode (str, optional): Mode label of unlabelled rows.
+                Defaults to '999'.
+        """
+        self.full = full
+        self.display = display
+        self.n_points = n_points
+        self.enabled = enabled
+        self.empty_mode = empty_mode
+        self.start = None
+        self.stop = None
+        self._size = len(full.data['frequency'])
+        self._syncing = False
+
+        self.full.on_change('data', self._on_full_data)
+        self.full.selected.on_change('indices', self._on_full_selection)
+        self.display.selected.on_change('indices', self._on_display_selection)
+        self.refresh()
+
+    def set_window(self, start=None, stop=None):
+        """
+        Sets the visible frequency window and refreshes the display source.
+
+        Args:
+            start (float, optional): Lower edge. None means the first bin.
+            stop (float, optional): Upper edge. None means the last bin.
+        """
+        self.start = start
+        self.stop = stop
+        self.refresh()
+
+    def rows(self):
+        """
+        Returns the rows of the full source to display for the current window.
+
+        Returns:
+            numpy.ndarray: Sorted row indices into `full`.
+        """
+        freq = np.asarray(self.full.data['frequency'])
+        if not self.enabled:
+            return np.arange(freq.size, dtype=np.int64)
+        power = np.asarray(self.full.data['power'])
+        rows = m4_indices(freq, power, self.start, self.stop, max(self.n_points // 4, 1))
+        if rows.size:
+            lo = freq[rows[0]]
+            hi = freq[rows[-1]]
+            modes = np.asarray(self.full.data['Mode'], dtype=object)
+            labelled = np.flatnonzero(modes != self.empty_mode)
+            selected = np.asarray(self.full.selected.indices, dtype=np.int64)
+            extra = np.concatenate((labelled, selected[(selected >= 0) & (selected < freq.size)]))
+            extra = extra[(freq[extra] >= lo) & (freq[extra] <= hi)]
+            rows = np.union1d(rows, extra)
+        return rows
+
+    def refresh(self):
+        """Recomputes the display source from the full source."""
+        rows = self.rows()
+        data = self.full.data
+        self._syncing = True
+        try:
+            self.display.data = dict(
+                frequency=np.asarray(data['frequency'])[rows],
+                power=np.asarray(data['power'])[rows],
+                Mode=np.asarray(data['Mode'], dtype=object)[rows],
+                bin=rows,
+            )
+            self._select_display(rows)
+        finally:
+            self._syncing = False
+
+    def _select_display(self, rows):
+        """Shows the selection of the full source on the display source."""
+        selected = np.asarray(self.full.selected.indices, dtype=np.int64)
+        position = np.searchsorted(rows, selected)
+        inside = position < rows.size
+        position = position[inside]
+        position = position[rows[position] == selected[inside]]
+        self.display.selected.indices = np.sort(position).tolist()
+
+    def _on_full_data(self, attr, old, new):
+        """Refreshes the display after the full source changed."""
+        size = len(self.full.data['frequency'])
+        if size != self._size:
+            # A new periodogram: show it whole
+            self._size = size
+            self.start = None
+            self.stop = None
+        self.refresh()
+
+    def _on_full_selection(self, attr, old, new):
+        """Mirrors a server-side selection of the full source on the display source."""
+        if self._syncing:
+            return
+        rows = np.asarray(self.display.data['bin'], dtype=np.int64)
+        selected = np.asarray(new, dtype=np.int64)
+        if np.isin(selected, rows).all():
+            self._syncing = True
+            try:
+                self._select_display(rows)
+            finally:
+                self._syncing = False
+        else:
+            self.refresh()
+
+    def _on_display_selection(self, attr, old, new):
+        """Translates a browser selection on the display source to full-resolution rows."""
+        if self._syncing:
+            return
+        rows = np.asarray(self.display.data['bin'], dtype=np.int64)
+        hidden = np.setdiff1d(np.asarray(self.full.selected.indices, dtype=np.int64), rows)
+        chosen = rows[np.asarray(new, dtype=np.int64)]
+        self._syncing = True
+        try:
+            self.full.selected.indices = np.union1d(hidden, chosen).tolist()
+        finally:
+            self._syncing = False
+
+
+def pool_image(image, fy, fx, how='max'):
+    """
+    Downsamples an image by pooling blocks of `fy` rows by `fx` columns.
+
+    Edge blocks are padded with the last row or column, so the output has
+    `ceil(ny/fy)` rows and `ceil(nx/fx)` columns.
+
+    Args:
+        image (numpy.ndarray): 2D image.
+        fy (int): Pooling factor along rows.
+        fx (int): Pooling factor along columns.
+        how (str, optional): 'max' keeps the highest value of every block,
+            so that narrow modes stay visible; 'mean' averages them. Defaults
+            to 'max'.
+
+    Returns:
+        numpy.ndarray: The pooled image, with the dtype of `image`.
+    """
+    ny, nx = image.shape
+    pad_y = -ny % fy
+    pad_x = -nx % fx
+    if pad_y or pad_x:
+        image = np.pad(image, ((0, pad_y), (0, pad_x)), mode='edge')
+    blocks = image.reshape(image.shape[0]//fy, fy, image.shape[1]//fx, fx)
+    if how == 'max':
+        return np.fmax.reduce(np.fmax.reduce(blocks, axis=3), axis=1)
+    if how == 'mean':
+        pooled = blocks.mean(axis=(1, 3))
+        if np.issubdtype(image.dtype, np.integer):
+            pooled = np.rint(pooled)
+        return pooled.astype(image.dtype)
+    raise ValueError("how must be 'max' or 'mean', got {!r}".format(how))
+
+
+def image_pyramid(image, max_pixels, how='max'):
+    """
+    Builds the levels of an image pyramid down to a pixel budget.
+
+    Every level halves the longer side (in pixels) of the previous one,
+    until a level holds no more than `max_pixels` pixels.
+
+    Args:
+        image (numpy.ndarray): 2D full-resolution image (level 0).
+        max_pixels (int): Pixel budget of the coarsest level.
+        how (str, optional): Pooling, 'max' or 'mean'. Defaults to 'max'.
+
+    Returns:
+        list: `(level, fy, fx)` tuples from full resolution to coarsest,
+            where `fy` and `fx` are the pooling factors relative to `image`.
+    """
+    levels = [(image, 1, 1)]
+    while levels[-1][0].size > max(max_pixels, 1) and max(levels[-1][0].shape) > 1:
+        level, fy, fx = levels[-1]
+        if level.shape[1] >= level.shape[0]:
+            levels.append((pool_image(level, 1, 2, how), fy, fx*2))
+        else:
+            levels.append((pool_image(level, 2, 1, how), fy*2, fx))
+    return levels
+
+
+class EchelleLOD(object):
+    """
+    Feeds the echelle figure with a pooled overview and a refined visible tile.
+
+    The full-resolution image stays on the server. `set_image` returns the
+    overview, the coarsest pyramid level within `max_pixels`, to be stored
+    in the echelle source; `refresh` fills the tile source (columns 'image',
+    'x', 'y', 'dw', 'dh') with the finest level whose crop of the visible
+    window fits `max_pixels`, or empties it when the overview is already as
+    fine as that.
+    """
+
+    def __init__(self, tile, max_pixels=250000, how='max', enabled=True):
+        """
+        Connects the tile source.
+
+        Args:
+            tile (ColumnDataSource): Source of the image glyph drawn over the overview.
+            max_pixels (int, optional): Pixel budget of the overview and of
+                the tile. Defaults to 250000.
+            how (str, optional): Pooling, 'max' or 'mean'. Defaults to 'max'.
+            enabled (bool, optional): If False, the overview is the full image
+                and no tile is sent. Defaults to True.
+        """
+        self.tile = tile
+        self.max_pixels = max_pixels
+        self.how = how
+        self.enabled = enabled
+        self.image = None
+        self.extent = None
+        self.window = None
+        self._levels = None
+
+    def set_image(self, image, xmin, ymin, dw, dh):
+        """
+        Replaces the full-resolution image and returns its overview.
+
+        Args:
+            image (numpy.ndarray): 2D full-resolution image.
+            xmin (float): x-coordinate of the left edge of the image.
+            ymin (float): y-coordinate of the bottom edge of the image.
+            dw (float): Width of the image in data units.
+            dh (float): Height of the image in data units.
+
+        Returns:
+            dict: 'image', 'dw' and 'dh' of the overview. The overview of an
+                image whose size is not a multiple of the pooling factors
+                extends slightly beyond `dw` and `dh`, so that its pixels
+                keep their positions.
+        """
+        self.image = np.asarray(image)
+        self.extent = (xmin, ymin, dw, dh)
+        self._levels = None
+        return self.overview()
+
+    def levels(self):
+        """Returns the pyramid of the current image, built on first use."""
+        if self._levels is None:
+            if not self.enabled or self.image is None or self.image.ndim != 2:
+                self._levels = [(self.image, 1, 1)]
+            else:
+                self._levels = image_pyramid(self.image, self.max_pixels, self.how)
+        return self._levels
+
+    def _extent_of(self, level, fy, fx, rows=None, cols=None):
+        """Returns (x, y, dw, dh) of a block of rows and columns of a pyramid level."""
+        xmin, ymin, dw, dh = self.extent
+        ny, nx = self.image.shape
+        pixel_w = dw/nx*fx
+        pixel_h = dh/ny*fy
+        r0, r1 = (0, level.shape[0]) if rows is None else rows
+        c0, c1 = (0, level.shape[1]) if cols is None else cols
+        return xmin + c0*pixel_w, ymin + r0*pixel_h, (c1 - c0)*pixel_w, (r1 - r0)*pixel_h
+
+    def overview(self):
+        """Returns 'image', 'dw' and 'dh' of the coarsest pyramid level."""
+        level, fy, fx = self.levels()[-1]
+        _, _, dw, dh = self._extent_of(level, fy, fx)
+        return dict(image=level, dw=dw, dh=dh)
+
+    def set_window(self, x0=None, x1=None, y0=None, y1=None):
+        """
+        Sets the visible range of the figure and refreshes the tile.
+
+        Args:
+            x0, x1, y0, y1 (float, optional): Visible range. None shows the
+                overview only.
+        """
+        if None in (x0, x1, y0, y1):
+            self.window = None
+        else:
+            self.window = (min(x0, x1), max(x0, x1), min(y0, y1), max(y0, y1))
+        self.refresh()
+
+    def visible_tile(self):
+        """
+        Returns the finest crop of the visible window within the pixel budget.
+
+        Returns:
+            tuple: `(image, x, y, dw, dh)`, or None when no level finer than
+                the overview fits the budget or nothing is visible.
+        """
+        levels = self.levels()
+        if self.window is None or len(levels) == 1:
+            return None
+        xmin, ymin, dw, dh = self.extent
+        x0, x1, y0, y1 = self.window
+        ny, nx = self.image.shape
+        # Visible rows and columns in full-resolution pixels
+        c0 = max(int(np.floor((x0 - xmin)/dw*nx)), 0)
+        c1 = min(int(np.ceil((x1 - xmin)/dw*nx)), nx)
+        r0 = max(int(np.floor((y0 - ymin)/dh*ny)), 0)
+        r1 = min(int(np.ceil((y1 - ymin)/dh*ny)), ny)
+        if c1 <= c0 or r1 <= r0:
+            return None
+        for level, fy, fx in levels[:-1]:
+            rows = (r0//fy, -(-r1//fy))
+            cols = (c0//fx, -(-c1//fx))
+            if (rows[1] - rows[0])*(cols[1] - cols[0]) <= self.max_pixels:
+                crop = np.ascontiguousarray(level[rows[0]:rows[1], cols[0]:cols[1]])
+                return (crop,) + self._extent_of(level, fy, fx, rows, cols)
+        return None
+
+    def refresh(self):
+        """Sends the tile of the visible window, or an empty tile."""
+        tile = self.visible_tile() if self.image is not None else None
+        if tile is None:
+            if len(self.tile.data['image']):
+                self.tile.data = dict(image=[], x=[], y=[], dw=[], dh=[])
+            return
+        image, x, y, dw, dh = tile
+        self.tile.data = dict(image=[image], x=[x], y=[y], dw=[dw], dh=[dh])
+
+    def clear(self):
+        """Forgets the image and empties the tile."""
+        self.image = None
+        self._levels = None
+        self.refresh()
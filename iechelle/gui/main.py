@@ -6,7 +6,14 @@ This script initializes the different UI components from other modules
 Bokeh layout functions (row, column, Tabs, TabPanel), and adds the
 root layout to the current document (`curdoc()`) to be served by Bokeh.
 """
+import importlib
 import sys
+import threading
+import time
+# Startup timing: the first session of a server process also pays for importing
+# the GUI modules; later sessions find them in sys.modules
+startup_begin = time.perf_counter()
+startup_cold = 'mode_selection' not in sys.modules
 # Import Bokeh layout and model objects
 from bokeh.layouts import row, column
 # from bokeh.layouts import grid # grid is not used, can be removed
@@ -23,14 +30,30 @@ from bokeh.models.layouts import TabPanel, Tabs
 # Import custom GUI components
 from catalog import Catalog
 from env import Environment
+from metrics import MetricsPanel
 from mode_selection import Interactive
+startup_steps = [('imports', time.perf_counter())]
 
 # Instantiate the environment, catalog, and interactive mode selection components
-# These objects will hold shared data and UI elements.
-env = Environment
-Environment()  # Instantiates and likely registers shared elements within the Environment class itself
-Catalog()      # Instantiates and sets up catalog-related UI and logic
-Interactive()  # Instantiates and sets up interactive analysis UI and logic
+# Bokeh runs this script once per session, so every browser session gets its own
+# Environment holding its data and UI elements; loaded periodograms and synthetic
+# spectra are cached at module level and shared by all sessions.
+env = Environment()  # State of this session
+startup_steps.append(('Environment', time.perf_counter()))
+Catalog(env)         # Instantiates and sets up catalog-related UI and logic
+startup_steps.append(('Catalog', time.perf_counter()))
+interactive = Interactive(env)  # Instantiates and sets up interactive analysis UI and logic
+startup_steps.append(('Interactive', time.perf_counter()))
+
+
+def session_destroyed(session_context, interactive=interactive, env=env):
+    """Stops the thread pools of this session and drops its prefetched data."""
+    # Bound as defaults: Bokeh clears the globals of this script once it has run
+    interactive.shutdown()
+    env.file_browser.shutdown()
+
+
+curdoc().on_session_destroyed(session_destroyed)
 
 # --- Interactive Tab Layout ---
 # This section defines the layout for the main interactive analysis tab.
@@ -54,12 +77,15 @@ tab_int_1 = column(
         env.dnu_slider, # Delta Nu slider
         env.r_button,   # Dnu small increment
         env.rr_button), # Dnu large increment
+    row(env.echelle_threshold_slider), # Live threshold of the echelle grid
     # Row for frequency range and dnu text inputs
     row(env.frequency_minimum_text,
         env.frequency_maximum_text,
         env.frequency_maxdnu_text,
         env.dnu_text,
-        env.echelle_noise_cuttoff_text), # Threshold input for echelle grid
+        env.echelle_noise_cuttoff_text, # Threshold input for echelle grid
+        env.echelle_smooth_text,  # Smoothing width of the echelle power (0: none)
+        env.echelle_smooth_menu), # Boxcar or Gaussian smoothing
     # Row for update button, next/prev source, color palette, and echelle display options
     row(env.update_int_button, # Button to update plots based on text inputs
         nxt_prv_button,        # Re-use of next/previous source buttons for this section
@@ -72,7 +98,15 @@ tab_int_1 = column(
         env.check_show_echelle,     # Checkbox to show/hide the echelle diagram image itself
         env.grid_circle_size,       # Input for echelle grid marker size
         env.check_show_horizontal_lines, # Checkbox for horizontal lines (e.g. l=0,1,2) on periodogram
-        )
+        ),
+    # Delta Nu scan: range inputs, heatmap of the collapsed echelle spectra and their score
+    row(env.dnu_scan_min_text,
+        env.dnu_scan_max_text,
+        env.dnu_scan_step_text,
+        env.dnu_scan_button,     # Scans the range in the background
+        env.dnu_scan_text),      # Best trial Delta Nu
+    row(env.fig_dnu_scan,        # Clicking the heatmap or the score sets the Delta Nu slider
+        env.fig_dnu_scan_score),
 )
 
 # Final layout for the interactive echelle diagram and its controls
@@ -96,7 +130,8 @@ layer_1 = column(next_dflt_lay) # Wrapping a single column in another column
 layout_catalog = column(
     # File selection for main FITS data (observed periodogram)
     row(
-        env.open_file_button, # Button to trigger file dialog for FITS
+        env.open_file_button, # Button to open the file browser for FITS
+        env.open_catalog_button, # Button to load a catalog (CSV with path_fits) to browse with next/previous
         env.selected_filename_text, # Displays selected FITS file path
     ),
     # File selection for background parameters
@@ -108,7 +143,9 @@ layout_catalog = column(
     row(
         env.load_from_specific_file_table_2_button, # Button to load PKB file for table 2
         env.selected_filename_pkb_text,          # Displays selected PKB file path
+        env.pkb_match_tolerance_text,            # Largest frequency difference accepted when matching PKB modes to the grid
     ),
+    env.file_browser.layout, # In-page file browser, shown by the file buttons above and by 'Save As'
     env.message_banner, # Banner for status messages and current source ID
     # Main row containing the interactive echelle/periodogram and mode selection tables/controls
     row(
@@ -140,6 +177,8 @@ layout_catalog = column(
                     Div(text="",width=150,height=100), # Spacer Div
                     env.test_button, # "Get Selection" - populates Table 1 from plot selections
                     env.find_peaks_button, # Finds peaks in selected echelle regions for Table 1
+                    env.auto_peaks_button, # Finds the peaks above a S/N in every slice for Table 1
+                    env.auto_peaks_snr_text, # Signal-to-noise ratio of the automatic peaks
                     env.clear_se_table1_button, # Clears Table 1
                     env.clear_se_grid_prd_button, # Clears selections on periodogram and echelle grid
                     env.select_mode_menu, # Dropdown to assign mode type (l-value)
@@ -187,5 +226,29 @@ layout_catalog = column(
 tab_c = TabPanel(child=layout_catalog, title='Mode Selection')
 tabs = Tabs(tabs=[tab_c]) # Create the main tab container, currently with one tab
 
+# Optional tab with the rolling latency percentiles of this session
+# (enabled by env.show_metrics_panel or `bokeh serve ... --args --metrics`)
+if env.show_metrics_panel or '--metrics' in sys.argv[1:]:
+    session_id = curdoc().session_context.id if curdoc().session_context else 'local'
+    metrics_panel = MetricsPanel(env.metrics, curdoc(),
+                                 file_name=env.metrics_file.format(session=session_id))
+    tabs.tabs.append(TabPanel(child=metrics_panel.layout, title='Metrics'))
+
 # Add the root layout to the document and set the browser tab title
 curdoc().add_root(tabs)
+startup_steps.append(('layout', time.perf_counter()))
+
+# Startup-time report, one line per session
+startup_report = []
+previous = startup_begin
+for step, end in startup_steps:
+    startup_report.append('{} {:.2f} s'.format(step, end - previous))
+    previous = end
+print('Startup ({} session): {}; total {:.2f} s'.format(
+    'cold' if startup_cold else 'warm', ', '.join(startup_report), previous - startup_begin))
+
+# lightkurve is imported on first use; on a cold start, import it in the background
+# while the analyst picks a file, so that the first periodogram does not wait for it
+if startup_cold:
+    threading.Thread(target=importlib.import_module, args=('lightkurve.periodogram',),
+                     daemon=True).start()
@@ -0,0 +1,311 @@
+"""
+Latency and data-transfer metrics of a session.
+
+`Metrics` keeps the most recent measurements of every callback, internal
+stage and ColumnDataSource update of one session and summarizes them as
+rolling percentiles:
+
+- 'callback': Python callbacks, timed by decorating the methods of
+  `Interactive` with `timed`.
+- 'stage': steps inside them (reading, trimming, echelle reshape, grid
+  threshold, pushing data to a source), timed with `Metrics.stage`. Stages
+  running on worker threads are recorded too.
+- 'task': background tasks (`tasks.TaskRunner`), from submission until
+  their result is applied to the document.
+- 'push': bytes of the data sent for every ColumnDataSource update
+  (replacement, stream or patch), from the events of the document, keyed on
+  the name of the source in the `Environment`.
+
+Times are summarized in milliseconds, pushes in bytes. The summary is shown
+by the optional `MetricsPanel` tab (`show_metrics_panel` in `env.py`, or
+`bokeh serve iechelle/gui/main.py --args --metrics`) and can be written to a
+JSON file with `Metrics.dump`.
+"""
+import contextlib
+import functools
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+# Rolling percentiles reported for every metric
+PERCENTILES = (50, 90, 99)
+# Lists longer than this are sized from a sample of their items
+SAMPLE_ITEMS = 1000
+
+
+def payload_nbytes(value):
+    """
+    Estimates the bytes sent to the browser for a value of a data source.
+
+    Numerical NumPy arrays are sent as binary buffers and count their
+    `nbytes`; lists and object arrays are sent as JSON and count 8 bytes per
+    number and the length of every string. Long lists are estimated from a
+    sample of their items.
+
+    Args:
+        value: A column, a dict of columns, or patches and streamed data.
+
+    Returns:
+        int: Estimated size in bytes.
+    """
+    if isinstance(value, np.ndarray) and value.dtype.kind != 'O':
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(payload_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple, np.ndarray)):
+        if len(value) > SAMPLE_ITEMS:
+            sample = [value[i] for i in np.linspace(0, len(value) - 1, SAMPLE_ITEMS).astype(int)]
+            return int(sum(payload_nbytes(item) for item in sample)*len(value)/SAMPLE_ITEMS)
+        return sum(payload_nbytes(item) for item in value)
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, bytes):
+        return len(value)
+    return 8
+
+
+class Metrics(object):
+    """
+    Rolling record of the callback, stage, task and push metrics of a session.
+    """
+
+    CATEGORIES = ('callback', 'stage', 'task', 'push')
+
+    def __init__(self, window=500):
+        """
+        Initializes an empty record.
+
+        Args:
+            window (int, optional): Number of recent measurements kept for
+                every metric. Defaults to 500.
+        """
+        self.window = window
+        self._lock = threading.Lock()
+        self._values = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts = defaultdict(int)
+        self._totals = defaultdict(float)
+        self._owners = ()
+        self._sources = {}
+        self._ignored = set()
+
+    def record(self, category, name, value):
+        """
+        Records one measurement. Can be called from any thread.
+
+        Args:
+            category (str): One of `CATEGORIES`.
+            name (str): Name of the callback, stage, task or source.
+            value (float): Duration in seconds, or size in bytes for 'push'.
+        """
+        key = (category, name)
+        with self._lock:
+            self._values[key].append(value)
+            self._counts[key] += 1
+            self._totals[key] += value
+
+    @contextlib.contextmanager
+    def timer(self, category, name):
+        """Context manager recording the duration of its body."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, name, time.perf_counter() - start)
+
+    def stage(self, name):
+        """
+        Context manager timing an internal stage.
+
+        Args:
+            name (str): Stage name, e.g. 'read', 'trim', 'reshape',
+                'threshold' or 'push'.
+        """
+        return self.timer('stage', name)
+
+    def reset(self):
+        """Drops every measurement."""
+        with self._lock:
+            self._values.clear()
+            self._counts.clear()
+            self._totals.clear()
+
+    def watch(self, doc, *owners):
+        """
+        Records the bytes of the ColumnDataSource updates of a document.
+
+        Args:
+            doc (bokeh.document.Document): Document of the session.
+            *owners: Objects whose attributes name the sources, normally the
+                `Environment` and the `Interactive` of the session.
+        """
+        self._owners = owners
+        doc.on_change(self._document_changed)
+
+    def ignore(self, model):
+        """Stops recording the updates of `model`, e.g. the source of the metrics panel."""
+        self._ignored.add(model.id)
+
+    def _source_name(self, model):
+        """Returns the attribute name of a source in the owners, or its model name."""
+        name = self._sources.get(model.id)
+        if name is None:
+            name = model.name or '{}({})'.format(type(model).__name__, model.id)
+            for owner in self._owners:
+                match = [attr for attr, value in vars(owner).items() if value is model]
+                if match:
+                    name = match[0]
+                    break
+            self._sources[model.id] = name
+        return name
+
+    def _document_changed(self, event):
+        """Records a data update of a ColumnDataSource made on the server."""
+        from bokeh.document.events import (ColumnDataChangedEvent, ColumnsPatchedEvent,
+                                           ColumnsStreamedEvent, ModelChangedEvent)
+        from bokeh.models import ColumnDataSource
+
+        model = getattr(event, 'model', None)
+        if (not isinstance(model, ColumnDataSource) or model.id in self._ignored
+                or getattr(event, 'setter', None) is not None):
+            # Changes sent by the browser have a setter; nothing is pushed back
+            return
+        if isinstance(event, ColumnsStreamedEvent):
+            nbytes = payload_nbytes(event.data)
+        elif isinstance(event, ColumnsPatchedEvent):
+            nbytes = payload_nbytes(event.patches)
+        elif isinstance(event, ColumnDataChangedEvent):
+            data = model.data if event.cols is None else {col: model.data[col] for col in event.cols}
+            nbytes = payload_nbytes(data)
+        elif isinstance(event, ModelChangedEvent) and event.attr == 'data':
+            nbytes = payload_nbytes(event.new)
+        else:
+            return
+        self.record('push', self._source_name(model), nbytes)
+
+    def summary(self):
+        """
+        Summarizes the recent measurements.
+
+        Returns:
+            dict: For every category, a dict mapping each name to 'count'
+                (all measurements so far), 'last', 'mean', 'p50', 'p90',
+                'p99', 'max' over the window and 'total' over all
+                measurements. Times are in milliseconds, pushes in bytes.
+        """
+        with self._lock:
+            items = [(key, np.array(values), self._counts[key], self._totals[key])
+                     for key, values in self._values.items()]
+        summary = {category: {} for category in self.CATEGORIES}
+        for (category, name), values, count, total in sorted(items):
+            scale = 1.0 if category == 'push' else 1e3
+            values = values*scale
+            stats = dict(count=count, last=values[-1], mean=values.mean())
+            for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                stats['p{}'.format(q)] = value
+            stats.update(max=values.max(), total=total*scale)
+            summary.setdefault(category, {})[name] = {k: float(v) if k != 'count' else int(v)
+                                                      for k, v in stats.items()}
+        return summary
+
+    def to_json(self):
+        """Returns the summary as a JSON string."""
+        return json.dumps(dict(window=self.window, units=dict(time='ms', push='bytes'),
+                               metrics=self.summary()), indent=1)
+
+    def dump(self, file_name):
+        """
+        Writes the summary to a JSON file.
+
+        Args:
+            file_name (str or Path): Output file.
+        """
+        with open(file_name, 'w') as file:
+            file.write(self.to_json())
+
+
+def timed(method):
+    """
+    Decorator recording the duration of a method as a 'callback' metric.
+
+    The method must belong to an object whose `env` has a `metrics`
+    attribute, such as `Interactive`; otherwise it runs untimed.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics = getattr(self.env, 'metrics', None)
+        if metrics is None:
+            return method(self, *args, **kwargs)
+        with metrics.timer('callback', name):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class MetricsPanel(object):
+    """
+    Bokeh panel showing the rolling percentiles of a `Metrics` record.
+    """
+
+    COLUMNS = ('category', 'name', 'count', 'last', 'p50', 'p90', 'p99', 'max', 'total')
+
+    def __init__(self, metrics, doc, file_name='iechelle_metrics.json', period_ms=2000):
+        """
+        Builds the table and buttons and refreshes them periodically.
+
+        Args:
+            metrics (Metrics): Record to show.
+            doc (bokeh.document.Document): Document of the session.
+            file_name (str, optional): File written by the 'Save JSON' button.
+                Defaults to 'iechelle_metrics.json'.
+            period_ms (int, optional): Refresh period in milliseconds.
+                Defaults to 2000.
+        """
+        from bokeh.layouts import column, row
+        from bokeh.models import Button, ColumnDataSource, DataTable, Div, NumberFormatter, TableColumn
+
+        self.metrics = metrics
+        self.file_name = file_name
+        self.source = ColumnDataSource(data={col: [] for col in self.COLUMNS})
+        metrics.ignore(self.source)
+        number = NumberFormatter(format='0,0.0')
+        columns = ([TableColumn(field=col, title=col, width=200 if col == 'name' else 80)
+                    for col in self.COLUMNS[:3]]
+                   + [TableColumn(field=col, title=col, width=80, formatter=number)
+                      for col in self.COLUMNS[3:]])
+        self.table = DataTable(source=self.source, columns=columns, width=1000, height=600,
+                               index_position=None)
+        self.info = Div(text='Times in ms, pushes in bytes; percentiles over the last {} '
+                        'measurements.'.format(metrics.window), width=1000)
+        refresh_button = Button(label='Refresh', width=120)
+        refresh_button.on_click(self.refresh)
+        reset_button = Button(label='Reset', width=120)
+        reset_button.on_click(self.reset)
+        save_button = Button(label='Save JSON', width=120)
+        save_button.on_click(self.save)
+        self.layout = column(row(refresh_button, reset_button, save_button), self.info, self.table)
+        doc.add_periodic_callback(self.refresh, period_ms)
+
+    def refresh(self):
+        """Shows the current summary in the table."""
+        data = {col: [] for col in self.COLUMNS}
+        for category, metrics in self.metrics.summary().items():
+            for name, stats in metrics.items():
+                data['category'].append(category)
+                data['name'].append(name)
+                for col in self.COLUMNS[2:]:
+                    data[col].append(stats[col])
+        self.source.data = data
+
+    def reset(self):
+        """Drops the measurements and empties the table."""
+        self.metrics.reset()
+        self.refresh()
+
+    def save(self):
+        """Writes the summary to `file_name`."""
+        self.metrics.dump(self.file_name)
+        self.info.text = 'Metrics written to {}'.format(self.file_name)
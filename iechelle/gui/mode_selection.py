@@ -4,7 +4,7 @@ Defines the Interactive class, the core of iEchelle's interactive analysis funct
 This module provides the `Interactive` class, which manages the primary user
 interface for echelle diagram and periodogram analysis. It handles user inputs,
 updates Bokeh plots and tables, performs calculations related to seismic mode
-identification, and interacts extensively with the shared `Environment` class.
+identification, and interacts extensively with the `Environment` of its session.
 It leverages Bokeh for plotting, Astropy for units, Lightkurve for
 periodogram objects, and Apollinaire for some astrophysical calculations
 and echelle diagram logic.
@@ -13,10 +13,16 @@ import logging
 import pandas as pd
 from pathlib import Path
 import numpy as np
-from matplotlib import pyplot as plt
 # from scipy.signal import find_peaks
 from bokeh.models import ColumnDataSource
 import functions
+import echelle
+from frequency_index import FrequencyIndex, match_nearest
+from selection_table import SelectionTable
+from lod import PeriodogramLOD, EchelleLOD
+from tasks import TaskRunner
+from prefetch import Prefetcher
+from metrics import timed
 from astropy import units as u
 # from astropy.units import cds
 
@@ -24,8 +30,8 @@ from astropy import units as u
 # from lightkurve.seismology import utils, stellar_estimators
 # from lightkurve.periodogram import SNRPeriodogram
 # from lightkurve.utils import LightkurveWarning
-from lightkurve.seismology import SeismologyQuantity
-import apollinaire as apol
+# lightkurve and apollinaire take seconds to import: they are
+# imported on first use, inside the methods that need them
 
 # from astropy import units
 # from tessipack.functions import maths
@@ -35,19 +41,20 @@ import apollinaire as apol
 #import lightkurve
 #import Periodo
 from env import Environment
+from periodogram_store import periodogram_store
 #from astropy import units
-from bokeh.models import CustomJS, TextInput, Paragraph
+from bokeh.models import CustomJS, TextInput, Paragraph, Div
+from bokeh.events import RangesUpdate, Reset, Tap
 # for saving data
 from bokeh.models import Button, Select, CategoricalColorMapper, CheckboxGroup, TableColumn, DataTable
-from lightkurve import periodogram as lk_prd_module
 
 # Import the optional Bokeh dependency required by ``interact_echelle```,
 # or print a friendly error otherwise.
 # try:
 import bokeh  # Import bokeh first so we get an ImportError we can catch
     # from bokeh.io import show, output_notebook
-from bokeh.plotting import figure
-from bokeh.models import LogColorMapper, Slider, RangeSlider, Button
+from bokeh.plotting import figure, curdoc
+from bokeh.models import LogColorMapper, LinearColorMapper, Slider, RangeSlider, Button
     # from bokeh.layouts import layout, Spacer
 # except:
     # Nice error will be raised when ``interact_echelle``` is called.
@@ -56,12 +63,9 @@ from bokeh.models import LogColorMapper, Slider, RangeSlider, Button
 import bokeh.palettes
 
 log = logging.getLogger(__name__)
-
-from tkinter import Tk
-from tkinter.filedialog import askdirectory, askopenfile, asksaveasfilename
     
 
-class Interactive(Environment):
+class Interactive(object):
     """
     Manages the interactive echelle diagram and periodogram analysis GUI.
 
@@ -75,14 +79,13 @@ class Interactive(Environment):
     - Calculating and displaying synthetic power spectra.
     - Interacting with the `apollinaire` library for echelle diagram generation
       and other astrophysical computations.
-    - Using `tkinter` for file dialogs.
+    - Choosing files with the in-page `FileBrowser` of the session.
 
-    It inherits from the `Environment` class to access and modify shared application
-    state and Bokeh models.
+    It reads and modifies the state and Bokeh models of its session through
+    the `Environment` instance `self.env`.
     """
-    env = Environment
 
-    def __init__(self):
+    def __init__(self, env=None):
         """
         Initializes the interactive mode selection GUI components and callbacks.
 
@@ -93,7 +96,12 @@ class Interactive(Environment):
         diagram figure and periodogram figure. Sets up numerous callbacks for
         UI interactions and data changes.
         Initializes plot for vertical lines representing selected modes.
+
+        Args:
+            env (Environment, optional): State of the session, shared with
+                `Catalog`. Defaults to None, which creates a new one.
         """
+        self.env = Environment() if env is None else env
 
         self.mode_color_map = {
                     '999': "grey",
@@ -117,7 +125,27 @@ class Interactive(Environment):
         self.env.text_osc_query = TextInput(
             value='n_pg>=0', title="Select Cluster")
 
+        self.echelle_engine = echelle.EchelleEngine()
+        # Colour stretch (lo, hi) of the echelle image, and (lo, hi, number of
+        # colours) of the palette indices it was sent with (echelle_quantized)
+        self.echelle_stretch = None
+        self.echelle_quantized_key = None
+        self.echelle_color_mapper = None
+        # Overview and visible tile of large echelle images (created with the figure)
+        self.echelle_lod = None
+        # Heavy callbacks run on worker threads, progress goes to the message banner
+        self.tasks = TaskRunner(curdoc(), report=self.publish_message,
+                                max_workers=self.env.task_workers,
+                                metrics=self.env.metrics)
+        # Bytes pushed to the browser, per source (metrics tab)
+        self.env.metrics.watch(curdoc(), self.env, self)
+        # Periodograms and PKB files of the neighbouring catalog sources
+        self.prefetcher = Prefetcher(max_bytes=self.env.prefetch_max_bytes)
+        # True while a source loaded by update_whole_plot is not drawn yet
+        self._whole_plot_pending = False
+        self.frequency_index = FrequencyIndex(decimals=self.env.freq_round)
         self.env.tb_other_periodogram, self.env.fig_other_periodogram = self.initialize_dnu_periodogram()
+        self.index_periodogram()
         self.env.frequency_minimum_text = TextInput(
             value=str(self.env.minimum_frequency), title="Freq min", width=80)
         self.env.frequency_maximum_text = TextInput(
@@ -126,6 +154,17 @@ class Interactive(Environment):
             value=str(self.env.maxdnu), title="Maxdnu", width=80)
         self.env.echelle_noise_cuttoff_text = TextInput(
             value=str(0), title="Threshold", width=80)
+        self.env.echelle_threshold_slider = Slider(start=0, end=1, value=0, step=0.01,
+                                                   title="Threshold", width=290)
+        self.env.echelle_threshold_slider.on_change('value', self.threshold_slider_change)
+        self.env.echelle_smooth_text = TextInput(
+            value=str(self.env.echelle_smooth_width), title="Smooth", width=80)
+        self.env.echelle_smooth_menu = Select(title='Smoothing',
+                                              options=list(echelle.SMOOTHING_KINDS),
+                                              value=self.env.echelle_smooth_kind,
+                                              width=100)
+        self.echelle_engine.set_smoothing(self.env.echelle_smooth_width,
+                                          self.env.echelle_smooth_kind)
 
         self.env.dnu_text = TextInput(
             value=str(self.env.dnu_val), title="Delta Nu", width=100)
@@ -186,6 +225,9 @@ class Interactive(Environment):
         self.env.grid_circle_size = TextInput(
             value=str(2), title="Circle Size", width=80)
 
+        self.env.pkb_match_tolerance_text = TextInput(
+            value=str(self.env.pkb_match_tolerance), title="PKB Tolerance", width=100)
+
 
         self.env.select_color_palette = Select(title='Color Palette', 
                                          options=self.env.color_palette_options, 
@@ -257,6 +299,7 @@ class Interactive(Environment):
         self.initialize_selection_tables()
         self.make_tb_echelle_diagram()
         self.interact_echelle()
+        self.make_dnu_scan_elements()
         self.make_grid()
         self.initilize_plot_table()
 
@@ -280,9 +323,15 @@ class Interactive(Environment):
             label="Find Peak", button_type=self.env.button_type, width=150)
         self.env.find_peaks_button.on_click(self.find_peak_frequencies)
 
+        self.env.auto_peaks_button = Button(
+            label="Auto Peaks", button_type=self.env.button_type, width=150)
+        self.env.auto_peaks_button.on_click(self.click_auto_peaks_button)
+        self.env.auto_peaks_snr_text = TextInput(
+            value=str(self.env.auto_peaks_snr), title="Peak S/N", width=80)
+
         self.env.calculate_synthetic_psd_button = Button(
             label="Calculate Synthetic PSD", button_type=self.env.button_type, width=150)
-        self.env.calculate_synthetic_psd_button.on_click(self.calculate_synthetic_psd)
+        self.env.calculate_synthetic_psd_button.on_click(self.click_calculate_synthetic_psd_button)
 
         self.env.show_plot = Button(
             label="Show Plot", button_type=self.env.button_type, width=150)
@@ -389,11 +438,14 @@ class Interactive(Environment):
         """
         Initializes the main periodogram figure and its associated ColumnDataSource.
 
-        Reads frequency and power data from a FITS file (via `read_fits_get_fp`).
+        Reads frequency and power data from a FITS file (via `read_fits_get_fp`),
+        if a source is already selected.
         Sets default frequency ranges, delta Nu, and other parameters.
         Creates a Bokeh figure for the periodogram with tools for zoom, selection, etc.
         Creates a `ColumnDataSource` (`tb_other_periodogram`) to hold frequency,
         power, and mode identification data.
+        The figure glyphs draw `self.env.tb_periodogram_display`, a decimated
+        copy of the visible window maintained by `self.periodogram_lod`.
         Plots the periodogram data (frequency vs. power) and a threshold line.
 
         Returns:
@@ -401,8 +453,12 @@ class Interactive(Environment):
                 - tb_other_periodogram (ColumnDataSource): Source for the periodogram.
                 - fig_other_periodogram (Figure): Bokeh figure object for the periodogram.
         """
-        ff, pp = self.read_fits_get_fp()
-        mm = ['999']*(len(pp))
+        # No FITS file is selected yet when a session starts (placeholder path 'None')
+        if Path(self.source_path()).is_file():
+            ff, pp = self.read_fits_get_fp()
+        else:
+            ff, pp = np.array([]), np.array([])
+        mm = functions.mode_column(len(pp))
 
         self.env.minimum_frequency = 1  # 1
         self.env.maximum_frequency = 8000  # 8000
@@ -412,14 +468,15 @@ class Interactive(Environment):
         f = (ff*u.Hz).to(self.env.frequency_unit)
         p = pp*self.env.power_unit
         if ff.any():
+            from lightkurve import periodogram as lk_prd_module
             period = lk_prd_module.Periodogram(f, p)
 
             self.periodogram = period
 
             tb_other_periodogram = ColumnDataSource(
                 data=dict(
-                    frequency=list(self.periodogram.frequency.value),
-                    power=list(self.periodogram.power.value),
+                    frequency=functions.float_column(self.periodogram.frequency.value),
+                    power=functions.float_column(self.periodogram.power.value, power=True),
                     Mode = mm,
                     # cuttoff=list(np.array([0])),
                 ))
@@ -429,9 +486,9 @@ class Interactive(Environment):
 
             tb_other_periodogram = ColumnDataSource(
                 data=dict(
-                    frequency=list([]),
-                    power=list([]),
-                    Mode = list([]),
+                    frequency=functions.float_column([]),
+                    power=functions.float_column([], power=True),
+                    Mode = functions.mode_column(0),
                     # cuttoff=list(np.array([0])),
                 ))    
 
@@ -451,8 +508,19 @@ class Interactive(Environment):
             factors=list(color_map.keys()), 
             palette=list(color_map.values()))
 
+        # The full-resolution source stays on the server; the glyphs draw a
+        # decimated copy of the visible window (see lod.PeriodogramLOD)
+        self.env.tb_periodogram_display = ColumnDataSource(
+            data=dict(frequency=[], power=[], Mode=[], bin=[]))
+        self.periodogram_lod = PeriodogramLOD(tb_other_periodogram,
+                                              self.env.tb_periodogram_display,
+                                              n_points=self.env.periodogram_lod_points,
+                                              enabled=self.env.periodogram_lod)
+        fig_other_periodogram.on_event(RangesUpdate, self.periodogram_range_update)
+        fig_other_periodogram.on_event(Reset, self.periodogram_range_reset)
+
         fig_other_periodogram.circle("frequency", "power",
-                                     source=tb_other_periodogram,
+                                     source=self.env.tb_periodogram_display,
                                      alpha=0.7, 
                                      color = {'field': 'Mode', 
                                                 'transform': color_mapper},
@@ -460,7 +528,7 @@ class Interactive(Environment):
                                      )
 
         fig_other_periodogram.line("frequency", "power",
-                                   source=tb_other_periodogram,
+                                   source=self.env.tb_periodogram_display,
                                    alpha=0.7, color="grey",name='Grid')
         #color="#1F77B4"
         fig_other_periodogram.ray(
@@ -495,6 +563,52 @@ class Interactive(Environment):
 
         return tb_other_periodogram, fig_other_periodogram
 
+    @timed
+    def periodogram_range_update(self, event):
+        """
+        Refines the decimated periodogram when the user zooms or pans.
+
+        Args:
+            event (bokeh.events.RangesUpdate): Event carrying the new x-range
+                (`x0`, `x1`) of the main periodogram figure.
+        """
+        if event.x0 is None or event.x1 is None:
+            return
+        self.periodogram_lod.set_window(event.x0, event.x1)
+
+    def periodogram_range_reset(self, event):
+        """Shows the whole periodogram again after the figure is reset."""
+        self.periodogram_lod.set_window()
+
+    @timed
+    def echelle_range_update(self, event):
+        """
+        Refines the visible region of the echelle image when the user zooms or pans.
+
+        Args:
+            event (bokeh.events.RangesUpdate): Event carrying the new x- and
+                y-ranges of the echelle figure.
+        """
+        self.echelle_lod.set_window(event.x0, event.x1, event.y0, event.y1)
+
+    def echelle_range_reset(self, event):
+        """Shows the overview of the echelle image only after the figure is reset."""
+        self.echelle_lod.set_window()
+
+    def _refine_echelle(self):
+        """
+        Sends the tile of the visible region of the echelle image.
+
+        In a served document the tile is sent on the next tick, after the
+        overview has reached the browser.
+        """
+        if self.echelle_lod is None:
+            return
+        if self.tasks.asynchronous:
+            self.tasks.doc.add_next_tick_callback(self.echelle_lod.refresh)
+        else:
+            self.echelle_lod.refresh()
+
     def plot_vertical_lines(self):
         """
         Plots vertical lines on the main periodogram to indicate selected mode frequencies.
@@ -520,6 +634,7 @@ class Interactive(Environment):
                                                 'transform': color_mapper})
 
 
+    @timed
     def make_tb_echelle_diagram(self):
         """
         Generates or updates the data for the echelle diagram.
@@ -529,9 +644,14 @@ class Interactive(Environment):
         If the 'Show Echelle' checkbox is active and periodogram data is available,
         it calculates the echelle diagram data using `_clean_echelle()`.
         This involves reshaping the periodogram power based on the current delta Nu.
+        In incremental mode (`self.env.echelle_incremental`) the reshape is taken
+        from `self.echelle_engine`, which reuses the trimmed arrays, so only the
+        reshape itself depends on delta Nu.
         The results (image, frequency axes, dimensions) are stored in
-        `self.env.tb_echelle_diagram`. If 'Show Echelle' is not active,
-        it clears the echelle diagram data.
+        `self.env.tb_echelle_diagram`. Images larger than
+        `self.env.echelle_lod_pixels` are stored as a pooled overview, and
+        `self.echelle_lod` sends a finer tile of the visible region afterwards.
+        If 'Show Echelle' is not active, it clears the echelle diagram data.
         """
         if self.env.tb_echelle_diagram == None:
             print('Creating an echelle diagram, Creating column source')
@@ -551,17 +671,15 @@ class Interactive(Environment):
         else:
             print('Refereshing everything')
          
-        if self.env.check_show_echelle.active[0]==0 and not self.env.tb_other_periodogram.to_df().empty:
+        if self.env.check_show_echelle.active[0]==0 and not self.echelle_engine.empty:
         # Load the values
-            frequency = self.env.tb_other_periodogram.data['frequency'] * \
-                self.env.frequency_unit
-            power = self.env.tb_other_periodogram.data['power']*self.env.power_unit
-            (ep, self.x_echelle, self.y_echelle, y_original,self.xx, self.yy, 
-            self.freq_values, self.power_values) = self._clean_echelle(
-                                deltanu=self.dnu_val,
-                                #minimum_frequency = self.env.minimum_frequency*self.env.frequency_unit,
-                                #maximum_frequency = self.env.maximum_frequency*self.env.frequency_unit
-                                )
+            with self.env.metrics.stage('reshape'):
+                (ep, self.x_echelle, self.y_echelle, y_original,self.xx, self.yy, 
+                self.freq_values, self.power_values) = self._clean_echelle(
+                                    deltanu=self.env.dnu_val,
+                                    #minimum_frequency = self.env.minimum_frequency*self.env.frequency_unit,
+                                    #maximum_frequency = self.env.maximum_frequency*self.env.frequency_unit
+                                    )
 
             x_f = self.x_echelle
             y_f = self.y_echelle
@@ -570,8 +688,16 @@ class Interactive(Environment):
             xmin = x_f.flatten().min().value
             ymin = y_f.flatten().min().value
 
+            if self.env.echelle_quantized:
+                image = self._quantized_echelle_image(*self._echelle_stretch_target())
+            else:
+                image = ep.value
+            if self.echelle_lod is not None:
+                # Send a pooled overview; the visible tile follows (_refine_echelle)
+                overview = self.echelle_lod.set_image(image, xmin, ymin, dw, dh)
+                image, dw, dh = overview['image'], overview['dw'], overview['dh']
             new_data = ColumnDataSource(
-                data=dict(image=[ep.value],
+                data=dict(image=[image],
                         x_f=[x_f.value],
                         y_f=[y_f.value],
                         dw=[dw],
@@ -585,8 +711,12 @@ class Interactive(Environment):
                         )
             )
 
-            self.env.tb_echelle_diagram.data = dict(new_data.data)
+            with self.env.metrics.stage('push'):
+                self.env.tb_echelle_diagram.data = dict(new_data.data)
+            self._refine_echelle()
         else:
+            if self.echelle_lod is not None:
+                self.echelle_lod.clear()
             old_data = ColumnDataSource(
                 data=dict(image=[],
                           x_f=[],
@@ -612,7 +742,9 @@ class Interactive(Environment):
         - `self.env.table_se_second`: For final mode selections (Table 2).
         Each table is backed by a `ColumnDataSource` (`self.tb_se_first_source` and
         `self.tb_se_second_source` respectively) and configured with columns for
-        'Slicefreq', 'Frequency', 'Power', and 'Mode'.
+        'Slicefreq', 'Frequency', 'Power', and 'Mode'. The sources are edited
+        through `SelectionTable` wrappers (`self.table_first` and
+        `self.table_second`), which stream new rows instead of resending the tables.
         """
 
         # self.tb_se_first_source=ColumnDataSource(data=dict(x=[], y=[],z=[]))
@@ -622,6 +754,8 @@ class Interactive(Environment):
             data=dict(Slicefreq=[], Frequency=[], Power=[], Mode=[], xx=[]))
         self.tb_se_second_source = ColumnDataSource(
             data=dict(Slicefreq=[], Frequency=[], Power=[], Mode=[], xx=[], mode_color=[]))
+        self.table_first = SelectionTable(self.tb_se_first_source, decimals=self.env.freq_round)
+        self.table_second = SelectionTable(self.tb_se_second_source, decimals=self.env.freq_round)
         columns = [
             TableColumn(field="Slicefreq", title="Slice Freq"),
             TableColumn(field="Frequency", title="Frequency"),
@@ -761,6 +895,7 @@ class Interactive(Environment):
 
 
 
+    @timed
     def make_grid(self):
         """
         Initializes and populates the ColumnDataSource for the echelle diagram grid points.
@@ -770,6 +905,9 @@ class Interactive(Environment):
         - It filters the echelle diagram points (`self.xx`, `self.yy`,
           `self.freq_values`, `self.power_values` from `_clean_echelle`)
           based on a power threshold (`self.env.echelle_noise_cuttoff_text`).
+          In incremental mode the points are taken from `self.echelle_engine`,
+          which only recomputes the echelle coordinates of the points above
+          the threshold for the current delta Nu.
         - The filtered points are stored in `self.env.tb_grid_source`.
         - It applies existing mode assignments from Table 1 and Table 2 to these grid points.
         - It adjusts the size of circles on the echelle diagram based on `self.env.grid_circle_size`.
@@ -785,6 +923,7 @@ class Interactive(Environment):
                     freq_values=[],
                     power_values=[],
                     Mode=[],
+                    bin=[],
                 )
             )
 
@@ -800,7 +939,7 @@ class Interactive(Environment):
                     factors=list(color_map.keys()), 
                     palette=list(color_map.values()))
 
-                self.env.fig_tpfint.circle(x = 'xx', 
+                self.grid_renderer = self.env.fig_tpfint.circle(x = 'xx', 
                                         y = 'yy',
                                         size = 2, 
                                         fill_alpha = 0.2,
@@ -833,39 +972,58 @@ class Interactive(Environment):
                 #                            source=self.env.tb_grid_source)
                 
         #print('Griding',self.env.check_make_grid.active)
-        if self.env.check_make_grid.active[0]==0 and not self.env.tb_other_periodogram.to_df().empty:
+        if self.env.check_make_grid.active[0]==0 and not self.echelle_engine.empty:
             cutt_off = float(self.env.echelle_noise_cuttoff_text.value)
             self.tb_constants_val.data['other_prd_cuttoff'] = list([cutt_off])
             
             val = float(self.env.frequency_minimum_text.value)
             self.tb_constants_val.data['minimum_frequency'] = list([val])
             print('Threshold', val)
-            ind = np.array(self.power_values) >= cutt_off
-            xx = np.array(self.xx)[ind]
-            yy = np.array(self.yy)[ind]
-            ff = np.array(self.freq_values)[ind]
-            pp = np.array(self.power_values)[ind]
-            mm = ['999']*(len(pp))
-
-            old_data = ColumnDataSource(
-                data=dict(
-                    xx=list(xx),
-                    yy=list(yy),
-                    freq_values=list(ff),
-                    power_values=list(pp),
-                    Mode = mm,
-                )
+            self._update_threshold_slider(cutt_off)
+            with self.env.metrics.stage('threshold'):
+                if self.env.echelle_incremental:
+                    grid = self.echelle_engine.grid(self.env.dnu_val, cutt_off)
+                    xx = grid['xx']
+                    yy = grid['yy']
+                    ff = grid['freq_values']
+                    pp = grid['power_values']
+                else:
+                    ind = np.flatnonzero(self.power_values >= cutt_off)
+                    xx = self.xx[ind]
+                    yy = self.yy[ind]
+                    ff = self.freq_values[ind]
+                    pp = self.power_values[ind]
+            bins = self.frequency_index.lookup(ff)
+            # Label the modes of Table 1, then Table 2 (which wins), before sending
+            # the grid: patching a freshly sent grid would validate every column
+            # again, and one patch of the periodogram only sends the final labels
+            first_bins, first_labels = self._table_modes(self.tb_se_first_source.to_df())
+            second_bins, second_labels = self._table_modes(self.tb_se_second_source.to_df())
+            mode_bins = np.concatenate([first_bins, second_bins])
+            labels = np.concatenate([first_labels, second_labels])
+            self._patch_modes(self.env.tb_other_periodogram, mode_bins, labels)
+            mm = functions.mode_column(len(pp))
+            rows = self.frequency_index.grid_lookup(bins, mode_bins)
+            mm[rows[rows >= 0]] = labels[rows >= 0]
+
+            data = dict(
+                xx=functions.float_column(xx),
+                yy=functions.float_column(yy),
+                freq_values=functions.float_column(ff),
+                power_values=functions.float_column(pp, power=True),
+                Mode = mm,
+                bin = bins,
             )
-            self.env.tb_grid_source.data = dict(old_data.data)
-            self.apply_modes(table=self.tb_se_first_source.to_df())
-            self.apply_modes(table=self.tb_se_second_source.to_df())
+            with self.env.metrics.stage('push'):
+                self.env.tb_grid_source.data = data
             val=int(self.env.grid_circle_size.value)
             print('Circle size',val)
-            self.env.fig_tpfint.select('grid_circle').glyph.size = val
+            # Kept from creation: select() walks every model of the document
+            self.grid_renderer.glyph.size = val
             if self.env.check_show_modes_grid.active[0]==0:
                 val='999'
                 df_grid=self.env.tb_grid_source.to_df().query('Mode !=@val')
-                old_data=ColumnDataSource(df_grid.to_dict('list'))
+                old_data=ColumnDataSource(functions.frame_columns(df_grid))
                 self.env.tb_grid_source.data = dict(old_data.data)
 
 
@@ -878,23 +1036,75 @@ class Interactive(Environment):
                     freq_values=[],
                     power_values=[],
                     Mode=[],
+                    bin=[],
                 )
             )
             self.env.tb_grid_source.data = dict(old_data.data)
 
+    @timed
+    def threshold_slider_change(self, attr, old, new):
+        """
+        Applies the value of the threshold slider to the echelle grid.
+
+        The value is copied to `self.env.echelle_noise_cuttoff_text` and the
+        grid is rebuilt. The first change after a trim builds the power index
+        of `self.echelle_engine` (`power_order`), unless the background
+        prefetch already did; later changes find the points above the
+        threshold with a binary search and a slice.
+
+        Args:
+            attr: The attribute that changed (unused).
+            old: The old value (unused).
+            new (float): New threshold.
+        """
+        cutoff = float('{:.6g}'.format(new))
+        if cutoff == float(self.env.echelle_noise_cuttoff_text.value):
+            # Set by make_grid from the text input
+            return
+        self.env.echelle_noise_cuttoff_text.value = str(cutoff)
+        if self.env.echelle_incremental and not self.echelle_engine.empty:
+            self.echelle_engine.power_order()
+        self.make_grid()
+
+    def _update_threshold_slider(self, cutoff):
+        """
+        Sets the range of the threshold slider and its value to `cutoff`.
+
+        The range goes from 0 (or `cutoff`, if negative) up to the upper
+        colour-stretch limit of the trimmed power (or `cutoff`, if higher),
+        in 200 steps. An empty range, e.g. for a spectrum of zeros, is
+        widened to 1 so that the step is never 0.
+
+        Args:
+            cutoff (float): Current threshold of the grid.
+        """
+        slider = self.env.echelle_threshold_slider
+        limits = self.echelle_engine.stretch_limits()
+        start = min(0.0, cutoff)
+        end = max(limits[1] if limits is not None else 1.0, cutoff)
+        if not end > start:
+            end = start + 1.0
+        if slider.start != start or slider.end != end:
+            slider.update(start=start, end=end, step=(end - start)/200)
+        if slider.value != cutoff:
+            slider.value = cutoff
+
     def read_fits_get_fp(self):
         """
         Reads frequency (f) and power (p) data from a FITS periodogram file.
 
-        The path to the FITS file is obtained from `self.env.tb_source.data['path_fits']`.
+        The path to the FITS file is the entry of `self.env.tb_source.data['path_fits']`
+        of the current source.
         It expects the FITS file to have frequency in the first column and power in
-        the second column of the primary HDU's data. Byte swapping is performed
-        to ensure correct endianness.
+        the second column of the primary HDU's data. The file is read through
+        `periodogram_store`, so it is only read from disk the first time or when
+        its modification time or size changed; later calls are served from memory
+        as native-endian arrays.
 
         Returns:
             tuple: A tuple containing:
-                - ff (numpy.ndarray): Array of frequency values.
-                - pp (numpy.ndarray): Array of power values.
+                - ff (numpy.ndarray): Read-only array of frequency values.
+                - pp (numpy.ndarray): Read-only array of power values.
                 Returns empty arrays if the file does not exist or cannot be read.
         """
         self.publish_message(text='Reading Fits')
@@ -905,21 +1115,10 @@ class Interactive(Environment):
         # filename=mycatalog.filename(
         #     id_mycatalog=id_mycatalog,
         #     name='other_psd')
-        filename =Path(self.env.tb_source.data['path_fits'][0])
+        filename =Path(self.source_path())
         print('Running read fits',filename)
         if filename.is_file():
-            from astropy.io import fits
-            import pandas
-            with fits.open(
-                #'/Users/dp275303/work/tessipack_developement_test/PSD_ _no_gap.fits'
-                filename
-                ) as data:
-                df = pandas.DataFrame(data[0].data)
-
-            ff = df[0].values
-            pp = df[1].values
-            ff = ff.byteswap().newbyteorder()
-            pp = pp.byteswap().newbyteorder()
+            ff, pp = periodogram_store.get(filename)
         else:
             print('File does not exist')
         self.publish_message(text='Read Fits')
@@ -930,9 +1129,11 @@ class Interactive(Environment):
         """
         Calculates and plots a synthetic Power Spectral Density (PSD).
 
-        This function calls `functions.calculate_synthetic_spectrum` using
+        This function calls `functions.cached_synthetic_spectrum` using
         filenames for the observed FITS, background parameters, and peak-bagging
-        parameters obtained from the environment (`self.env`).
+        parameters obtained from the environment (`self.env`). The synthetic
+        model is only recomputed when the content of one of these files or
+        `n_harvey` changed; otherwise the cached spectrum is reused.
         It then plots the observed PSD, the calculated synthetic PSD, and their
         subtraction on the main periodogram figure (`self.env.fig_other_periodogram`).
         The plot selection table (`self.env.tb_plot`) is updated to allow toggling
@@ -941,21 +1142,77 @@ class Interactive(Environment):
         Returns:
             pandas.DataFrame: The DataFrame containing the frequency, observed PSD,
                               synthetic PSD, and subtracted PSD, as returned by
-                              `functions.calculate_synthetic_spectrum` and filtered
+                              `functions.cached_synthetic_spectrum` and filtered
                               by current frequency limits.
         """
         self.publish_message('Calculating Synthetic Spectra; Busy')
-        self.env.select_grid_menu.options = ['Obs', 'Syn', 'Sub']
+        data = self._compute_synthetic(self._synthetic_request())
+        self._plot_synthetic(data)
+        return data
+
+    def click_calculate_synthetic_psd_button(self):
+        """
+        Calculates the synthetic PSD in the background and plots it when ready.
+
+        The synthetic model is computed by `self.tasks`, so the document stays
+        responsive and progress is shown in the message banner. Clicking again
+        before the calculation ended discards the previous result.
+        """
+        request = self._synthetic_request()
+        self.tasks.submit('synthetic',
+                          lambda task: self._compute_synthetic(request, task),
+                          done=self._plot_synthetic,
+                          label='Synthetic Spectra')
+
+    def _synthetic_request(self):
+        """
+        Captures the inputs of the synthetic spectrum calculation from the widgets.
+
+        Returns:
+            dict: File names, `n_harvey` and frequency limits, as plain values
+                that can be used outside the document thread.
+        """
+        return dict(fits_file=self.env.selected_filename_text.text,
+                    bkg_file=self.env.selected_filename_background_text.text,
+                    pkb_file=self.env.selected_filename_pkb_text.text,
+                    n_harvey=2,
+                    freq_min=float(self.env.frequency_minimum_text.value),
+                    freq_max=float(self.env.frequency_maximum_text.value))
+
+    def _compute_synthetic(self, request, task=None):
+        """
+        Computes the synthetic spectrum described by `request`.
+
+        Does not touch Bokeh models, so that it can run on a worker thread.
+
+        Args:
+            request (dict): Result of `_synthetic_request`.
+            task (tasks.Task, optional): Task running the calculation, used to
+                report progress. Defaults to None.
 
-        data = functions. calculate_synthetic_spectrum(fits_file=self.env.selected_filename_text.text,
-                                                     bkg_file=self.env.selected_filename_background_text.text,
-                                                     pkb_file=self.env.selected_filename_pkb_text.text,
-                                                     n_harvey=2)
+        Returns:
+            pandas.DataFrame: Frequency, observed, synthetic and subtracted PSD
+                between the frequency limits of the request.
+        """
+        if task is not None:
+            task.progress('Calculating; Busy')
+        data = functions.cached_synthetic_spectrum(fits_file=request['fits_file'],
+                                                  bkg_file=request['bkg_file'],
+                                                  pkb_file=request['pkb_file'],
+                                                  n_harvey=request['n_harvey'])
         data['sub_psd'] = data['psd'] - data ['synthetic_psd']
-        freq_min =  float(self.env.frequency_minimum_text.value)
-        freq_max =  float(self.env.frequency_maximum_text.value)
-        data = data.query('freq>@freq_min & freq<@freq_max')
-        
+        freq_min = request['freq_min']
+        freq_max = request['freq_max']
+        return data.query('freq>@freq_min & freq<@freq_max')
+
+    def _plot_synthetic(self, data):
+        """
+        Plots the observed, synthetic and subtracted PSD on the main periodogram figure.
+
+        Args:
+            data (pandas.DataFrame): Result of `_compute_synthetic`.
+        """
+        self.env.select_grid_menu.options = ['Obs', 'Syn', 'Sub']
         freq = data.freq.values
         power = data.psd.values
         print('frequecny calculation', freq)
@@ -989,8 +1246,6 @@ class Interactive(Environment):
         self.env.tb_plot.selected.indices = [0]
         self.publish_message('Ready')
 
-        return data
-
     def show_plot(self):
         """
         Updates the visibility of plots on the main periodogram based on table selection.
@@ -1047,15 +1302,21 @@ class Interactive(Environment):
         self.env.fig_other_periodogram.select(name=name).visible = False
 
 
+    @timed
     def update_value(self):
         """
         Updates environment variables from UI text inputs and refreshes plots.
 
         Reads values for minimum frequency, maximum frequency, maximum delta Nu,
-        and current delta Nu from their respective TextInput widgets in `self.env`.
+        current delta Nu and the smoothing of the echelle power from their
+        respective widgets in `self.env`.
         Updates the `self.env.dnu_slider` value.
         Then calls `update_plot()` to refresh the echelle diagram and related plots.
         """
+        self.env.echelle_smooth_width = float(self.env.echelle_smooth_text.value)
+        self.env.echelle_smooth_kind = self.env.echelle_smooth_menu.value
+        self.echelle_engine.set_smoothing(self.env.echelle_smooth_width,
+                                          self.env.echelle_smooth_kind)
         self.env.minimum_frequency = float(
             self.env.frequency_minimum_text.value)
         self.env.maximum_frequency = float(
@@ -1114,6 +1375,7 @@ class Interactive(Environment):
 
         return value
 
+    @timed
     def update_whole_plot(self,attr, old , new):
         """
         Comprehensive update callback, typically triggered by a change in the main source.
@@ -1126,51 +1388,61 @@ class Interactive(Environment):
         5. Adjusts color mapping and stretch slider for the echelle diagram image.
         6. Updates visibility of horizontal lines based on checkbox state.
 
+        The periodogram is read and trimmed by `self.tasks` in the background;
+        the remaining steps run in `_finish_whole_plot` once it is ready. When
+        another source is selected before that, only the latest one is drawn.
+        If the source was prepared by `prefetch_neighbours`, the prefetched
+        periodogram is drawn at once.
+
         Args:
             attr: The attribute that changed (unused).
             old: The old data (unused).
             new: The new data (unused).
         """
-        self.trim_frequency()
+        self.publish_message(text='Updating')
+        # Read the frequency limits now, so that update_plot does not trim a second time
+        self.check_change_in_frequency_limit()
+        self._whole_plot_pending = True
+        request = self._trim_request()
+        key = self._trim_key(request)
+        result = self.prefetcher.get(key)
+        if result is not None:
+            print('Using prefetched periodogram', request['path_fits'])
+            self.tasks.submit('periodogram', lambda task: result,
+                              done=self._finish_whole_plot, label='Loading')
+            return
+
+        def work(task):
+            prefetched = self.prefetcher.get(key, wait=True)
+            if prefetched is not None:
+                return prefetched
+            return self._compute_trim(request, task)
+
+        self.tasks.submit('periodogram', work, done=self._finish_whole_plot,
+                          label='Loading')
+
+    @timed
+    def _finish_whole_plot(self, result):
+        """
+        Completes `update_whole_plot` with the trimmed periodogram.
+
+        Args:
+            result (dict): Result of `_compute_trim`.
+        """
+        self._whole_plot_pending = False
+        self._apply_trim(result)
         self.clear_se_table1()
         self.clear_se_table2()
         self.update_plot(0, 0, 0)
 
 
         self.id_mycatalog = self.env.tb_source.data['id_mycatalog'][0]
-        dnu = self.dnu_val
+        dnu = self.env.dnu_val
         self.env.fig_tpfint.xaxis.axis_label = r'Frequency / {:.3f} Mod. 1'.format(
             dnu)
 
         self.make_tb_echelle_diagram()
-
-        ep = self.env.tb_echelle_diagram.data['image']*self.env.power_unit
-        lo, hi = np.nanpercentile(ep.value, [0.1, 99.9])
-        vlo, vhi = 0.3 * lo, 1.7 * hi
-        vstep = (lo - hi)/500
-                # self.palette = getattr(bokeh.palettes, 
-                #                     self.env.select_color_palette.value)[9] 
-        pal=getattr(bokeh.palettes, self.env.select_color_palette.value)
-        if type(pal)==dict:
-            self.palette = pal[9]
-        else:
-            self.palette = pal  
-                
-            if self.env.check_reverse_color_palette.active[0]!=1:
-                self.palette = list(reversed(self.palette))
-        # Lock color mapper
-        if self.env.check_color_map_lock.active[0]==1:
-            print('Value of colormap check',self.env.check_color_map_lock.active[0])
-            color_mapper = LogColorMapper(palette=self.palette, low=lo, high=hi)
-            self.env.fig_tpfint.select(
-                'img').glyph.color_mapper.low = color_mapper.low
-            self.env.fig_tpfint.select(
-                'img').glyph.color_mapper.high = color_mapper.high
-            self.env.fig_tpfint.select(
-                'img').glyph.color_mapper.palette = getattr(color_mapper,'palette')
-            self.env.stretch_sliderint.start = vlo
-            self.env.stretch_sliderint.end = vhi
-            self.env.stretch_sliderint.value = (lo, hi)
+        self._apply_echelle_stretch()
         self.env.dnu_slider.start = 0.01
         self.env.dnu_slider.end = self.env.maxdnu
         if self.env.check_show_horizontal_lines.active[0]==0:
@@ -1179,10 +1451,12 @@ class Interactive(Environment):
             self.env.fig_other_periodogram.select('vertical_line').visible = False
         
         self.publish_message(text='Ready')
+        self.prefetch_neighbours()
 
 
 
 
+    @timed
     def update_plot(self, attr, old, new):
         """
         Core callback function to update plots when parameters change.
@@ -1191,11 +1465,16 @@ class Interactive(Environment):
         for frequency, delta Nu, etc.) are modified.
         It performs the following steps:
         1. Checks if frequency limits have changed (`check_change_in_frequency_limit`)
-           and calls `trim_frequency()` if they have.
+           and, if they have, trims the periodogram in the background with
+           `self.tasks` and continues with the next steps once it is ready.
+           While a new source is still loading (`update_whole_plot`), the
+           trim replaces that load and finishes it with `_finish_whole_plot`,
+           so that the tables are still cleared for the new source.
         2. Updates the echelle diagram's x-axis label.
         3. Calls `make_tb_echelle_diagram()` to regenerate echelle data.
         4. If the echelle diagram is visible:
-            - Calculates color stretch limits (lo, hi) from the echelle image power.
+            - Takes the color stretch limits (lo, hi) of the trimmed power, computed
+              once per trim (`_apply_echelle_stretch`).
             - Updates the color palette and potentially reverses it.
             - If color map is not locked, updates the echelle image's color mapper
               and the stretch slider's range and value.
@@ -1211,44 +1490,44 @@ class Interactive(Environment):
         self.publish_message(text='Updating Plot')
         if self.check_change_in_frequency_limit():
             print('Triming Frequency')
-            self.trim_frequency()
+            request = self._trim_request()
+            # Same key as update_whole_plot: a pending source load is replaced,
+            # so it must be finished the same way
+            self._whole_plot_pending = self._whole_plot_pending and self.tasks.busy('periodogram')
+            done = self._finish_whole_plot if self._whole_plot_pending else self._finish_update_plot
+            self.tasks.submit('periodogram',
+                              lambda task: self._compute_trim(request, task),
+                              done=done, label='Updating Plot')
+            return
+        self.refresh_plot()
+
+    @timed
+    def _finish_update_plot(self, result):
+        """
+        Completes `update_plot` with the trimmed periodogram.
+
+        Args:
+            result (dict): Result of `_compute_trim`.
+        """
+        self._apply_trim(result)
+        self.refresh_plot()
+
+    @timed
+    def refresh_plot(self):
+        """
+        Redraws the echelle diagram and grid of the current periodogram.
 
+        Runs steps 2 to 6 of `update_plot`, without checking the frequency limits.
+        """
         self.id_mycatalog = self.env.tb_source.data['id_mycatalog'][0]
-        dnu = self.dnu_val
+        dnu = self.env.dnu_val
         self.env.fig_tpfint.xaxis.axis_label = r'Frequency / {:.3f} Mod. 1'.format(
             dnu)
 
         self.make_tb_echelle_diagram()
         if self.env.check_show_echelle.active[0]==0:
 
-            ep = self.env.tb_echelle_diagram.data['image']*self.env.power_unit
-            if ep.value.any():
-                lo, hi = np.nanpercentile(ep.value, [0.1, 99.9])
-                vlo, vhi = 0.3 * lo, 1.7 * hi
-                vstep = (lo - hi)/500
-                # self.palette = getattr(bokeh.palettes,
-                #                     self.env.select_color_palette.value)[9]
-
-                pal=getattr(bokeh.palettes, self.env.select_color_palette.value)
-                if type(pal)==dict:
-                    self.palette = pal[9]
-                else:
-                    self.palette = pal
-
-                if self.env.check_reverse_color_palette.active[0]!=1:
-                    self.palette = list(reversed(self.palette))
-                if self.env.check_color_map_lock.active[0]==1:
-                    print('Value of colormap check',self.env.check_color_map_lock.active[0])
-                    color_mapper = LogColorMapper(palette=self.palette, low=lo, high=hi)
-                    self.env.fig_tpfint.select(
-                        'img').glyph.color_mapper.low = color_mapper.low
-                    self.env.fig_tpfint.select(
-                        'img').glyph.color_mapper.high = color_mapper.high
-                    self.env.fig_tpfint.select(
-                        'img').glyph.color_mapper.palette = getattr(color_mapper,'palette')
-                    self.env.stretch_sliderint.start = vlo
-                    self.env.stretch_sliderint.end = vhi
-                    self.env.stretch_sliderint.value = (lo, hi)
+            if self._apply_echelle_stretch():
                 self.env.dnu_slider.start = 0.01
                 self.env.dnu_slider.end = self.env.maxdnu
             if self.env.check_show_horizontal_lines.active[0]==0:
@@ -1261,6 +1540,115 @@ class Interactive(Environment):
         self.make_grid()
         self.publish_message(text='Ready')
 
+    def _apply_echelle_stretch(self):
+        """
+        Sets the palette, colour mapper and stretch slider of the echelle image.
+
+        The stretch limits are the 0.1 and 99.9 percentiles of the trimmed
+        power, estimated from a histogram by `self.echelle_engine`. Delta Nu
+        only reshapes the power, so they are computed once per trim (or grid
+        type) and reused while delta Nu changes.
+
+        Returns:
+            bool: False if there is no power to stretch, in which case
+                nothing is changed.
+        """
+        limits = self.echelle_engine.stretch_limits()
+        if limits is None:
+            return False
+        lo, hi = limits
+        vlo, vhi = 0.3 * lo, 1.7 * hi
+
+        pal=getattr(bokeh.palettes, self.env.select_color_palette.value)
+        if type(pal)==dict:
+            self.palette = pal[9]
+        else:
+            self.palette = pal
+
+        if self.env.check_reverse_color_palette.active[0]!=1:
+            self.palette = list(reversed(self.palette))
+        # Lock color mapper
+        if self.env.check_color_map_lock.active[0]==1:
+            print('Value of colormap check',self.env.check_color_map_lock.active[0])
+            if self.env.echelle_quantized:
+                # The browser maps palette indices; the stretch is applied here
+                self.echelle_color_mapper.update(palette=self.palette, low=0,
+                                                 high=len(self.palette))
+                self._set_echelle_stretch(lo, hi)
+            else:
+                color_mapper = LogColorMapper(palette=self.palette, low=lo, high=hi)
+                self.env.fig_tpfint.select(
+                    'img').glyph.color_mapper.low = color_mapper.low
+                self.env.fig_tpfint.select(
+                    'img').glyph.color_mapper.high = color_mapper.high
+                self.env.fig_tpfint.select(
+                    'img').glyph.color_mapper.palette = getattr(color_mapper,'palette')
+            self.env.stretch_sliderint.start = vlo
+            self.env.stretch_sliderint.end = vhi
+            self.env.stretch_sliderint.value = (lo, hi)
+        return True
+
+    def _echelle_stretch_target(self):
+        """
+        Returns the colour stretch (lo, hi) the echelle image is drawn with.
+
+        It is the automatic stretch of `_apply_echelle_stretch` unless the
+        colour map is locked, in which case the current stretch is kept.
+        """
+        limits = self.echelle_engine.stretch_limits()
+        if self.echelle_stretch is None or (
+                limits is not None and self.env.check_color_map_lock.active[0]==1):
+            self.echelle_stretch = limits if limits is not None else (10, 100)
+        return self.echelle_stretch
+
+    def _quantized_echelle_image(self, lo, hi):
+        """
+        Returns the echelle image as uint8 palette indices (`echelle_quantized`).
+
+        The indices are computed on the server for the current palette, as
+        `LogColorMapper` would in the browser, and cached by
+        `self.echelle_engine`, so the image is an eighth of the float64 power.
+
+        Args:
+            lo (float): Power mapped to the first colour.
+            hi (float): Power mapped to the last colour.
+        """
+        n_colors = self._echelle_n_colors()
+        self.echelle_quantized_key = (lo, hi, n_colors)
+        return self.echelle_engine.quantized_image(self.env.dnu_val, lo, hi, n_colors)
+
+    def _echelle_n_colors(self):
+        """Returns the number of colours of the palette the echelle image is shown with."""
+        if self.echelle_color_mapper is None:
+            return len(self.palette)
+        return len(self.echelle_color_mapper.palette)
+
+    def _set_echelle_stretch(self, lo, hi):
+        """
+        Changes the colour stretch of a quantized echelle image.
+
+        Only the image is re-sent, as a patch, and only when the stretch or
+        the number of colours of the palette changed.
+
+        Args:
+            lo (float): Power mapped to the first colour.
+            hi (float): Power mapped to the last colour.
+        """
+        self.echelle_stretch = (lo, hi)
+        source = self.env.tb_echelle_diagram
+        if (source is None or len(source.data['image']) == 0
+                or self.echelle_quantized_key == (lo, hi, self._echelle_n_colors())):
+            return
+        image = self._quantized_echelle_image(lo, hi)
+        if self.echelle_lod is not None:
+            if self.echelle_lod.image is None or image.shape != self.echelle_lod.image.shape:
+                return
+            image = self.echelle_lod.set_image(image, *self.echelle_lod.extent)['image']
+        if image.shape == np.shape(source.data['image'][0]):
+            with self.env.metrics.stage('push'):
+                source.patch({'image': [(0, image)]})
+            self._refine_echelle()
+
     def _validate_numax(self, numax):
         """
         Validates the nu_max (frequency of maximum power) value.
@@ -1290,7 +1678,7 @@ class Interactive(Environment):
         """
         Validates the delta Nu (large frequency separation) value.
 
-        If `deltanu` is None, it returns `self.dnu_val` (the current delta Nu
+        If `deltanu` is None, it returns `self.env.dnu_val` (the current delta Nu
         value from the UI or environment).
 
         Args:
@@ -1300,18 +1688,127 @@ class Interactive(Environment):
             float: The validated delta Nu value.
 
         Raises:
-            AttributeError: If `deltanu` is None and `self.dnu_val` is not available
+            AttributeError: If `deltanu` is None and `self.env.dnu_val` is not available
                             (should not happen in normal operation).
         """
         if deltanu is None:
             try:
                 print('Check here') # Debug print
-                return self.dnu_val
+                return self.env.dnu_val
             except AttributeError:
                 raise AttributeError(
-                    "You need to call `Seismology.estimate_deltanu()` first.") # Or have self.dnu_val defined
+                    "You need to call `Seismology.estimate_deltanu()` first.") # Or have self.env.dnu_val defined
         return deltanu
 
+    def _echelle_range(self, periodogram=None, minimum_frequency=None, maximum_frequency=None):
+        """
+        Returns the periodogram arrays restricted to the echelle frequency range.
+
+        The range is the open interval between the integer parts of
+        `self.env.minimum_frequency` and `self.env.maximum_frequency`. The
+        arrays come from the float64 `self.periodogram`, not from
+        `self.env.tb_other_periodogram`, whose power column may be stored
+        with a smaller `env.power_dtype` for the browser.
+
+        Args:
+            periodogram (lightkurve.periodogram.Periodogram, optional):
+                Periodogram to restrict. Defaults to None, `self.periodogram`.
+            minimum_frequency (float, optional): Lower limit. Defaults to
+                None, `self.env.minimum_frequency`.
+            maximum_frequency (float, optional): Upper limit. Defaults to
+                None, `self.env.maximum_frequency`.
+
+        Returns:
+            tuple: A tuple containing:
+                - freq (numpy.ndarray): Frequencies inside the range.
+                - power (numpy.ndarray): Corresponding power values.
+        """
+        if periodogram is None:
+            periodogram = self.periodogram
+        if minimum_frequency is None:
+            minimum_frequency = self.env.minimum_frequency
+        if maximum_frequency is None:
+            maximum_frequency = self.env.maximum_frequency
+        if periodogram is None:
+            return np.empty(0), np.empty(0)
+        freq = np.asarray(periodogram.frequency.value, dtype=np.float64)
+        power = np.asarray(periodogram.power.value, dtype=np.float64)
+
+        minf = int(minimum_frequency)
+        maxf = int(maximum_frequency)
+        ind = (freq < maxf) & (freq > minf)
+        return freq[ind], power[ind]
+
+    def index_periodogram(self, smoothed=None):
+        """
+        Loads the current periodogram into `self.echelle_engine` and `self.frequency_index`.
+
+        Called after every trim, so that the incremental echelle builder
+        works on the same frequency range as `_clean_echelle` and the bin ids
+        of the frequency index are the rows of `self.env.tb_other_periodogram`.
+
+        Args:
+            smoothed (dict, optional): Smoothed echelle power computed by
+                `_compute_trim`, passed to `EchelleEngine.set_data`. Defaults
+                to None.
+        """
+        freq, power = self._echelle_range()
+        self.echelle_engine.set_data(freq, power, smoothed=smoothed)
+        self.frequency_index.set_periodogram(self.env.tb_other_periodogram.data['frequency'])
+
+    def _patch_modes(self, source, rows, labels):
+        """
+        Sets the 'Mode' labels of some rows of a plot source with `ColumnDataSource.patch`.
+
+        Rows whose label does not change are skipped, so only the changed
+        entries are sent to the browser.
+
+        Args:
+            source (ColumnDataSource): `self.env.tb_grid_source` or
+                `self.env.tb_other_periodogram`.
+            rows (numpy.ndarray): Row indices to label.
+            labels (numpy.ndarray): Mode label of each row. When a row appears
+                more than once, its last label wins.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        labels = np.asarray(labels, dtype=object)
+        if rows.size == 0:
+            return
+        _, last = np.unique(rows[::-1], return_index=True)
+        keep = rows.size - 1 - last
+        rows = rows[keep]
+        labels = labels[keep]
+        changed = np.asarray(source.data['Mode'], dtype=object)[rows] != labels
+        if not changed.any():
+            return
+        source.patch({'Mode': list(zip(rows[changed].tolist(), labels[changed].tolist()))})
+
+    def _assign_mode(self, source, rows, mode):
+        """
+        Sets the same 'Mode' label on some rows of a plot source.
+
+        Args:
+            source (ColumnDataSource): `self.env.tb_grid_source` or
+                `self.env.tb_other_periodogram`.
+            rows (numpy.ndarray): Row indices to label.
+            mode (str): Mode label to assign.
+        """
+        self._patch_modes(source, rows, np.full(len(rows), str(mode), dtype=object))
+
+    def prefetch_echelle(self):
+        """
+        Precomputes the echelle grids of the delta Nu values next to the current one.
+
+        The offsets in `self.env.echelle_prefetch_band` match the steps of the
+        dnu slider buttons, so that `<`, `>`, `<<` and `>>` presses find their
+        grid already computed.
+        """
+        if not self.env.echelle_incremental or self.env.check_make_grid.active[0]!=0:
+            return
+        cutt_off = float(self.env.echelle_noise_cuttoff_text.value)
+        dnus = [self.env.dnu_val + step for step in self.env.echelle_prefetch_band]
+        self.echelle_engine.prefetch(dnus, cutt_off)
+
     def _clean_echelle(self, deltanu=None, numax=None,
                        minimum_frequency=None, maximum_frequency=None,
                        smooth_filter_width=None, scale='linear'):
@@ -1323,11 +1820,14 @@ class Interactive(Environment):
         Uses an adaptation of echelle diagram generation logic (similar to that
         found in Lightkurve or other asteroseismology tools, here specifically
         calling `self.apollinaire_echelle` for the core processing) to reshape
-        the frequency and power arrays.
+        the frequency and power arrays. In incremental mode
+        (`self.env.echelle_incremental`) the trimmed arrays and the reshape are
+        taken from `self.echelle_engine` and the flattened grid coordinates are
+        not built; `make_grid` asks the engine for the thresholded points instead.
 
         Args:
             deltanu (float, optional): Large frequency separation in units consistent
-                with the periodogram's frequency. If None, uses `self.dnu_val`.
+                with the periodogram's frequency. If None, uses `self.env.dnu_val`.
             numax (float, optional): Frequency of maximum oscillation power. Used to
                 set default frequency ranges if min/max_frequency are not provided.
                 Units should be consistent with periodogram frequency.
@@ -1336,7 +1836,10 @@ class Interactive(Environment):
             maximum_frequency (float, optional): Maximum frequency for the echelle.
                 Units should be consistent with periodogram frequency.
             smooth_filter_width (float, optional): Width for smoothing the periodogram
-                before echelle generation. Units should be consistent.
+                before echelle generation. Units should be consistent. If None,
+                uses `self.env.echelle_smooth_width` and `echelle_smooth_kind`;
+                in incremental mode the engine smooths the power instead, once
+                per trim and width.
             scale (str, optional): Scale for power in the echelle diagram ('linear'
                 or 'log'). Defaults to 'linear'.
 
@@ -1346,10 +1849,12 @@ class Interactive(Environment):
                 - x_f (Quantity): 1D array for the x-axis of the echelle (frequency modulo deltanu).
                 - y_f (Quantity): 1D array for the y-axis of the echelle (frequency slices).
                 - y_original (Quantity): Original y-axis frequency values before centering.
-                - xx (list): Flattened x-coordinates for scatter points on echelle.
-                - yy (list): Flattened y-coordinates for scatter points on echelle.
-                - freq_values (list): Flattened original frequency values corresponding to xx, yy.
-                - power_values (list): Flattened original power values corresponding to xx, yy.
+                - xx (ndarray): Flattened x-coordinates for scatter points on echelle
+                  (None in incremental mode).
+                - yy (ndarray): Flattened y-coordinates for scatter points on echelle
+                  (None in incremental mode).
+                - freq_values (ndarray): Flattened original frequency values corresponding to xx, yy.
+                - power_values (ndarray): Flattened original power values corresponding to xx, yy.
         """
         # if (minimum_frequency is None) & (maximum_frequency is None):
         #     numax = self._validate_numax(numax) # numax validation handled if used
@@ -1456,17 +1961,17 @@ class Interactive(Environment):
         # # print('x_f max',x_f.max(),deltanu)
         # y_f = (ef[:, 0])
 
-        freq = self.env.tb_other_periodogram.data['frequency']
-        power = self.env.tb_other_periodogram.data['power']
-
-        data_frame = pd.DataFrame()
-        data_frame['freq'] = freq
-        data_frame['power'] = power
-
-        minf = int(self.env.minimum_frequency)
-        maxf = int(self.env.maximum_frequency)
-        data_frame = data_frame.query('freq<@maxf & freq>@minf')
-        if data_frame.empty:
+        if self.env.echelle_incremental:
+            freq = self.echelle_engine.freq
+            power = self.echelle_engine.power
+        else:
+            freq, power = self._echelle_range()
+            if smooth_filter_width is None:
+                smooth_filter_width = self.env.echelle_smooth_width
+            if smooth_filter_width > 0 and freq.size > 1:
+                power = echelle.smooth_power(power, smooth_filter_width/(freq[1] - freq[0]),
+                                             self.env.echelle_smooth_kind)
+        if freq.size == 0:
             ep=np.array([])
             x_f=np.array([])
             y_f=np.array([])
@@ -1475,12 +1980,19 @@ class Interactive(Environment):
             y_original=np.array([])
             xx=np.array([])
             yy=np.array([])
-        else:    
-            ep, x_f, y_f, xx, yy, freq_values, power_values = self.apollinaire_echelle(
-                data_frame.freq.values,
-                data_frame.power.values,
-                deltanu.value
-            )
+        else:
+            if self.env.echelle_incremental:
+                ep, x_f, y_f = self.echelle_engine.image(deltanu.value)
+                xx = None
+                yy = None
+                freq_values = freq[:ep.size]
+                power_values = ep.reshape(-1)
+            else:
+                ep, x_f, y_f, xx, yy, freq_values, power_values = self.apollinaire_echelle(
+                    freq,
+                    power,
+                    deltanu.value
+                )
 
             y_original = y_f
             mean_diff = np.mean(np.diff(y_f))
@@ -1650,7 +2162,6 @@ class Interactive(Environment):
 
         freq = self.env.tb_other_periodogram.data['frequency'] * \
             self.env.frequency_unit
-        ep = self.env.tb_echelle_diagram.data['image']*self.env.power_unit
         x_f = self.env.tb_echelle_diagram.data['x_f']*self.env.frequency_unit
         y_f = self.env.tb_echelle_diagram.data['y_f']*self.env.frequency_unit
 
@@ -1662,14 +2173,21 @@ class Interactive(Environment):
 
         fig.yaxis.axis_label = r'Frequency [{}]'.format(freq.unit.to_string())
         fig.xaxis.axis_label = r'Frequency / {:.3f} Mod. 1'.format(deltanu)
-        if ep.value.any():
-            lo, hi = np.nanpercentile(ep.value, [0.1, 99.9])
+        limits = self.echelle_engine.stretch_limits()
+        if limits is not None:
+            lo, hi = limits
         else:
             lo=10
             hi=100
         vlo, vhi = 0.3 * lo, 1.7 * hi
         vstep = (lo - hi)/500
-        color_mapper = LogColorMapper(palette=self.palette, low=lo, high=hi)
+        if self.env.echelle_quantized:
+            # The image holds palette indices (see _quantized_echelle_image)
+            self.echelle_stretch = (lo, hi)
+            color_mapper = LinearColorMapper(palette=self.palette, low=0, high=len(self.palette))
+        else:
+            color_mapper = LogColorMapper(palette=self.palette, low=lo, high=hi)
+        self.echelle_color_mapper = color_mapper
 
         fig.image(image='image',
                   x='xmin',
@@ -1679,6 +2197,23 @@ class Interactive(Environment):
                   color_mapper=color_mapper,
                   name='img',
                   source=self.env.tb_echelle_diagram)
+        # Finer tile of the visible region, drawn over the pooled overview
+        # (see lod.EchelleLOD)
+        self.env.tb_echelle_tile = ColumnDataSource(data=dict(image=[], x=[], y=[], dw=[], dh=[]))
+        fig.image(image='image',
+                  x='x',
+                  y='y',
+                  dw='dw',
+                  dh='dh',
+                  color_mapper=color_mapper,
+                  name='img_tile',
+                  source=self.env.tb_echelle_tile)
+        self.echelle_lod = EchelleLOD(self.env.tb_echelle_tile,
+                                      max_pixels=self.env.echelle_lod_pixels,
+                                      how=self.env.echelle_lod_pooling,
+                                      enabled=self.env.echelle_lod)
+        fig.on_event(RangesUpdate, self.echelle_range_update)
+        fig.on_event(Reset, self.echelle_range_reset)
         # from bokeh.models import Div
         # style = Div(
         #     text="""
@@ -1705,6 +2240,9 @@ class Interactive(Environment):
 
         def stretch_change_callback(attr, old, new):
             """TPF stretch slider callback."""
+            if self.env.echelle_quantized:
+                self._set_echelle_stretch(*new)
+                return
             fig.select('img')[0].glyph.color_mapper.high = new[1]
             fig.select('img')[0].glyph.color_mapper.low = new[0]
 
@@ -1744,8 +2282,7 @@ class Interactive(Environment):
         # minimum_frequency = kwargs.pop(
         #     'minimum_frequency', self.periodogram.frequency. min().value)
 
-        dnu = SeismologyQuantity(quantity=self.env.dnu_val*u.microhertz,
-                                 name='deltanu', method='echelle')
+        dnu = self.env.dnu_val*u.microhertz
 
         def create_interact_ui():
             self.env.fig_tpfint, self.env.stretch_sliderint = self._make_echelle_elements(deltanu=dnu,
@@ -1772,17 +2309,16 @@ class Interactive(Environment):
 
             def update(attr, old, new):
                 """Callback to take action when dnu slider changes"""
-                dnu = SeismologyQuantity(quantity=self.env.dnu_slider.value*self.env.frequency_unit,
-                                         name='deltanu',
-                                         method='echelle')
+                dnu = self.env.dnu_slider.value*self.env.frequency_unit
+                self.env.dnu_val = self.env.dnu_slider.value
 
                 self.make_tb_echelle_diagram()
                 self.make_grid()
 
                 self.env.fig_tpfint.xaxis.axis_label = r'Frequency / {:.3f} Mod. 1'.format(
                     dnu)
-                self.env.dnu_val = self.env.dnu_slider.value
                 self.env.dnu_text.value = str(self.env.dnu_slider.value)
+                self.prefetch_echelle()
 
             def go_right_by_one_small():
                 """Step forward in time by a single cadence"""
@@ -1792,7 +2328,7 @@ class Interactive(Environment):
 
             def go_left_by_one_small():
                 """Step back in time by a single cadence"""
-                existing_value = self.dnu_slider.value
+                existing_value = self.env.dnu_slider.value
                 if existing_value > 0:
                     self.env.dnu_slider.value = existing_value - 0.1
 
@@ -1816,62 +2352,190 @@ class Interactive(Environment):
 
         create_interact_ui()
 
+    def make_dnu_scan_elements(self):
+        """
+        Creates the widgets and figures of the delta Nu scan.
+
+        The scan range defaults to +/-20% of the current delta Nu. The heatmap
+        (`fig_dnu_scan`) shows the collapsed echelle spectrum of every trial
+        delta Nu, each normalized to its mean, and `fig_dnu_scan_score` their
+        ridge-sharpness score; clicking either figure sets `dnu_slider` to the
+        nearest trial delta Nu.
+        """
+        dnu = self.env.dnu_val
+        self.env.dnu_scan_min_text = TextInput(
+            value='{:.2f}'.format(0.8*dnu), title="Scan min", width=80)
+        self.env.dnu_scan_max_text = TextInput(
+            value='{:.2f}'.format(1.2*dnu), title="Scan max", width=80)
+        self.env.dnu_scan_step_text = TextInput(
+            value=str(0.02), title="Scan step", width=80)
+        self.env.dnu_scan_button = Button(
+            label="Scan Delta Nu", button_type=self.env.button_type, width=150)
+        self.env.dnu_scan_button.on_click(self.click_dnu_scan_button)
+        self.env.dnu_scan_text = Div(text="", width=300)
+        # Trial delta Nu of the last scan, looked up by the click callback
+        self.dnu_scan_trials = np.array([])
+
+        self.env.tb_dnu_scan = ColumnDataSource(
+            data=dict(image=[], x=[], y=[], dw=[], dh=[]))
+        self.env.tb_dnu_scan_score = ColumnDataSource(
+            data=dict(dnu=np.array([]), score=np.array([])))
+
+        fig = figure(width=450, height=300, title='Delta Nu scan',
+                     x_range=(0, 1), tools='pan,box_zoom,reset,tap',
+                     x_axis_label='Frequency / Delta Nu Mod. 1',
+                     y_axis_label='Delta Nu [{}]'.format(self.env.frequency_unit_string))
+        fig.image(image='image', x='x', y='y', dw='dw', dh='dh',
+                  source=self.env.tb_dnu_scan,
+                  color_mapper=LinearColorMapper(palette='Viridis256'))
+        score_fig = figure(width=150, height=300, title='Score',
+                           y_range=fig.y_range, tools='pan,box_zoom,reset,tap',
+                           x_axis_label='Ridge sharpness')
+        score_fig.line(x='score', y='dnu', source=self.env.tb_dnu_scan_score)
+        score_fig.yaxis.visible = False
+        for scan_fig in (fig, score_fig):
+            scan_fig.on_event(Tap, self.dnu_scan_tap)
+        self.env.fig_dnu_scan = fig
+        self.env.fig_dnu_scan_score = score_fig
+
+    def click_dnu_scan_button(self):
+        """
+        Scans the delta Nu range of the scan widgets in the background.
+
+        Every trial delta Nu is folded on the trimmed periodogram of the
+        echelle diagram by `echelle.dnu_scan`; the result is drawn by
+        `_plot_dnu_scan`. Clicking again before the scan ended discards the
+        previous result.
+        """
+        try:
+            lo = float(self.env.dnu_scan_min_text.value)
+            hi = float(self.env.dnu_scan_max_text.value)
+            step = float(self.env.dnu_scan_step_text.value)
+        except ValueError:
+            self.publish_message('Scan: min, max and step must be numbers')
+            return
+        if not 0 < lo < hi or step <= 0:
+            self.publish_message('Scan: 0 < min < max and step > 0 required')
+            return
+        dnus = np.arange(lo, hi + step/2, step)
+        if dnus.size > self.env.dnu_scan_max_trials:
+            self.publish_message('Scan: {} trials, more than {}; increase the step'.format(
+                dnus.size, self.env.dnu_scan_max_trials))
+            return
+        freq = self.echelle_engine.freq
+        power = self.echelle_engine.power
+        if freq.size < 2:
+            self.publish_message('Scan: no periodogram in the frequency range')
+            return
+        n_phase = self.env.dnu_scan_phase_bins
+        max_elements = self.env.dnu_scan_max_elements
+
+        def work(task):
+            with self.env.metrics.stage('scan'):
+                collapsed, score = echelle.dnu_scan(freq, power, dnus, n_phase=n_phase,
+                                                    max_elements=max_elements)
+            return dnus, collapsed, score
+
+        self.tasks.submit('dnu_scan', work, done=self._plot_dnu_scan, label='Scanning')
+
+    @timed
+    def _plot_dnu_scan(self, result):
+        """
+        Draws the collapsed spectra and scores of a delta Nu scan.
+
+        Args:
+            result (tuple): Trial delta Nu, collapsed spectra and scores, as
+                returned by the work of `click_dnu_scan_button`.
+        """
+        dnus, collapsed, score = result
+        self.dnu_scan_trials = dnus
+        mean = collapsed.mean(axis=1, keepdims=True)
+        image = collapsed/np.where(mean > 0, mean, 1)
+        step = dnus[1] - dnus[0] if dnus.size > 1 else 1.0
+        with self.env.metrics.stage('push'):
+            self.env.tb_dnu_scan.data = dict(image=[image], x=[0], y=[dnus[0] - step/2],
+                                             dw=[1], dh=[dnus.size*step])
+            self.env.tb_dnu_scan_score.data = dict(dnu=dnus, score=score)
+        best = int(np.argmax(score))
+        self.env.dnu_scan_text.text = ('Best Delta Nu {:.3f} (score {:.3f}); '
+                                       'click the scan to set Delta Nu'.format(dnus[best], score[best]))
+        self.publish_message('Ready')
+
+    @timed
+    def dnu_scan_tap(self, event):
+        """
+        Sets `dnu_slider` to the trial delta Nu nearest to a click on the scan.
+
+        Args:
+            event (bokeh.events.Tap): Click event; `event.y` is the delta Nu.
+        """
+        if self.dnu_scan_trials.size == 0 or event.y is None:
+            return
+        nearest = self.dnu_scan_trials[np.argmin(np.abs(self.dnu_scan_trials - event.y))]
+        value = min(max(round(float(nearest), 2), self.env.dnu_slider.start), self.env.dnu_slider.end)
+        self.env.dnu_slider.value = value
+
     def apollinaire_echelle(self, freq, PSD, dnu, twice=False, fig=None, index=111,
                             figsize=(16, 16), title=None,
-                            smooth=10, cmap='cividis', cmap_scale='linear',
+                            smooth=1, cmap='cividis', cmap_scale='linear',
                             mode_freq=None, mode_freq_err=None,
                             vmin=None, vmax=None, scatter_color='white', fmt='+', ylim=None,
                             shading='gouraud', mfc='none', ms=20, index_offset=None,
                             mec=None, xlabel=None, ylabel=None, **kwargs):
-            """
-            Builds the echelle diagram data from a given Power Spectral Density (PSD).
-
-            This method takes frequency and PSD arrays, and a delta Nu value,
-            and reshapes the PSD into an echelle diagram format. It determines the
-            number of slices and the length of each slice based on delta Nu and
-            the frequency resolution.
-
-            This is largely based on the echelle diagram generation logic from the
-            Apollinaire library or similar tools.
-
-            Args:
-                freq (ndarray): Input vector of frequencies.
-                PSD (ndarray): Input vector of power. Must be of same size as freq.
-                dnu (float): The large frequency separation used to cut slices.
-                twice (bool, optional): If True, slice using 2 * dnu. Defaults to False.
-                fig (matplotlib.figure.Figure, optional): Matplotlib figure (not used in current Bokeh context).
-                index (int, optional): Subplot index (not used in current Bokeh context).
-                figsize (tuple, optional): Figure size (not used in current Bokeh context).
-                title (str, optional): Plot title (not used in current Bokeh context).
-                smooth (int, optional): Window size for rolling mean smoothing of PSD (not directly used here, smoothing expected before call).
-                cmap (str, optional): Colormap (handled by Bokeh).
-                cmap_scale (str, optional): Scale for colormap ('linear' or 'logarithmic').
-                mode_freq (ndarray or tuple, optional): Frequencies of modes to overplot (not used here).
-                mode_freq_err (ndarray or tuple, optional): Uncertainties for mode_freq (not used here).
-                vmin (float, optional): Minimum value for colormap.
-                vmax (float,optional): Maximum value for colormap.
-                scatter_color (str, optional): Color for scatter points (not used here).
-                fmt (str or tuple, optional): Format for error bars (not used here).
-                ylim (tuple, optional): Y-axis limits for plot.
-                shading (str, optional): Shading for pcolormesh (e.g., 'gouraud', 'flat').
-                mfc (str, optional): Marker face color.
-                ms (float, optional): Marker size.
-                index_offset (int, optional): Offset for slicing PSD and freq arrays.
-                mec (str, optional): Marker edge color.
-                xlabel (str, optional): X-axis label.
-                ylabel (str, optional): Y-axis label.
-                **kwargs: Additional arguments.
-
-            Returns:
-                tuple:
-                    - ed (ndarray): The 2D echelle diagram power array.
-                    - x_freq (ndarray): The x-coordinates (frequency modulo dnu).
-                    - y_freq (ndarray): The y-coordinates (base frequency of each slice).
-                    - xx (list): Flattened x-coordinates of the full grid.
-                    - yy (list): Flattened y-coordinates of the full grid.
-                    - freq_values (list): Flattened original frequency values on the grid.
-                    - power_values (list): Flattened power values on the grid.
-            """
+        """
+        Builds the echelle diagram data from a given Power Spectral Density (PSD).
+
+        This method takes frequency and PSD arrays, and a delta Nu value,
+        and reshapes the PSD into an echelle diagram format. It determines the
+        number of slices and the length of each slice based on delta Nu and
+        the frequency resolution. The work is delegated to the `echelle`
+        module, which keeps every output as a contiguous NumPy array (the
+        image and the flattened frequency/power values are views of the
+        inputs) and derives the grid coordinates without a `np.meshgrid`.
+
+        This is largely based on the echelle diagram generation logic from the
+        Apollinaire library or similar tools.
+
+        Args:
+            freq (ndarray): Input vector of frequencies.
+            PSD (ndarray): Input vector of power. Must be of same size as freq.
+            dnu (float): The large frequency separation used to cut slices.
+            twice (bool, optional): If True, slice using 2 * dnu. Defaults to False.
+            fig (matplotlib.figure.Figure, optional): Matplotlib figure (not used in current Bokeh context).
+            index (int, optional): Subplot index (not used in current Bokeh context).
+            figsize (tuple, optional): Figure size (not used in current Bokeh context).
+            title (str, optional): Plot title (not used in current Bokeh context).
+            smooth (int, optional): Window size, in bins, of the centred moving
+                average applied to the PSD (`echelle.boxcar_smooth`). Defaults
+                to 1, no smoothing.
+            cmap (str, optional): Colormap (handled by Bokeh).
+            cmap_scale (str, optional): Scale for colormap ('linear' or 'logarithmic').
+            mode_freq (ndarray or tuple, optional): Frequencies of modes to overplot (not used here).
+            mode_freq_err (ndarray or tuple, optional): Uncertainties for mode_freq (not used here).
+            vmin (float, optional): Minimum value for colormap.
+            vmax (float,optional): Maximum value for colormap.
+            scatter_color (str, optional): Color for scatter points (not used here).
+            fmt (str or tuple, optional): Format for error bars (not used here).
+            ylim (tuple, optional): Y-axis limits for plot.
+            shading (str, optional): Shading for pcolormesh (e.g., 'gouraud', 'flat').
+            mfc (str, optional): Marker face color.
+            ms (float, optional): Marker size.
+            index_offset (int, optional): Offset for slicing PSD and freq arrays.
+            mec (str, optional): Marker edge color.
+            xlabel (str, optional): X-axis label.
+            ylabel (str, optional): Y-axis label.
+            **kwargs: Additional arguments.
+
+        Returns:
+            tuple:
+                - ed (ndarray): The 2D echelle diagram power array.
+                - x_freq (ndarray): The x-coordinates (frequency modulo dnu).
+                - y_freq (ndarray): The y-coordinates (base frequency of each slice).
+                - xx (ndarray): Flattened x-coordinates of the full grid.
+                - yy (ndarray): Flattened y-coordinates of the full grid.
+                - freq_values (ndarray): Flattened original frequency values on the grid.
+                - power_values (ndarray): Flattened power values on the grid.
+        """
 
         # if cmap_scale not in ['linear', 'logarithmic'] :
         #     raise Exception ("cmap_scale should be set to 'linear' or 'logarithmic'.")
@@ -1888,26 +2552,16 @@ class Interactive(Environment):
         # if twice==True :
         #     dnu = 2.*dnu
         # print('freq',freq)
-        res = freq[2]-freq[1]
-
         # if index_offset is not None :
         #     PSD = PSD[index_offset:]
         #     freq = freq[index_offset:]
 
-        n_slice = int(np.floor_divide(freq[-1]-freq[0], dnu))
-        len_slice = int(np.floor_divide(dnu, res))
-
-        if (n_slice*len_slice > PSD.size):
-            len_slice -= 1
-
-        ed = PSD[:len_slice*n_slice]
-        ed = np.reshape(ed, (n_slice, len_slice))
-
-        freq_ed = freq[:len_slice*n_slice]
-        freq_ed = np.reshape(freq_ed, (n_slice, len_slice))
+        freq = np.ascontiguousarray(freq, dtype=np.float64)
+        PSD = np.ascontiguousarray(PSD, dtype=np.float64)
+        if smooth > 1:
+            PSD = echelle.boxcar_smooth(PSD, smooth)
+        ed, x_freq, y_freq = echelle.echelle_image(freq, PSD, dnu)
         # x_freq = freq_ed[0,:] - freq_ed[0,0]
-        x_freq = freq_ed[0, :]
-        y_freq = freq_ed[:, 0]
 
         # if fig is None :
         #     fig = plt.figure (figsize=figsize)
@@ -1962,91 +2616,100 @@ class Interactive(Environment):
         # if title is not None :
         #     ax.set_title (title)
 
-        value = freq_ed
-        x = x_freq
-        y = y_freq
-        xx, yy = np.meshgrid(x, y, sparse=False)
-        xx = xx.reshape(-1, 1).flatten().tolist()
-        yy = yy.reshape(-1, 1).flatten().tolist()
-        freq_values = value.reshape(-1, 1).flatten().tolist()
-
-        power_values = ed.reshape(-1, 1).flatten().tolist()
+        xx, yy = echelle.echelle_coordinates(x_freq, y_freq)
+        freq_values = freq[:ed.size]
+        power_values = ed.reshape(-1)
 
         return ed, x_freq, y_freq, xx, yy, freq_values, power_values
 
     def clear_se_table1(self):
         """Clears all data from the first mode selection table (Table 1)."""
 
-        old_data = ColumnDataSource(
-            data=dict(Slicefreq=[], Frequency=[], Power=[],Mode=[], xx=[]))
-        self.tb_se_first_source.data = dict(old_data.data)
+        self.table_first.clear()
 
     def clear_se_table2(self):
         """Clears all data from the second mode selection table (Table 2)."""
 
-        old_data = ColumnDataSource(
-            data=dict(Slicefreq=[], Frequency=[], Power=[],Mode=[], xx=[]))
-        self.tb_se_second_source.data = dict(old_data.data)
+        self.table_second.clear()
+
+    def grid_rows_to_table(self, rows):
+        """
+        Returns echelle grid points in the layout of the selection tables.
+
+        Args:
+            rows (array-like): Row indices into `self.env.tb_grid_source`.
 
+        Returns:
+            pandas.DataFrame: Columns 'Slicefreq', 'Frequency', 'Power', 'Mode'
+                and 'xx' of the grid points, in the order of `rows`.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        data = self.env.tb_grid_source.data
+        return pd.DataFrame(dict(Slicefreq=np.asarray(data['yy'])[rows],
+                                 Frequency=np.asarray(data['freq_values'])[rows],
+                                 Power=np.asarray(data['power_values'])[rows],
+                                 Mode=np.asarray(data['Mode'], dtype=object)[rows],
+                                 xx=np.asarray(data['xx'])[rows]))
+
+    @timed
     def find_peak_frequencies(self):
         """
         Identifies and selects peak frequencies within currently selected echelle grid regions.
 
         For the points currently selected in `self.env.tb_grid_source` (the echelle
-        diagram grid), this function groups them by their y-coordinate (`yy`,
-        representing frequency slices). Within each group (slice), it finds the point
-        with the maximum power.
+        diagram grid), this function finds the point with the maximum power in
+        every frequency slice (`yy`), with one reduction over the selected
+        points (`echelle.slice_argmax`).
         It then updates the selection in `self.env.tb_grid_source` to only these
         peak frequencies and calls `get_all_selection_button()` to populate Table 1
         with these peaks. It also clears selections on the main periodogram.
         """
+        se_indices = np.asarray(self.env.tb_grid_source.selected.indices, dtype=np.int64)
+        yy = np.asarray(self.env.tb_grid_source.data['yy'])[se_indices]
+        power_values = np.asarray(self.env.tb_grid_source.data['power_values'],
+                                  dtype=np.float64)[se_indices]
+        peaks = se_indices[echelle.slice_argmax(yy, power_values)]
 
-        df_se = pd.DataFrame()
-        yy = self.env.tb_grid_source.data['yy']
-        xx = self.env.tb_grid_source.data['xx']
-        freq_values = self.env.tb_grid_source.data['freq_values']
-        power_values = self.env.tb_grid_source.data['power_values']
-
-        df_se['freq_values'] = freq_values
-        df_se['power_values'] = power_values
-        df_se['xx'] = xx
-        df_se['yy'] = yy
-
-        se_indices = self.env.tb_grid_source.selected.indices
-        real_freq = df_se.freq_values.loc[se_indices]
-        real_power = df_se.power_values.loc[se_indices]
-        xx_f = df_se.xx.loc[se_indices]
-        yy_f = df_se.yy.loc[se_indices]
-        df_se_freq = pd.DataFrame()
-        df_se_freq['indices'] = se_indices
-        df_se_freq['real_freq'] = real_freq.values
-        df_se_freq['real_power'] = real_power.values
-        df_se_freq['xx'] = xx_f.values
-        df_se_freq['yy'] = yy_f.values
-
-        # print(' All selected freq', df_se_freq)
-        max_indices = df_se_freq.groupby('yy')['real_power'].idxmax()
-        # print(' Max indices', max_indices)
-        df_se_freq = df_se_freq.loc[max_indices]
-        # print(' filetered', df_se_freq)
-
-        self.tb_other_periodogram.selected.indices = list([])
-
-
-        self.env.tb_grid_source.selected.indices = df_se_freq['indices'].to_list(
-        )
+        self.env.tb_other_periodogram.selected.indices = list([])
+        self.env.tb_grid_source.selected.indices = peaks.tolist()
         self.clear_se_table1()
         self.get_all_selection_button()
-        #print('Selected indices', self.env.tb_grid_source.selected.indices)
-
-        # Clear prd selections
-
-        # self.selection_grid_to_prd_fig(0,0,0)
-        # self.update_plot(0, 0, 0)
-
-        #self.get_all_selection_button()
 
+    @timed
+    def click_auto_peaks_button(self):
+        """
+        Fills Table 1 with the peaks above a signal-to-noise ratio in every slice.
+
+        The local maxima of the echelle power (smoothed, if set) whose ratio
+        to the noise of their slice is at least the value of
+        `self.env.auto_peaks_snr_text` are found in one pass over the trimmed
+        range (`EchelleEngine.peaks`); peaks closer than
+        `self.env.auto_peaks_separation` to a higher one are dropped. The
+        peaks that are points of the echelle grid are selected and copied to
+        Table 1, as `find_peak_frequencies` does for a manual selection.
+        """
+        try:
+            snr = float(self.env.auto_peaks_snr_text.value)
+        except ValueError:
+            self.publish_message('Auto peaks: S/N must be a number')
+            return
+        if self.echelle_engine.empty:
+            self.publish_message('Auto peaks: no periodogram in the frequency range')
+            return
+        with self.env.metrics.stage('peaks'):
+            indices, ratio = self.echelle_engine.peaks(self.env.dnu_val, snr=snr,
+                                                       separation=self.env.auto_peaks_separation)
+        rows = self.frequency_index.grid_rows_of(self.env.tb_grid_source.data['bin'],
+                                                 self.echelle_engine.freq[indices])
+
+        self.env.tb_other_periodogram.selected.indices = list([])
+        self.env.tb_grid_source.selected.indices = rows.tolist()
+        self.clear_se_table1()
+        self.get_all_selection_button()
+        self.publish_message('Auto peaks: {} above S/N {:g}, {} on the grid'.format(
+            indices.size, snr, rows.size))
 
+    @timed
     def selection_prd_to_grid_fig(self, attrname, old, new):
         """
         Synchronizes selections from the main periodogram to the echelle diagram grid.
@@ -2062,30 +2725,26 @@ class Interactive(Environment):
             new: The new selection (list of selected indices in periodogram).
         """
         
-        se_indices = self.tb_other_periodogram.selected.indices
-
-        df_prd = self.env.tb_other_periodogram.to_df()
-        df_prd = df_prd.loc[se_indices]
-
-        selected_freq = list(np.round(df_prd.frequency.values, self.env.freq_round))
+        # Periodogram rows are bin ids of the frequency index
+        selected_bins = self.env.tb_other_periodogram.selected.indices
 
         se_indices = self.env.tb_grid_source.selected.indices
-        df_grid = self.env.tb_grid_source.to_df()
-
-        df_grid['freq_values'] = df_grid['freq_values'].round(self.env.freq_round)
+        grid_rows = self.frequency_index.grid_rows(self.env.tb_grid_source.data['bin'],
+                                                   selected_bins)
         
-        df_grid = df_grid.query('freq_values==@selected_freq')
-        
-        all_list = df_grid.index.to_list() + se_indices 
+        all_list = grid_rows.tolist() + se_indices 
 
         #print('all list', all_list)
         if set(all_list) != set(se_indices):
-            self.tb_grid_source.selected.indices = list(set(all_list))
+            self.env.tb_grid_source.selected.indices = list(set(all_list))
             self.update_plot(0, 0, 0)
         self.env.fig_other_periodogram.x_range.start = int(self.env.minimum_frequency)
         self.env.fig_other_periodogram.x_range.end = int(self.env.maximum_frequency)
+        self.periodogram_lod.set_window(int(self.env.minimum_frequency),
+                                        int(self.env.maximum_frequency))
 
 
+    @timed
     def selection_grid_to_table_fig(self, attrname, old, new):
         """
         Populates Table 1 with data from selected points on the echelle diagram grid.
@@ -2093,8 +2752,8 @@ class Interactive(Environment):
         When points are selected in `self.env.tb_grid_source`, this callback
         extracts their 'yy' (Slicefreq), 'freq_values' (Frequency),
         'power_values' (Power), 'Mode', and 'xx' attributes.
-        This data is then added to `self.tb_se_first_source` (Table 1),
-        avoiding duplicate entries based on frequency.
+        This data is streamed into `self.tb_se_first_source` (Table 1),
+        skipping frequencies that are already in the table.
 
         Args:
             attrname: The attribute that changed (e.g., 'indices').
@@ -2104,34 +2763,10 @@ class Interactive(Environment):
         
         se_indices = self.env.tb_grid_source.selected.indices
         # print('Grid2Table se_indices', se_indices)
-        df_grid = self.env.tb_grid_source.to_df()
-        df_grid = df_grid.loc[se_indices]
-        df_table = self.tb_se_first_source.to_df()
-        df_grid.rename(columns={'yy':'Slicefreq', 
-                       'freq_values':'Frequency',
-                       'power_values':'Power'},
-                       inplace=True,)
-        df_grid = df_grid[['Slicefreq', 'Frequency', 'Power', 'Mode','xx']]
-        all_data = pd.concat([df_table, df_grid],ignore_index=True)
-        # print(all_data)
-        all_data['Frequency'] = all_data['Frequency'].round(self.env.freq_round)
-        all_data = all_data.drop_duplicates(subset=['Frequency'])
-        #print(all_data.to_dict())
-        #old_data = ColumnDataSource.from_df(all_data)
-        df=all_data
-        old_data = ColumnDataSource(
-                    data=dict(Slicefreq = df['Slicefreq'].to_list(), 
-                            Frequency = df['Frequency'].to_list(), 
-                            Power = df['Power'].to_list(),
-                            Mode = df['Mode'].to_list(),
-                            xx = df['xx'].to_list()
-                            ))
-
-        self.tb_se_first_source.data = dict(old_data.data)
-
-
+        self.table_first.append(self.grid_rows_to_table(se_indices))
 
 
+    @timed
     def selection_grid_to_prd_fig(self, attrname, old, new):
         """
         Synchronizes selections from the echelle diagram grid to the main periodogram.
@@ -2160,19 +2795,14 @@ class Interactive(Environment):
         slice_freq = df_se.loc[se_indices]['yy']
         mod_val = df_se.loc[se_indices]['xx']
 
-        real_freq = slice_freq+(self.dnu_val*mod_val)
+        real_freq = slice_freq+(self.env.dnu_val*mod_val)
         real_freq = real_freq.round(self.env.freq_round)
         real_freq = mod_val
 
-        real_freq = df_se.freq_values.loc[se_indices]
-
-        real_freq = np.round(real_freq, self.env.freq_round)
-        real_freq = real_freq.tolist()
-
-        df_prd = self.env.tb_other_periodogram.to_df()
-        df_prd['frequency'] = df_prd['frequency'].round(self.env.freq_round)
-        df_prd = df_prd.query('frequency==@real_freq')
-        all_list = self.env.tb_other_periodogram.selected.indices + df_prd.index.to_list()
+        # The grid 'bin' column holds the periodogram row of every grid point
+        bins = np.asarray(self.env.tb_grid_source.data['bin'])[se_indices]
+        bins = bins[bins >= 0]
+        all_list = self.env.tb_other_periodogram.selected.indices + bins.tolist()
         
         
         if set(all_list) != set(self.env.tb_other_periodogram.selected.indices):
@@ -2180,6 +2810,7 @@ class Interactive(Environment):
 
         
 
+    @timed
     def selection_table_to_prd_fig(self, attrname, old, new):
         """
         Synchronizes selections from Table 1 to the main periodogram.
@@ -2195,20 +2826,16 @@ class Interactive(Environment):
         """
 
         df_table = self.tb_se_first_source.to_df()
-        selected_freq = df_table['Frequency'].round(self.env.freq_round)
-        selected_freq = selected_freq.to_list()
-
-        df_prd = self.env.tb_other_periodogram.to_df()
-        df_prd['frequency'] = df_prd['frequency'].round(self.env.freq_round)  
-        df_prd = df_prd.query('frequency==@selected_freq')
+        rows = self.frequency_index.periodogram_rows(df_table['Frequency'].values)
 
-        all_list = self.env.tb_other_periodogram.selected.indices + df_prd.index.to_list()
+        all_list = self.env.tb_other_periodogram.selected.indices + rows.tolist()
         
         
         if set(all_list) != set(self.env.tb_other_periodogram.selected.indices):
             self.env.tb_other_periodogram.selected.indices = list(set(all_list))
 
 
+    @timed
     def selection_table2_to_prd_fig(self, attrname, old, new):
         """
         Synchronizes selections from Table 2 to the main periodogram.
@@ -2225,14 +2852,9 @@ class Interactive(Environment):
         """
 
         df_table = self.tb_se_second_source.to_df()
-        selected_freq = df_table['Frequency'].round(self.env.freq_round)
-        selected_freq = selected_freq.to_list()
+        rows = self.frequency_index.periodogram_rows(df_table['Frequency'].values)
 
-        df_prd = self.env.tb_other_periodogram.to_df()
-        df_prd['frequency'] = df_prd['frequency'].round(self.env.freq_round)  
-        df_prd = df_prd.query('frequency==@selected_freq')
-
-        all_list = self.env.tb_other_periodogram.selected.indices + df_prd.index.to_list()
+        all_list = self.env.tb_other_periodogram.selected.indices + rows.tolist()
         
         
         if set(all_list) != set(self.env.tb_other_periodogram.selected.indices):
@@ -2240,6 +2862,7 @@ class Interactive(Environment):
 
 
 
+    @timed
     def get_all_selection_button(self):
         """
         Callback for the "Get Selection" button.
@@ -2289,15 +2912,16 @@ class Interactive(Environment):
         Clears selections on both the main periodogram and the echelle diagram grid.
 
         Sets `selected.indices` to an empty list for both
-        `self.tb_other_periodogram` and `self.env.tb_grid_source`.
+        `self.env.tb_other_periodogram` and `self.env.tb_grid_source`.
         Calls `update_plot()` to refresh the visuals.
         """
-        self.tb_other_periodogram.selected.indices = list([])
+        self.env.tb_other_periodogram.selected.indices = list([])
         self.env.tb_grid_source.selected.indices = list([])
         self.update_plot(0, 0, 0)
 
 
 
+    @timed
     def click_mode_apply_button(self):
         """
         Applies the selected mode label to frequencies currently in Table 1.
@@ -2309,34 +2933,17 @@ class Interactive(Environment):
         and the echelle grid data source (`self.env.tb_grid_source`) to reflect
         this mode assignment. Finally, it clears Table 1.
         """
-        df_first=self.tb_se_first_source.to_df()
-        df_first['Frequency']=df_first['Frequency'].round(
-            self.env.freq_round)
-        list_freq = df_first['Frequency'].to_list()
+        list_freq = self.tb_se_first_source.data['Frequency']
         
         print('Drop down value is', self.env.select_mode_menu.value,list_freq)
-        #ind = self.env.tb_grid_source.selected.indices 
-
-        df_grid = self.env.tb_grid_source.to_df()
-        df_grid['freq_values'] = df_grid['freq_values'].round(
-            self.env.freq_round)
-        ind = df_grid.query('freq_values == @list_freq').index
 
-        df_grid.loc[ind,'Mode'] = self.env.select_mode_menu.value
-        old_data = ColumnDataSource(df_grid.to_dict('list'))
-        self.env.tb_grid_source.data = dict(old_data.data)
+        bins = self.frequency_index.bins(list_freq)
+        ind = self.frequency_index.grid_rows(self.env.tb_grid_source.data['bin'], bins)
+        self._assign_mode(self.env.tb_grid_source, ind, self.env.select_mode_menu.value)
 
-        #ind = self.env.tb_other_periodogram.selected.indices
-
-        df_other = self.env.tb_other_periodogram.to_df()
-        df_other['frequency'] = df_other['frequency'].round(
-            self.env.freq_round)
-        ind = df_other.query('frequency == @list_freq').index
-
-        df_other.loc[ind,'Mode'] = self.env.select_mode_menu.value
-        print('df_other',df_other.loc[ind])
-        old_data = ColumnDataSource(df_other.to_dict('list'))
-        self.env.tb_other_periodogram.data = dict(old_data.data)
+        # Periodogram rows are bin ids
+        print('Periodogram rows', bins)
+        self._assign_mode(self.env.tb_other_periodogram, bins, self.env.select_mode_menu.value)
         self.selection_table_to_prd_fig(0,0,0)
         self.selection_prd_to_grid_fig(0,0,0)
         self.clear_se_table1()
@@ -2352,35 +2959,24 @@ class Interactive(Environment):
 
 
 
+    @timed
     def click_move_se_1_2_button(self):
         """
         Moves selected modes from Table 1 to Table 2.
 
         Filters rows in `self.tb_se_first_source` (Table 1) that match the
         mode currently selected in `self.env.select_mode_menu`.
-        These matching rows are removed from Table 1 and appended to
+        These matching rows are removed from Table 1 and streamed into
         `self.tb_se_second_source` (Table 2).
         """
 
         mode = self.env.select_mode_menu.value
-        df_table1 = self.tb_se_first_source.to_df()
-        df_table1_se = df_table1.query('Mode == @mode')
+        df_table1_se = self.table_first.remove(self.table_first.rows_with_mode(mode))
         print(df_table1_se)
-        #df_table1_left = df_table1[~df_table1.index.isin(df_table1_se.index)]
-        df_table1_left = df_table1.query('Mode != @mode')
-        print(df_table1_left.to_dict('list'))
-        old_data = ColumnDataSource(df_table1_left.to_dict('list'))
-        self.tb_se_first_source.data = dict(old_data.data)
         # Second table
-        df_table2 = self.tb_se_second_source.to_df()
-        #df_table1_se = df_table1.query('Mode == @mode')
-        all_data = pd.concat([df_table2, df_table1_se], ignore_index=True)
-
-        #all_data['mode_color']= self.assign_mode_color(all_data.Mode.values)
-        #df_table2
-        old_data = ColumnDataSource(all_data.to_dict('list'))
-        self.tb_se_second_source.data = dict(old_data.data)
+        self.table_second.append(df_table1_se, unique=False)
 
+    @timed
     def click_move_se_2_1_button(self):
         """
         Moves selected modes from Table 2 back to Table 1.
@@ -2389,7 +2985,7 @@ class Interactive(Environment):
         mode currently selected in `self.env.select_mode_menu`.
         These matching rows are removed from Table 2.
         It then finds the corresponding full data for these frequencies from the
-        echelle grid (`self.env.tb_grid_source`) and appends them to
+        echelle grid (`self.env.tb_grid_source`) and streams them into
         `self.tb_se_first_source` (Table 1), ensuring no duplicates in Table 1.
         """
         # self.selection_table2_to_prd_fig(0,0,0)
@@ -2397,40 +2993,12 @@ class Interactive(Environment):
         # self.selection_grid_to_table_fig(0,0,0)
 
         mode = self.env.select_mode_menu.value
-        df_table2 = self.tb_se_second_source.to_df()
-        df_table2_se = df_table2.query('Mode == @mode')
+        df_table2_se = self.table_second.remove(self.table_second.rows_with_mode(mode))
         print('mode_selected',df_table2_se)
-        #df_table1_left = df_table1[~df_table1.index.isin(df_table1_se.index)]
-        df_table2_left = df_table2.query('Mode != @mode')
-        # print(df_table2_left.to_dict('list'))
-
-        old_data = ColumnDataSource(df_table2_left.to_dict('list'))
-        self.tb_se_second_source.data = dict(old_data.data)
-        # Second table
-        df_table1 = self.tb_se_first_source.to_df()
-        #df_table1_se = df_table1.query('Mode == @mode')
-        
-        selected_freq = list(np.round(df_table2_se.Frequency.values, self.env.freq_round))
-        df_grid = self.env.tb_grid_source.to_df()
-        df_grid['freq_values'] = df_grid['freq_values'].round(self.env.freq_round)
-        df_grid = df_grid.query('freq_values==@selected_freq')
-        df_grid.rename(columns={'yy':'Slicefreq', 
-                        'freq_values':'Frequency',
-                        'power_values':'Power'},
-                        inplace=True,)
-        
-        df_final = df_grid[['Slicefreq', 'Frequency', 'Power', 'Mode','xx']]
-        df_final['mode_color'] = '' 
-        
-        all_data = pd.concat([df_table1, df_final], ignore_index=True)
-        all_data =all_data.drop('mode_color',axis=1)
-        print(all_data)
-        all_data = all_data.drop_duplicates(subset=['Frequency'],
-                                            ignore_index=True)
-        #df_table2
-        print(all_data.to_dict('list'))
-        old_data = ColumnDataSource(all_data.to_dict('list'))
-        self.tb_se_first_source.data = dict(old_data.data)
+        # First table
+        rows = self.frequency_index.grid_rows_of(self.env.tb_grid_source.data['bin'],
+                                                 df_table2_se.Frequency.values)
+        self.table_first.append(self.grid_rows_to_table(rows))
 
         #self.selection_table_to_prd_fig(0,0,0)
         #self.selection_prd_to_grid_fig(0,0,0)
@@ -2466,8 +3034,8 @@ class Interactive(Environment):
         Reloads and filters the periodogram data based on current frequency limits and selected grid type.
 
         - Determines the source of frequency/power data based on `self.env.select_grid_menu.value`:
-            - 'Obs': Reads from FITS file using `read_fits_get_fp()`.
-            - 'Syn': Calculates synthetic spectrum using `calculate_synthetic_psd()` and uses synthetic power.
+            - 'Obs': Reads from FITS file through `periodogram_store`.
+            - 'Syn': Calculates synthetic spectrum (as `calculate_synthetic_psd()`) and uses synthetic power.
             - 'Sub': Calculates synthetic spectrum and uses subtracted power (observed - synthetic).
         - Converts frequencies to the current `self.env.frequency_unit` and power to `self.env.power_unit`.
         - Filters the data to the range specified by `self.env.minimum_frequency` and
@@ -2475,64 +3043,254 @@ class Interactive(Environment):
         - If data remains after filtering, creates a new `lk_prd_module.Periodogram` object,
           stores it in `self.periodogram`, and updates `self.env.tb_other_periodogram.data`.
         - If no data remains, `self.env.tb_other_periodogram.data` is cleared.
+        - Loads the trimmed data into `self.echelle_engine` and `self.frequency_index`.
+
+        The work is split into `_trim_request` (reads the widgets),
+        `_compute_trim` (no Bokeh access, can run on a worker thread of
+        `self.tasks`) and `_apply_trim` (updates the sources); this method
+        runs the three steps in a row.
+        """
+        self._apply_trim(self._compute_trim(self._trim_request()))
+
+    def _trim_request(self, id=None):
+        """
+        Captures the inputs of `trim_frequency` from the environment and widgets.
+
+        Args:
+            id (int, optional): Catalog source whose periodogram is trimmed.
+                Defaults to None, the current source.
+
+        Returns:
+            dict: Grid type, FITS path, frequency limits, units, echelle
+                smoothing and, for the 'Syn' and 'Sub' grids, the synthetic
+                spectrum request.
         """
         print ('Value of selection:', self.env.select_grid_menu.value)
-        if self.env.select_grid_menu.value == 'Obs':
-            ff, pp = self.read_fits_get_fp()
-            ff = (ff*u.Hz).to(self.env.frequency_unit).value
-            pp = pp*self.env.power_unit
-            pp = pp.value
-        if self.env.select_grid_menu.value == 'Syn':
-            data = self.calculate_synthetic_psd()
-            ff = data.freq.values
-            pp = data.synthetic_psd.values
-        if self.env.select_grid_menu.value == 'Sub':
-            data = self.calculate_synthetic_psd()
-            data['sub_psd'] = data['psd'] - data ['synthetic_psd']
-            ff = data.freq.values
-            pp = data.sub_psd.values
+        request = dict(grid=self.env.select_grid_menu.value,
+                       path_fits=self.source_path(id),
+                       minimum_frequency=self.env.minimum_frequency,
+                       maximum_frequency=self.env.maximum_frequency,
+                       frequency_unit=self.env.frequency_unit,
+                       power_unit=self.env.power_unit,
+                       smoothing=(self.env.echelle_smooth_kind,
+                                  float(self.env.echelle_smooth_width)),
+                       synthetic=None)
+        if request['grid'] in ('Syn', 'Sub'):
+            request['synthetic'] = self._synthetic_request()
+        return request
 
-        min_freq = int(self.env.minimum_frequency)*self.env.frequency_unit
-        max_freq = int(self.env.maximum_frequency)*self.env.frequency_unit
+    def _compute_trim(self, request, task=None):
+        """
+        Reads and trims the periodogram described by `request`.
 
+        Does not touch Bokeh models, so that it can run on a worker thread.
 
-        
-        ind=(ff <= max_freq.value) & (ff >= min_freq.value)
+        Args:
+            request (dict): Result of `_trim_request`.
+            task (tasks.Task, optional): Task running the trim, used to report
+                progress and to stop early once stale. Defaults to None.
 
-        f = ff[ind]
-        p = pp[ind]
-        if f.any():
-            f = f*self.env.frequency_unit
-            p = p*self.env.power_unit
-            mm = ['999']*(len(p))
+        Returns:
+            dict: The request, the trimmed periodogram ('periodogram', None if
+                no bin is left), the synthetic spectrum ('synthetic', None
+                for the 'Obs' grid) and the smoothed echelle power
+                ('smoothed', keyed on the smoothing of the request, empty
+                without smoothing), so that large spectra are smoothed here
+                rather than on the document thread.
+        """
+        data = None
+        if request['grid'] == 'Obs':
+            if task is not None:
+                task.progress('Reading Fits')
+            filename = Path(request['path_fits'])
+            print('Running read fits',filename)
+            if filename.is_file():
+                with self.env.metrics.stage('read'):
+                    ff, pp = periodogram_store.get(filename)
+            else:
+                print('File does not exist')
+                ff, pp = np.array([]), np.array([])
+            ff = (ff*u.Hz).to(request['frequency_unit']).value
+            pp = pp*request['power_unit']
+            pp = pp.value
+        else:
+            data = self._compute_synthetic(request['synthetic'], task)
+            ff = data.freq.values
+            if request['grid'] == 'Syn':
+                pp = data.synthetic_psd.values
+            else:
+                pp = data.sub_psd.values
+        if task is not None:
+            task.check()
+            task.progress('Trimming')
+
+        with self.env.metrics.stage('trim'):
+            min_freq = int(request['minimum_frequency'])*request['frequency_unit']
+            max_freq = int(request['maximum_frequency'])*request['frequency_unit']
+            ind=(ff <= max_freq.value) & (ff >= min_freq.value)
+
+            f = ff[ind]
+            p = pp[ind]
+            period = None
+            if f.any():
+                f = f*request['frequency_unit']
+                p = p*request['power_unit']
+                from lightkurve import periodogram as lk_prd_module
+                period = lk_prd_module.Periodogram(f, p)
+
+        smoothed = {}
+        kind, width = request.get('smoothing', ('boxcar', 0.0))
+        if period is not None and width > 0:
+            freq, power = self._echelle_range(period, request['minimum_frequency'],
+                                              request['maximum_frequency'])
+            if freq.size > 1:
+                if task is not None:
+                    task.check()
+                    task.progress('Smoothing')
+                with self.env.metrics.stage('smooth'):
+                    smoothed[(kind, width)] = echelle.smooth_power(power, width/(freq[1] - freq[0]),
+                                                                   kind)
+        return dict(request=request, periodogram=period, synthetic=data, smoothed=smoothed)
+
+    def _apply_trim(self, result):
+        """
+        Loads the result of `_compute_trim` into the periodogram source and indexes.
 
-            #self.env.minimum_frequency = f.min().value
-            #self.env.maximum_frequency = f.max().value
+        Args:
+            result (dict): Result of `_compute_trim`.
+        """
+        if result['synthetic'] is not None:
+            self._plot_synthetic(result['synthetic'])
 
-            #print(f,p)
-            period = lk_prd_module.Periodogram(f, p)
-            self.periodogram = period
+        if result['periodogram'] is not None:
+            self.periodogram = result['periodogram']
+            mm = functions.mode_column(len(self.periodogram.power))
 
             old_data= ColumnDataSource(
                 data=dict(
-                    frequency=list(self.periodogram.frequency.value),
-                    power=list(self.periodogram.power.value),
+                    frequency=functions.float_column(self.periodogram.frequency.value),
+                    power=functions.float_column(self.periodogram.power.value, power=True),
                     Mode = mm,
                     # cuttoff=list(np.array([0])),
                 ))  
-            self.env.tb_other_periodogram.data=dict(old_data.data)
+            with self.env.metrics.stage('push'):
+                self.env.tb_other_periodogram.data=dict(old_data.data)
         else:
+            self.periodogram = None
             old_data= ColumnDataSource(
                 data=dict(
-                    frequency=list([]),
-                    power=list([]),
-                    Mode = list([]),
+                    frequency=functions.float_column([]),
+                    power=functions.float_column([], power=True),
+                    Mode = functions.mode_column(0),
                     # cuttoff=list(np.array([0])),
                 ))
              
             self.env.tb_other_periodogram.data=dict(old_data.data)
-             
+        request = result['request']
+        same_range = (request['minimum_frequency'] == self.env.minimum_frequency
+                      and request['maximum_frequency'] == self.env.maximum_frequency)
+        self.index_periodogram(result.get('smoothed') if same_range else None)
+
+    def source_path(self, id=None):
+        """
+        Returns the FITS path of a catalog source.
+
+        Args:
+            id (int, optional): Row of the source in `self.env.tb_source`.
+                Defaults to None, the current source.
+
+        Returns:
+            str: The entry of the 'path_fits' column of the source.
+        """
+        if id is None:
+            id = int(self.env.tb_source.data['id'][0])
+        return str(self.env.tb_source.data['path_fits'][id])
+
+    def pkb_path(self, id=None):
+        """
+        Returns the default PKB file of a catalog source.
+
+        Args:
+            id (int, optional): Row of the source in `self.env.tb_source`.
+                Defaults to None, the current source.
 
+        Returns:
+            str: 'modes_parameter_selected.pkb' in the data folder of the source.
+        """
+        if id is None:
+            id = int(self.env.tb_source.data['id'][0])
+        data_folder = self.env.tb_source.data['data_folder'][id]
+        return data_folder+'/'+'modes_parameter_selected.pkb'
+
+    @staticmethod
+    def _file_key(*parts):
+        """
+        Returns a prefetch key of a file, or None if the file does not exist.
+
+        The key holds the modification time and size of the file, so that a
+        result prefetched before the file changed is not used.
+
+        Args:
+            *parts: The path of the file, followed by the other values the
+                result depends on.
+
+        Returns:
+            tuple or None: The key.
+        """
+        path = Path(parts[0])
+        if not path.is_file():
+            return None
+        stat = path.stat()
+        return (str(path.resolve()), stat.st_mtime_ns, stat.st_size) + tuple(parts[1:])
+
+    def _trim_key(self, request):
+        """
+        Returns the prefetch key of a trim request.
+
+        Only periodograms of the 'Obs' grid are prefetched: synthetic spectra
+        depend on the background and PKB files chosen for the current source.
+
+        Args:
+            request (dict): Result of `_trim_request`.
+
+        Returns:
+            tuple or None: The key, or None if the request cannot be prefetched.
+        """
+        if request['grid'] != 'Obs':
+            return None
+        return self._file_key(request['path_fits'], 'trim',
+                              float(request['minimum_frequency']),
+                              float(request['maximum_frequency']),
+                              str(request['frequency_unit']),
+                              str(request['power_unit']))
+
+    def prefetch_neighbours(self):
+        """
+        Prepares the catalog sources around the current one in the background.
+
+        For the `self.env.prefetch_sources` sources on each side of the current
+        one, nearest first, the periodogram is read and trimmed with the
+        current settings and the default PKB file is read, so that `next` and
+        `previous` draw them without waiting. Results are kept by
+        `self.prefetcher` within `self.env.prefetch_max_bytes`.
+        """
+        n_sources = len(self.env.tb_source.data['path_fits'])
+        current = int(self.env.tb_source.data['id'][0])
+        ids = []
+        for step in range(1, int(self.env.prefetch_sources) + 1):
+            ids += [id for id in (current + step, current - step) if 0 <= id < n_sources]
+
+        jobs = []
+        for id in ids:
+            request = self._trim_request(id)
+            key = self._trim_key(request)
+            if key is not None:
+                jobs.append((key, lambda request=request: self._compute_trim(request)))
+            file_name = self.pkb_path(id)
+            key = self._file_key(file_name, 'pkb')
+            if key is not None:
+                jobs.append((key, lambda file_name=file_name: self.read_pkb(file_name)))
+        self.prefetcher.schedule(jobs)
 
     def save_table_2(self):
         """
@@ -2566,7 +3324,8 @@ class Interactive(Environment):
         pkb_array=df_pkb.values
         file_name=data_folder+'/'+'modes_parameter_selected.pkb'
 
-        apol.peakbagging.save_pkb(file_name,pkb_array)
+        from apollinaire.peakbagging import save_pkb
+        save_pkb(file_name,pkb_array)
         print('PKB file saved to ',file_name)
         fulltext='Saving '+ file_name + ' :Ready'
         self.publish_message(text=fulltext)
@@ -2580,7 +3339,9 @@ class Interactive(Environment):
         The loaded mode frequencies ('nu' column) are matched to the closest
         frequencies in the current echelle grid (`self.env.tb_grid_source`)
         to associate them with echelle diagram coordinates ('Slicefreq', 'xx', 'yy').
-        It filters out modes where the frequency difference is too large ( > 1 unit).
+        The matching is a single vectorized binary search (`match_nearest`).
+        It filters out modes whose frequency difference is not below the
+        tolerance set in `self.env.pkb_match_tolerance_text`.
 
         Args:
             file_name (str or Path): The path to the PKB file.
@@ -2590,6 +3351,23 @@ class Interactive(Environment):
                               containing 'Slicefreq', 'Frequency', 'Power', 'Mode', 'xx'.
         """
 
+        return self.match_pkb_to_grid(self.read_pkb(file_name),
+                                      self.env.tb_grid_source.to_df(),
+                                      float(self.env.pkb_match_tolerance_text.value))
+
+    def read_pkb(self, file_name):
+        """
+        Reads a PKB file into a DataFrame.
+
+        Does not touch Bokeh models, so that it can run on a worker thread.
+
+        Args:
+            file_name (str or Path): The path to the PKB file.
+
+        Returns:
+            pandas.DataFrame: One row per mode, with the columns of
+                `self.env.pkb_columns` or `self.env.pkb_columns_extended`.
+        """
         pkb_array = np.loadtxt (file_name, skiprows=0)
         #pkb_array = apol.peakbagging.fit_tools.read_pkb(file_name)
         if pkb_array.shape[1]==20:
@@ -2600,23 +3378,44 @@ class Interactive(Environment):
             pkb_array = pkb_array.reshape(-1, len(self.env.pkb_columns))
             df_pkb = pd.DataFrame(pkb_array,columns=self.env.pkb_columns)
         df_pkb['nu'] = df_pkb['nu'].astype(float).round(4)
+        return df_pkb
 
-        df_grid = self.env.tb_grid_source.to_df()
-        df_grid['freq_values'] = df_grid['freq_values'].round(self.env.freq_round)
+    def match_pkb_to_grid(self, df_pkb, df_grid, tolerance):
+        """
+        Matches PKB modes to the nearest points of the echelle grid.
 
-        def find_nearest_value(x):
-            return df_grid['freq_values'].iloc[(df_grid['freq_values'] - x).abs().idxmin()]
-        
-        df_pkb['closest_frequency'] = df_pkb['nu'].apply(find_nearest_value)
-        df_pkb_merged = df_pkb.merge(df_grid,left_on='closest_frequency', right_on='freq_values', how='left')
-        df_pkb_merged['freq_diff']= abs(df_pkb_merged.nu - df_pkb_merged.closest_frequency)
+        Does not touch Bokeh models, so that it can run on a worker thread.
+
+        Args:
+            df_pkb (pandas.DataFrame): Result of `read_pkb`.
+            df_grid (pandas.DataFrame): Content of `self.env.tb_grid_source`.
+            tolerance (float): Largest accepted frequency difference.
+
+        Returns:
+            pandas.DataFrame: Matched modes with the columns 'Slicefreq',
+                'Frequency', 'Power', 'Mode' and 'xx'; empty if the grid is
+                empty.
+        """
+        if len(df_grid) == 0:
+            print('No grid point to match the PKB modes to, change frequency limit or threshold')
+            return pd.DataFrame({column: [] for column in ['Slicefreq', 'Frequency', 'Power', 'Mode', 'xx']})
+        rows, freq_diff = match_nearest(np.round(df_grid['freq_values'].values,
+                                                 self.env.freq_round),
+                                        df_pkb['nu'].values)
+        df_grid = df_grid.drop(columns='Mode')
+        df_pkb_merged = pd.concat([df_pkb.reset_index(drop=True),
+                                   df_grid.iloc[np.clip(rows, 0, None)].reset_index(drop=True)],
+                                  axis=1)
+        df_pkb_merged['closest_frequency'] = df_pkb_merged['freq_values']
+        df_pkb_merged['freq_diff'] = freq_diff
         df_pkb_merged['Mode']=df_pkb_merged['l'].astype(int)
         df_pkb_merged['Mode']=df_pkb_merged['Mode'].astype(str)
         print(df_pkb_merged)
-        if not df_pkb_merged.query('freq_diff>1').empty:
+        if (freq_diff >= tolerance).any():
 
-            print('Warning frequency with greater than difference 1 is present, change frequency limit')
-        df_pkb=df_pkb_merged.query('freq_diff<1')
+            print('Warning frequency with greater than difference', tolerance,
+                  'is present, change frequency limit or PKB tolerance')
+        df_pkb=df_pkb_merged[freq_diff < tolerance]
         df_pkb.rename(columns={'yy':'Slicefreq', 
                        'freq_values':'Frequency',
                        'power_values':'Power'},
@@ -2625,13 +3424,16 @@ class Interactive(Environment):
 
         return df_pkb
 
+    @timed
     def load_table_2(self):
         """
         Loads mode data from a default PKB file into Table 2.
 
         Constructs the path to a default PKB file ('modes_parameter_selected.pkb')
         located in the current source's data folder.
-        Calls `load_pkb_to_second_tab()` to process this file.
+        The file is read (or taken from `self.prefetcher`) and matched to the
+        echelle grid (as in `load_pkb_to_second_tab()`) by `self.tasks` in the
+        background, from a copy of the grid taken when the button is clicked.
         The returned DataFrame is used to update `self.tb_se_second_source.data`.
         Calls `apply_modes()` to update mode assignments on plots based on the loaded data.
         A message is published to the UI.
@@ -2641,24 +3443,29 @@ class Interactive(Environment):
         data_folder = self.env.tb_source.data['data_folder'][id]
         id_mycatalog = self.env.tb_source.data['id_mycatalog_all'][id]
         #file_name = data_folder+'/'+'modes_param.pkb'
-        file_name = data_folder+'/'+'modes_parameter_selected.pkb'
+        file_name = self.pkb_path(id)
         #modes_parameter_selected.pkb
+        df_grid = self.env.tb_grid_source.to_df()
+        tolerance = float(self.env.pkb_match_tolerance_text.value)
+        key = self._file_key(file_name, 'pkb')
+
+        def work(task):
+            task.progress('Reading ' + file_name)
+            df_pkb = self.prefetcher.get(key, wait=True)
+            if df_pkb is None:
+                df_pkb = self.read_pkb(file_name)
+            task.check()
+            task.progress('Matching modes to the grid')
+            return self.match_pkb_to_grid(df_pkb, df_grid, tolerance)
+
+        def done(df):
+            self.table_second.replace(df[list(SelectionTable.columns)])
+            self.apply_modes(df)
+            print('Loaded', file_name)
+            fulltext='Loaded '+ file_name + ' :Ready'
+            self.publish_message(text=fulltext)
 
-
-        df=self.load_pkb_to_second_tab(file_name)
-
-        old_data = ColumnDataSource(
-                    data=dict(Slicefreq = df['Slicefreq'].to_list(),
-                            Frequency = df['Frequency'].to_list(),
-                            Power = df['Power'].to_list(),
-                            Mode = df['Mode'].to_list(),
-                            xx = df['xx'].to_list()
-                            ))
-        self.tb_se_second_source.data = dict(old_data.data)
-        self.apply_modes(df)
-        print('Loaded', file_name)
-        fulltext='Loaded '+ file_name + ' :Ready'
-        self.publish_message(text=fulltext)
+        self.tasks.submit('pkb', work, done=done, label='Loading pkb')
 
 
 
@@ -2735,7 +3542,7 @@ class Interactive(Environment):
         #     ind = df_grid.query('freq_values == @list_freq').index
 
         #     df_grid.loc[ind,'Mode'] = str(mode)
-        #     old_data = ColumnDataSource(df_grid.to_dict('list'))
+        #     old_data = ColumnDataSource(functions.frame_columns(df_grid))
         #     self.env.tb_grid_source.data = dict(old_data.data)
 
         #     #ind = self.env.tb_other_periodogram.selected.indices
@@ -2748,6 +3555,18 @@ class Interactive(Environment):
         #     df_other.loc[ind,'Mode'] = str(mode)
         #     old_data = ColumnDataself.env.selected_filename_textSource(df_other.to_dict('list'))
         #     self.env.tb_other_periodogram.data = dict(old_data.data)
+    def shutdown(self):
+        """
+        Stops the background threads of the session and drops prefetched data.
+
+        Called from `main.py` when the browser session is destroyed: the
+        task runner, the prefetcher and the echelle engine each hold a thread
+        pool, and the prefetcher up to `prefetch_max_bytes` of periodograms.
+        """
+        self.tasks.shutdown()
+        self.prefetcher.shutdown()
+        self.echelle_engine.shutdown()
+
     def publish_message(self,text=''):
         """
         Displays a status message in the application's message banner.
@@ -2769,15 +3588,18 @@ class Interactive(Environment):
         
         self.env.message_banner.text=full_text
 
+    @timed
     def apply_modes(self,table):
         """
         Applies mode assignments from a given table to the periodogram and echelle grid.
 
-        Iterates through unique mode labels in the input `table`. For each mode,
-        it identifies the corresponding frequencies and updates the 'Mode' column
-        in both `self.env.tb_grid_source` (echelle grid) and
-        `self.env.tb_other_periodogram` (main periodogram).
-        This visually updates the coloring of points on these plots.
+        All rows of the input `table` are matched to periodogram bins and
+        echelle grid rows in a single vectorized lookup through
+        `self.frequency_index`. The 'Mode' column of both
+        `self.env.tb_grid_source` (echelle grid) and
+        `self.env.tb_other_periodogram` (main periodogram) is then patched on the
+        rows whose label changes, which updates the coloring of points on these
+        plots without resending the sources.
 
         Args:
             table (pandas.DataFrame): A DataFrame containing at least 'Frequency'
@@ -2785,97 +3607,94 @@ class Interactive(Environment):
                                       `self.tb_se_second_source.to_df()`.
         """
         self.publish_message(text='Applying Modes')
-        df_second=table
-        df_second['Mode']=df_second['Mode'].astype(str)
-        df_second['Frequency']=df_second['Frequency'].round(
-        self.env.freq_round)
-        for mode in df_second.Mode.unique():
-            print('Applying', mode,df_second.Mode.unique())
-            list_freq = df_second.query(
-                    'Mode==@mode')['Frequency'].to_list()
-            
-            df_grid = self.env.tb_grid_source.to_df()
-            df_grid['freq_values'] = df_grid['freq_values'].round(
-                self.env.freq_round)
-            ind = df_grid.query('freq_values == @list_freq').index
+        bins, labels = self._table_modes(table)
+        print('Applying', pd.unique(labels))
 
-            df_grid.loc[ind,'Mode'] = str(mode)
-            old_data = ColumnDataSource(df_grid.to_dict('list'))
-            self.env.tb_grid_source.data = dict(old_data.data)
+        # Periodogram rows are bin ids
+        self._patch_modes(self.env.tb_other_periodogram, bins, labels)
+
+        rows = self.frequency_index.grid_lookup(self.env.tb_grid_source.data['bin'], bins)
+        in_grid = rows >= 0
+        self._patch_modes(self.env.tb_grid_source, rows[in_grid], labels[in_grid])
+        self.publish_message(text='Ready')
 
-            #ind = self.env.tb_other_periodogram.selected.indices
 
-            df_other = self.env.tb_other_periodogram.to_df()
-            df_other['frequency'] = df_other['frequency'].round(
-                self.env.freq_round)
-            ind = df_other.query('frequency == @list_freq').index
+    def _table_modes(self, table):
+        """
+        Returns the periodogram bins and mode labels of the rows of a table.
 
-            df_other.loc[ind,'Mode'] = str(mode)
-            old_data = ColumnDataSource(df_other.to_dict('list'))
-            self.env.tb_other_periodogram.data = dict(old_data.data)
-        self.publish_message(text='Ready')
+        Args:
+            table (pandas.DataFrame): A DataFrame with 'Frequency' and 'Mode'
+                columns, such as the selection tables.
+
+        Returns:
+            tuple: A tuple containing:
+                - bins (numpy.ndarray): Bin ids of the rows whose frequency is
+                  a bin of the periodogram.
+                - labels (numpy.ndarray): Their mode labels, as strings.
+        """
+        labels = table['Mode'].astype(str).to_numpy(dtype=object)
+        bins = self.frequency_index.lookup(table['Frequency'].values)
+        found = bins >= 0
+        return bins[found], labels[found]
 
+    def _source_folder(self):
+        """Returns the data folder of the current source, where the file browser opens."""
+        id=self.env.tb_source.data['id'][0]
+        return self.env.tb_source.data['data_folder'][id]
 
     def load_from_file(self):
         """
         Loads mode data from a user-selected PKB file into Table 2.
 
-        Opens a Tkinter file dialog for the user to select a PKB file.
-        If a file is selected:
+        Opens the file browser in the data folder of the current source; the
+        chosen file is loaded by `open_pkb_file`.
+        """
+        self.publish_message(text='Select a PKB file')
+        self.env.file_browser.open(self.open_pkb_file, pattern='*.pkb *.txt', title='Load PKB File',
+                                   directory=self._source_folder())
+
+    def open_pkb_file(self, file_name):
+        """
+        Loads a PKB file chosen with `load_from_file` into Table 2.
+
         - Calls `load_pkb_to_second_tab()` to process the file.
-        - Updates `self.tb_se_second_source.data` with the loaded data.
+        - Replaces the rows of Table 2 with the loaded data.
         - Calls `apply_modes()` to reflect changes on plots.
         - Updates `self.env.selected_filename_pkb_text` with the chosen filename.
         - Publishes status messages.
+
+        Args:
+            file_name (str): Path of the PKB file.
         """
         self.publish_message(text='Loading from File')
+        df=self.load_pkb_to_second_tab(file_name)
 
-        root = Tk()
-        root.attributes('-topmost', True)
-        root.withdraw()
-        file_name = askopenfile()  # blocking
-        if file_name:
-
-            id=self.env.tb_source.data['id'][0]
-            data_folder = self.env.tb_source.data['data_folder'][id]
-            id_mycatalog = self.env.tb_source.data['id_mycatalog_all'][id]
-            self.publish_message(text='Loading from File')
-            df=self.load_pkb_to_second_tab(file_name)
-            
-            old_data = ColumnDataSource(
-                        data=dict(Slicefreq = df['Slicefreq'].to_list(),
-                                Frequency = df['Frequency'].to_list(),
-                                Power = df['Power'].to_list(),
-                                Mode = df['Mode'].to_list(),
-                                xx = df['xx'].to_list()
-                                ))
-            self.tb_se_second_source.data = dict(old_data.data)
-            self.apply_modes(df)
-            print('Loaded', file_name)
-            self.env.selected_filename_pkb_text.text = file_name.name
-            self.publish_message(text='File Loaded, Ready')
+        self.table_second.replace(df[list(SelectionTable.columns)])
+        self.apply_modes(df)
+        print('Loaded', file_name)
+        self.env.selected_filename_pkb_text.text = file_name
+        self.publish_message(text='File Loaded, Ready')
 
 
     def load_bkg_param_from_file(self):
         """
         Loads background parameters from a user-selected file.
 
-        Opens a Tkinter file dialog for the user to select a file.
-        If a file is selected, its path is stored in
+        Opens the file browser in the data folder of the current source. The
+        path of the chosen file is stored in
         `self.env.selected_filename_background_text`. This filename is then
         used by `calculate_synthetic_psd()`.
         Publishes status messages.
         """
-        self.publish_message(text='Loading BKG from File')
+        self.publish_message(text='Select a background parameter file')
 
-        root = Tk()
-        root.attributes('-topmost', True)
-        root.withdraw()
-        file_name = askopenfile()  # blocking
-        if file_name:
+        def chosen(file_name):
+            self.env.selected_filename_background_text.text = file_name
+            self.publish_message(text='Ready')
 
-            self.env.selected_filename_background_text.text = file_name.name
-        self.publish_message(text='Ready')
+        self.env.file_browser.open(chosen, title='Load Background Parameters',
+                                   directory=self._source_folder())
 
             # id=self.env.tb_source.data['id'][0]
             # data_folder = self.env.tb_source.data['data_folder'][id]
@@ -2901,43 +3720,46 @@ class Interactive(Environment):
         """
         Saves the contents of Table 2 to a user-specified PKB file.
 
-        Opens a Tkinter "save as" dialog for the user to choose a filename
-        (default extension .pkb).
-        If a filename is provided:
+        Opens the file browser in save mode, in the data folder of the
+        current source (default extension .pkb). The file is written by
+        `write_table_2`.
+        """
+        self.publish_message(text='Choose a PKB file to save to')
+        self.env.file_browser.open(self.write_table_2, mode='save', title='Save Table 2 as PKB',
+                                   directory=self._source_folder(), extension='.pkb')
+
+    def write_table_2(self, file_name):
+        """
+        Writes Table 2 to a PKB file chosen with `save_as_table_2`.
+
         - Data from `self.tb_se_second_source` is retrieved.
         - It's converted to PKB format (calculating 'n' values from delta Nu).
-        - The data is saved to the chosen file using `apollinaire.peakbagging.save_pkb`.
+        - The data is saved to the file using `apollinaire.peakbagging.save_pkb`.
         - A status message is published.
+
+        Args:
+            file_name (str): Path of the PKB file.
         """
         self.publish_message(text='Saving File')
-        print('Load from file')
-        root = Tk()
-        root.attributes('-topmost', True)
-        root.withdraw()
-        filename = asksaveasfilename(defaultextension=".pkb")
-        if filename:
-            print(filename)
-            df=self.tb_se_second_source.to_df()
-            id=self.env.tb_source.data['id'][0]
-            data_folder = self.env.tb_source.data['data_folder'][id]
-            file_name=filename
+        print(file_name)
+        df=self.tb_se_second_source.to_df()
 
-            
-            df_pkb=pd.DataFrame(columns=[self.env.pkb_columns])
-            df_pkb['nu']=df['Frequency'].to_list()
-            df_pkb['h']=df['Power'].to_list()
-            df_pkb['l']=df['Mode'].astype(float).to_list()
-            deltanu = self.env.dnu_val
-            df_pkb['n']=np.rint(df['Frequency']/deltanu).astype(int)
-            print('deltanu',deltanu)
-            print(df_pkb['n'])
-            df_pkb =df_pkb.fillna(0)
-            pkb_array=df_pkb.values
-
-            apol.peakbagging.save_pkb(file_name,pkb_array)
-            print('PKB file saved to ',file_name)
-            fulltext='PKB file saved to '+file_name+': Ready'
-            self.publish_message(text=fulltext)
+        df_pkb=pd.DataFrame(columns=[self.env.pkb_columns])
+        df_pkb['nu']=df['Frequency'].to_list()
+        df_pkb['h']=df['Power'].to_list()
+        df_pkb['l']=df['Mode'].astype(float).to_list()
+        deltanu = self.env.dnu_val
+        df_pkb['n']=np.rint(df['Frequency']/deltanu).astype(int)
+        print('deltanu',deltanu)
+        print(df_pkb['n'])
+        df_pkb =df_pkb.fillna(0)
+        pkb_array=df_pkb.values
+
+        from apollinaire.peakbagging import save_pkb
+        save_pkb(file_name,pkb_array)
+        print('PKB file saved to ',file_name)
+        fulltext='PKB file saved to '+file_name+': Ready'
+        self.publish_message(text=fulltext)
 
     def toggle_periodogram_axis_scale(self, attr, old, new):
         """
@@ -0,0 +1,150 @@
+"""
+Defines the PeriodogramStore class, an in-memory cache of periodograms read from FITS files.
+
+Reading a multi-million-bin periodogram from disk is by far the slowest step
+of a plot update, and the same file is read again every time the frequency
+limits or the grid type change. The store reads each FITS file once, keeps
+the frequency and power columns as native-endian NumPy arrays and serves
+later requests from memory. An entry is invalidated as soon as the
+modification time or the size of the file on disk changes. The store has
+a memory budget: once the cached arrays exceed `max_bytes`, the least
+recently used periodograms are dropped.
+
+A single module-level store (`periodogram_store`) is shared by every part of
+the application that needs the raw periodogram.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PeriodogramStore(object):
+    """
+    Caches the frequency and power columns of FITS periodograms.
+
+    Each entry is keyed on the absolute path of the FITS file and tagged with
+    the file's modification time and size, so that an edited or replaced file
+    is transparently read again. The cached arrays are marked read-only
+    because they are handed out to every caller without copying.
+    """
+
+    def __init__(self, max_bytes=None):
+        """
+        Initializes an empty store.
+
+        Args:
+            max_bytes (int, optional): Memory budget of the cached arrays, in
+                bytes. The most recently used periodogram is always kept, even
+                if it alone exceeds the budget. Defaults to None (no limit).
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        """int: Memory used by the cached arrays, in bytes."""
+        with self._lock:
+            return sum(ff.nbytes + pp.nbytes for _, ff, pp in self._entries.values())
+
+    @staticmethod
+    def _signature(path):
+        """
+        Returns the (mtime, size) signature used to validate a cached entry.
+
+        Args:
+            path (str): Absolute path of the file.
+
+        Returns:
+            tuple: `(st_mtime_ns, st_size)` of the file.
+        """
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _read(path):
+        """
+        Reads the frequency and power columns of a FITS periodogram.
+
+        The primary HDU is opened memory-mapped and each column is copied
+        exactly once into a contiguous, native-endian float64 array.
+
+        Args:
+            path (str): Path to the FITS file. The primary HDU data is expected
+                to hold frequency in its first column and power in its second.
+
+        Returns:
+            tuple: A tuple containing:
+                - ff (numpy.ndarray): Frequency values as stored in the file.
+                - pp (numpy.ndarray): Power values as stored in the file.
+        """
+        from astropy.io import fits
+        with fits.open(path, memmap=True) as data:
+            table = data[0].data
+            ff = np.ascontiguousarray(table[:, 0], dtype=np.float64)
+            pp = np.ascontiguousarray(table[:, 1], dtype=np.float64)
+        ff.setflags(write=False)
+        pp.setflags(write=False)
+        return ff, pp
+
+    def get(self, filename):
+        """
+        Returns the frequency and power arrays of a FITS periodogram.
+
+        The file is only read when it is not cached yet or when its
+        modification time or size differ from the cached entry.
+
+        Args:
+            filename (str or Path): Path to the FITS file.
+
+        Returns:
+            tuple: A tuple containing:
+                - ff (numpy.ndarray): Read-only array of frequency values.
+                - pp (numpy.ndarray): Read-only array of power values.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        path = os.path.abspath(str(filename))
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                return entry[1], entry[2]
+
+        ff, pp = self._read(path)
+        with self._lock:
+            self._entries[path] = (signature, ff, pp)
+            self._entries.move_to_end(path)
+            self._evict()
+        return ff, pp
+
+    def _evict(self):
+        """Drops least recently used entries until the budget is met. Called with the lock held."""
+        if self.max_bytes is None:
+            return
+        used = sum(ff.nbytes + pp.nbytes for _, ff, pp in self._entries.values())
+        while used > self.max_bytes and len(self._entries) > 1:
+            _, (_, ff, pp) = self._entries.popitem(last=False)
+            used -= ff.nbytes + pp.nbytes
+
+    def invalidate(self, filename=None):
+        """
+        Drops one cached entry, or every entry if no filename is given.
+
+        Args:
+            filename (str or Path, optional): Path of the FITS file to drop.
+                Defaults to None, which clears the whole store.
+        """
+        with self._lock:
+            if filename is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(str(filename)), None)
+
+
+# 1 GiB holds sixteen periodograms of four million bins
+periodogram_store = PeriodogramStore(max_bytes=2**30)
@@ -0,0 +1,175 @@
+"""
+Defines the Prefetcher class, which prepares neighbouring catalog sources in the background.
+
+Moving to the next source of a catalog used to read its FITS file, trim the
+periodogram and read its PKB file while the analyst waited. While source `i`
+is on screen, `Interactive.prefetch_neighbours` hands the `Prefetcher` the
+jobs doing that work for sources `i+1`, `i-1`, ..., `i+k`, `i-k`. They run
+one at a time on a background thread and their results are kept, keyed on
+everything they depend on, until the source is opened.
+
+Results are held within a memory budget (`max_bytes`); the least recently
+stored or used results are dropped first. Jobs that are no longer wanted,
+because the analyst moved elsewhere in the catalog, are cancelled before
+they start.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def result_nbytes(result):
+    """
+    Estimates the memory held by a prefetched result.
+
+    Args:
+        result: NumPy arrays, astropy quantities, pandas objects, objects with
+            `frequency` and `power` attributes (periodograms), or dicts,
+            lists and tuples of those.
+
+    Returns:
+        int: Size in bytes. Objects of other types count as zero.
+    """
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return int(np.sum(result.memory_usage(deep=True)))
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, dict):
+        return sum(result_nbytes(value) for value in result.values())
+    if isinstance(result, (list, tuple)):
+        return sum(result_nbytes(value) for value in result)
+    if hasattr(result, 'frequency') and hasattr(result, 'power'):
+        return result_nbytes(np.asarray(result.frequency)) + result_nbytes(np.asarray(result.power))
+    return 0
+
+
+class Prefetcher(object):
+    """
+    Runs keyed background jobs and keeps their results within a memory budget.
+    """
+
+    def __init__(self, max_bytes=256*2**20, sizeof=result_nbytes):
+        """
+        Initializes an empty prefetcher.
+
+        Args:
+            max_bytes (int, optional): Memory budget of the kept results, in
+                bytes. Defaults to 256 MiB.
+            sizeof (callable, optional): Returns the size of a result in bytes.
+                Defaults to `result_nbytes`.
+        """
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='iechelle-prefetch')
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._futures = {}
+        self._closed = False
+
+    @property
+    def nbytes(self):
+        """int: Memory held by the kept results, in bytes."""
+        with self._lock:
+            return sum(size for _, size in self._results.values())
+
+    def schedule(self, jobs):
+        """
+        Queues jobs, most wanted first, and cancels queued jobs no longer wanted.
+
+        Jobs whose result is already kept, or that are already queued or
+        running, are not queued again.
+
+        Args:
+            jobs (list): `(key, work)` pairs, where `key` is hashable and
+                `work()` returns the result. `work` runs on the background
+                thread and must not modify Bokeh models.
+        """
+        wanted = set(key for key, _ in jobs)
+        with self._lock:
+            if self._closed:
+                return
+            for key, future in list(self._futures.items()):
+                if key not in wanted and future.cancel():
+                    del self._futures[key]
+            jobs = [(key, work) for key, work in jobs
+                    if key not in self._results and key not in self._futures]
+            for key, work in jobs:
+                self._futures[key] = self._executor.submit(self._run, key, work)
+
+    def _run(self, key, work):
+        """Runs a job on the background thread and keeps its result."""
+        try:
+            result = work()
+        except Exception as error:
+            print('Prefetch of', key, 'failed:', error)
+            result = None
+        with self._lock:
+            self._futures.pop(key, None)
+            if result is None or self._closed:
+                return result
+            size = self.sizeof(result)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return result
+            self._results[key] = (result, size)
+            self._results.move_to_end(key)
+            self._evict()
+        return result
+
+    def _evict(self):
+        """Drops the oldest results until the budget is met. Called with the lock held."""
+        if self.max_bytes is None:
+            return
+        used = sum(size for _, size in self._results.values())
+        while used > self.max_bytes and self._results:
+            _, (_, size) = self._results.popitem(last=False)
+            used -= size
+
+    def get(self, key, wait=False):
+        """
+        Returns the result of a job.
+
+        Args:
+            key: Key of the job.
+            wait (bool, optional): If the job is queued or running, wait for
+                it instead of returning None. Defaults to False.
+
+        Returns:
+            The result, or None if the job was not scheduled, failed, or has
+            not finished and `wait` is False.
+        """
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                self._results.move_to_end(key)
+                return entry[0]
+            future = self._futures.get(key)
+        if wait and future is not None:
+            try:
+                return future.result()
+            except Exception:
+                return None
+        return None
+
+    def shutdown(self):
+        """
+        Drops every kept result and stops the background thread.
+
+        Called when the session ends, so that up to `max_bytes` of results
+        are not held until the session is garbage collected. The result of
+        a running job is not kept.
+        """
+        with self._lock:
+            self._closed = True
+        self.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def clear(self):
+        """Cancels the queued jobs and drops every kept result."""
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+            self._results.clear()
@@ -0,0 +1,173 @@
+"""
+Defines the SelectionTable class, which edits the mode selection tables incrementally.
+
+Table 1 and Table 2 of the mode selection tab are small `ColumnDataSource`s
+that change a few rows at a time. Rebuilding them from a concatenated
+DataFrame resends the whole table to the browser for every click.
+`SelectionTable` instead appends rows with `ColumnDataSource.stream`, so
+that only the new rows cross the websocket. Rows are keyed on their
+frequency rounded to `decimals` places, which is how duplicates were always
+detected in these tables.
+
+Bokeh has no message to delete rows, so removing rows still replaces the
+data of the table.
+"""
+import numpy as np
+import pandas as pd
+
+
+class SelectionTable(object):
+    """
+    Append/remove engine around a mode selection table source.
+
+    The keyed row index maps the rounded frequency of every row to its row
+    number. It is derived from the source on every operation, so that edits
+    made in the browser (the tables are editable) are always taken into
+    account; the tables hold at most a few hundred rows.
+    """
+
+    columns = ('Slicefreq', 'Frequency', 'Power', 'Mode', 'xx')
+
+    def __init__(self, source, decimals=10):
+        """
+        Wraps a selection table source.
+
+        Args:
+            source (ColumnDataSource): `tb_se_first_source` or
+                `tb_se_second_source`.
+            decimals (int, optional): Number of decimal places of the
+                frequency key. Defaults to 10.
+        """
+        self.source = source
+        self.decimals = decimals
+
+    def __len__(self):
+        return len(self.source.data['Frequency'])
+
+    def frame(self):
+        """Returns the table as a pandas DataFrame."""
+        return self.source.to_df()
+
+    def keys(self, frequencies):
+        """
+        Returns the row keys of frequencies.
+
+        Args:
+            frequencies (array-like): Frequency values.
+
+        Returns:
+            numpy.ndarray: Frequencies rounded to `decimals` places.
+        """
+        return np.round(np.asarray(frequencies, dtype=np.float64), self.decimals)
+
+    def index(self):
+        """
+        Returns the keyed row index of the table.
+
+        Returns:
+            dict: Frequency key to row number. When a frequency appears more
+                than once, the first row is kept.
+        """
+        index = {}
+        for row, key in enumerate(self.keys(self.source.data['Frequency']).tolist()):
+            index.setdefault(key, row)
+        return index
+
+    def _columns(self, rows):
+        """
+        Converts new rows into the column layout of the source.
+
+        Columns the source holds but `rows` lacks (e.g. 'mode_color') are
+        filled with empty strings, and columns unknown to the source are
+        dropped, as `ColumnDataSource.stream` requires the same columns.
+
+        Args:
+            rows (pandas.DataFrame or dict): New rows.
+
+        Returns:
+            dict: Column name to list of values.
+        """
+        rows = pd.DataFrame(rows)
+        size = len(rows)
+        data = {}
+        for name in self.source.data:
+            if name in rows:
+                data[name] = rows[name].tolist()
+            else:
+                data[name] = [''] * size
+        return data
+
+    def append(self, rows, unique=True):
+        """
+        Appends rows at the end of the table.
+
+        Args:
+            rows (pandas.DataFrame or dict): Rows with at least the columns in
+                `SelectionTable.columns`.
+            unique (bool, optional): If True, rows whose frequency is already in
+                the table, or repeated within `rows`, are skipped. Defaults to True.
+
+        Returns:
+            int: Number of rows appended.
+        """
+        rows = pd.DataFrame(rows)
+        if unique and len(rows):
+            keys = self.keys(rows['Frequency'])
+            index = self.index()
+            new = np.array([key not in index for key in keys.tolist()], dtype=bool)
+            _, first = np.unique(keys, return_index=True)
+            once = np.zeros(len(rows), dtype=bool)
+            once[first] = True
+            rows = rows[new & once]
+        if len(rows) == 0:
+            return 0
+        self.source.stream(self._columns(rows))
+        return len(rows)
+
+    def remove(self, rows):
+        """
+        Removes rows from the table.
+
+        Args:
+            rows (array-like): Row numbers to remove.
+
+        Returns:
+            pandas.DataFrame: The removed rows.
+        """
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        df = self.frame()
+        removed = df.iloc[rows]
+        if len(rows):
+            keep = np.ones(len(df), dtype=bool)
+            keep[rows] = False
+            self.source.data = {name: list(np.asarray(values, dtype=object)[keep])
+                                for name, values in self.source.data.items()}
+        return removed
+
+    def rows_with_mode(self, mode):
+        """
+        Returns the row numbers labelled with a mode.
+
+        Args:
+            mode (str): Mode label.
+
+        Returns:
+            numpy.ndarray: Row numbers.
+        """
+        modes = np.asarray(self.source.data['Mode'], dtype=object).astype(str)
+        return np.flatnonzero(modes == str(mode))
+
+    def replace(self, rows):
+        """
+        Replaces the whole content of the table.
+
+        Args:
+            rows (pandas.DataFrame or dict): New content. Its columns become
+                the columns of the table.
+        """
+        rows = pd.DataFrame(rows)
+        self.source.data = {name: rows[name].tolist() for name in rows.columns}
+
+    def clear(self):
+        """Removes every row of the table, leaving the columns in `SelectionTable.columns`."""
+        self.source.data = {name: [] for name in self.columns}
@@ -0,0 +1,254 @@
+"""
+Defines the TaskRunner class, which runs heavy callbacks off the Bokeh server thread.
+
+Bokeh callbacks run on the thread of the server's event loop: while one of
+them reads a FITS file or computes a synthetic spectrum, the document cannot
+send anything to the browser, so messages written to `message_banner` only
+appear once the work is over. `TaskRunner` splits such a callback in two:
+
+- `work(task)` runs on a thread pool. It must not touch Bokeh models; it
+  receives plain values captured beforehand and returns a result. It may
+  report progress with `task.progress(...)` and give up early with
+  `task.check()` when a newer request made it stale.
+- `done(result)` runs back on the document thread through
+  `Document.add_next_tick_callback` and applies the result to the models.
+
+Tasks are keyed: submitting a task cancels the pending or running task of
+the same key, and the result of a cancelled task is never applied, so only
+the latest request (e.g. the last selected star) reaches the plots.
+
+A thread pool is used rather than a process pool: the heavy steps are FITS
+I/O and NumPy/Apollinaire calls that release the GIL, and their inputs and
+results (periodograms, DataFrames) would otherwise be pickled both ways.
+
+Without a served document (e.g. when the GUI modules are driven from a
+script or a notebook) tasks run synchronously inside `submit`.
+"""
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TaskCancelled(Exception):
+    """Raised by `Task.check` when a newer task with the same key was submitted."""
+
+
+class Task(object):
+    """
+    Handle passed to the work function of a task.
+    """
+
+    def __init__(self, runner, key, generation, label):
+        self.runner = runner
+        self.key = key
+        self.generation = generation
+        self.label = label
+
+    @property
+    def cancelled(self):
+        """bool: True once a newer task with the same key was submitted."""
+        return self.runner.generation(self.key) != self.generation
+
+    def check(self):
+        """
+        Stops the work function if the task is stale.
+
+        Raises:
+            TaskCancelled: If a newer task with the same key was submitted.
+        """
+        if self.cancelled:
+            raise TaskCancelled(self.key)
+
+    def progress(self, text, fraction=None):
+        """
+        Reports progress of the task to the message banner.
+
+        Can be called from the worker thread; the message is applied on the
+        document thread. Progress of stale tasks is dropped.
+
+        Args:
+            text (str): Progress message.
+            fraction (float, optional): Completed fraction between 0 and 1,
+                shown as a percentage. Defaults to None.
+        """
+        if self.cancelled:
+            return
+        if fraction is not None:
+            text = '{} ({:.0f}%)'.format(text, 100*fraction)
+        if self.label:
+            text = '{}: {}'.format(self.label, text)
+        self.runner.report(text, task=self)
+
+
+class TaskRunner(object):
+    """
+    Executor-backed runner of keyed, cancellable background tasks.
+    """
+
+    def __init__(self, doc=None, report=None, max_workers=2, metrics=None):
+        """
+        Initializes the runner.
+
+        Args:
+            doc (bokeh.document.Document, optional): Document whose models the
+                results update, normally `curdoc()`. Defaults to None, which
+                runs every task synchronously.
+            report (callable, optional): Called on the document thread with a
+                progress or error message, e.g. `Interactive.publish_message`.
+                Defaults to None, which prints the message.
+            max_workers (int, optional): Number of worker threads. Defaults to 2.
+            metrics (metrics.Metrics, optional): Records the time from the
+                submission of every task until its result is applied, as a
+                'task' metric named after the key. Defaults to None.
+        """
+        self.doc = doc
+        self._report = report
+        self.metrics = metrics
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='iechelle-task')
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._futures = {}
+
+    @property
+    def asynchronous(self):
+        """bool: True when the document is served, so that work can run off-thread."""
+        return self.doc is not None and self.doc.session_context is not None
+
+    def generation(self, key):
+        """Returns the number of tasks submitted so far with `key`."""
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def busy(self, key=None):
+        """
+        Tells whether tasks are pending or running.
+
+        Args:
+            key (str, optional): Only consider the task with this key.
+                Defaults to None, which considers every task.
+
+        Returns:
+            bool: True if a matching task has not finished.
+        """
+        with self._lock:
+            futures = list(self._futures.values()) if key is None else [self._futures.get(key)]
+        return any(future is not None and not future.done() for future in futures)
+
+    def submit(self, key, work, done=None, label='', error=None):
+        """
+        Runs `work` in the background and applies its result with `done`.
+
+        Args:
+            key (str): Task key. A pending or running task with the same key is
+                cancelled.
+            work (callable): `work(task)`, run on a worker thread. Must not
+                modify Bokeh models.
+            done (callable, optional): `done(result)`, run on the document
+                thread unless the task was cancelled. Defaults to None.
+            label (str, optional): Prefix of the progress messages. Defaults to ''.
+            error (callable, optional): `error(exception)`, run on the document
+                thread if `work` raised. Defaults to None, which reports the
+                exception through `report`.
+
+        Returns:
+            Task: The handle of the submitted task.
+        """
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            previous = self._futures.pop(key, None)
+        if previous is not None:
+            # Only cancels a task that has not started; a running one becomes stale
+            previous.cancel()
+        task = Task(self, key, generation, label)
+        if self.metrics is not None:
+            done = self._timed(key, done)
+
+        if not self.asynchronous:
+            result = work(task)
+            if done is not None:
+                done(result)
+            return task
+
+        future = self._executor.submit(self._run, task, work, done, error)
+        with self._lock:
+            if self._generations.get(key) == generation:
+                self._futures[key] = future
+        return task
+
+    def shutdown(self):
+        """
+        Stops the worker threads, e.g. when the session is destroyed.
+
+        Pending tasks are cancelled and every task becomes stale, so the
+        results of running tasks are discarded.
+        """
+        with self._lock:
+            for key in self._generations:
+                self._generations[key] += 1
+            self._futures.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _timed(self, key, done):
+        """Wraps `done` so that it records the latency of the task."""
+        submitted = time.perf_counter()
+
+        def finish(result):
+            if done is not None:
+                done(result)
+            self.metrics.record('task', key, time.perf_counter() - submitted)
+        return finish
+
+    def _run(self, task, work, done, error):
+        """Runs a task on a worker thread and schedules its completion."""
+        try:
+            result = work(task)
+        except TaskCancelled:
+            return
+        except Exception as exception:
+            traceback.print_exc()
+            if not task.cancelled:
+                self._schedule(task, lambda failure=exception: self._failed(task, failure, error))
+            return
+        if done is not None and not task.cancelled:
+            self._schedule(task, lambda: done(result))
+
+    def _failed(self, task, exception, error):
+        """Reports the exception of a task on the document thread."""
+        if error is not None:
+            error(exception)
+        else:
+            self._publish('{} failed: {}'.format(task.label or task.key, exception))
+
+    def _schedule(self, task, callback):
+        """Runs `callback` on the document thread unless `task` became stale."""
+        def tick():
+            if not task.cancelled:
+                callback()
+        self.doc.add_next_tick_callback(tick)
+
+    def _publish(self, text):
+        """Shows a message through `report`, or prints it."""
+        if self._report is None:
+            print(text)
+        else:
+            self._report(text)
+
+    def report(self, text, task=None):
+        """
+        Shows a progress message from a worker thread.
+
+        Args:
+            text (str): Message.
+            task (Task, optional): Task the message belongs to; the message is
+                dropped if the task is stale when it would be shown.
+                Defaults to None.
+        """
+        if not self.asynchronous:
+            self._publish(text)
+        elif task is None:
+            self.doc.add_next_tick_callback(lambda: self._publish(text))
+        else:
+            self._schedule(task, lambda: self._publish(text))